@@ -1,43 +1,48 @@
-from typing import Tuple
-from time import sleep
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
 import os
 import sys
+import traceback
 import datetime
 import re
 import json
-import psycopg2
-from psycopg2.extensions import connection, cursor
-from psycopg2.extras import execute_batch
 import pymongo
 import requests
 from pymongo.collection import Collection
 from glob import glob
-import certifi
 import gridfs
 import threading
 from src.main import get_all_prices_with_promos, main_latest_promos, CHAINS_DICT
-import psutil
+from src.db_clients import get_mongo_client, pg_connection
+from src.download_scheduler import DownloadScheduler, create_store_jobs
+from src.mongo_writer import BulkUpsertWriter
+from src.json_merge import StoreExport, merge_store_exports
+from src.pg_ingest import copy_store_prices
+from src.ndjson_io import is_ndjson_file, iter_ndjson, write_ndjson
+from src.price_fingerprint import (
+    commit_pending_fingerprint,
+    diff_store_items,
+    get_pending_fingerprint_path,
+    get_pg_fingerprint_path,
+    iter_diff_records,
+)
+from src.price_history import write_store_prices
+from src.promotion import get_promo_file_types
+from src.utils import get_price_file_types
 from src.send_me_mail import create_mail_to_send, send_me_logs, zip_res_and_all
-LIST_OF_DICTS = []
-LIST_OF_BARCODES = []
 GLOBAL_DICT = {}
 BEGINING_COUNT_DOCUMENTS = 0
 END_COUNT_DOCUMENTS = 0
 ENDING_TIME = ""
-RUNNER = []
+MINING_WORKERS = int(os.environ.get("MINING_WORKERS", os.cpu_count() or 1))
+MONGO_BATCH_SIZE = int(os.environ.get("MONGO_BATCH_SIZE", 1000))
 ITEMS_BEEN_UPDATED = 0
 UPDATED_CHAINS = {}
 CHAIN_INDEX = {"OsherAd": 1, "HaziHinam": 2, "RamiLevi": 4,
                "Shufersal": 5, "Victory": 6, "YeinotBitan": 7, "Yohananof": 8}
 
 
-def connect_to_pg() -> Tuple[connection, cursor]:
-    conn = psycopg2.connect(dbname=os.environ['SUPER_PG_NAME'], user=os.environ['SUPER_PG_USER'], password=os.environ['SUPER_PG_PWD'],
-                            host=os.environ['SUPER_PG_HOST'], port=os.environ['SUPER_PG_PORT'], sslmode=os.environ['SUPER_PG_SSL'])
-    connection = conn.cursor()
-    return conn, connection
-
-
 def download_from_chain(chain: str, store_id: int, promos: bool = False):
     '''download_from_chain This function downloads data related to store prices or promotions from a chain.
 
@@ -53,17 +58,20 @@ def download_from_chain(chain: str, store_id: int, promos: bool = False):
         d = get_all_prices_with_promos(
             chain=CHAINS_DICT[chain],
             store_id=store_id, load_prices=False, load_promos=False)
-        items_dict_to_json = {
-            item_code: {
-                k: v
-                for k, v in item.__dict__.items()
-                if not k.startswith("__") and not callable(k)
-            }
-            for item_code, item in d.items()
-        }
-        with open(f"results/{chain}-prices-{store_id}-{datetime.date.today()}.json", "w") as file:
-            json.dump(items_dict_to_json, file)
-            send_data_to_db(items_dict_to_json, chain, store_id, f"{datetime.date.today()}")
+        write_store_prices(d, chain, store_id, datetime.date.today())
+        # Only the items that changed since the store was last merged into Mongo are exported. An export which was not
+        # merged yet is appended to - the diff repeats its changes, with their newer values
+        store_diff, fingerprint = diff_store_items(CHAINS_DICT[chain], store_id, d)
+        export_file = f"results/{chain}-prices-{store_id}-{datetime.date.today()}.ndjson"
+        write_ndjson(iter_diff_records(d, store_diff), export_file, append=True)
+        # Postgres is written to right away, so it gets the changes since it was last written to, by a fingerprint of
+        # its own
+        pg_fingerprint_path = get_pg_fingerprint_path(CHAINS_DICT[chain], store_id)
+        pg_diff, _ = diff_store_items(CHAINS_DICT[chain], store_id, d, pg_fingerprint_path)
+        send_data_to_db(iter_diff_records(d, pg_diff), chain, store_id, f"{datetime.date.today()}")
+        fingerprint.save(pg_fingerprint_path)
+        # The fingerprint is committed by main_run_secound, once the export is merged into Mongo
+        fingerprint.save(get_pending_fingerprint_path(CHAINS_DICT[chain], store_id))
     else:
         main_latest_promos(
             store_id, f"results/{chain}-{store_id}-{datetime.date.today()}.xlsx", CHAINS_DICT[chain],
@@ -71,36 +79,30 @@ def download_from_chain(chain: str, store_id: int, promos: bool = False):
 
 
 
-def send_data_to_db(json_data: dict, _chainn: str = None, store_id: int = None, date: str = None) -> None:
-    conn, connect = connect_to_pg()
-    chhain = CHAIN_INDEX[_chainn]
-    execute_batch(
-        connect, "select insert_product_name(%(code)s,%(name)s," + f"{chhain})",
-        list(json_data.values()))
-    conn.commit()
-    execute_batch(
-        connect,
-        "select insert_price(%(code)s,%(price)s,%(final_price)s,%(price_by_measure)s, %(manufacturer)s," +
-        f"{chhain},'{date}',{store_id})", list(json_data.values()))
-    conn.commit()
-
+def send_data_to_db(json_data: Iterable[dict], _chainn: str = None, store_id: int = None, date: str = None) -> None:
+    # The tombstones of removed items are recorded in Postgres' removals table, with the new and changed prices
+    records = list()
+    removed_codes = list()
+    for record in json_data:
+        if record.get("removed"):
+            removed_codes.append(record["code"])
+        else:
+            records.append(record)
+    if not records and not removed_codes:
+        return
+    with pg_connection() as conn:
+        copy_store_prices(conn, records, CHAIN_INDEX[_chainn], int(store_id), date, removed_codes)
 
 
 def __create_chains_updating_dict(server: bool = True) -> dict:
-    client = pymongo.MongoClient(
-        os.environ['MONGODB']
-    ) if server else pymongo.MongoClient(
-        os.environ['MONGODB'], directConnection=True, tlsCAFile=certifi.where())
+    client = get_mongo_client(server)
     col = client[os.environ['SUPER_PG_NAME']]['prices']
     return {key["chain"]: 0 for key in col.find({"chain": {"$exists": True}})}
 
 
 def connect_mongo(server: bool = True, collection_name: str = "prices", check_beggining: bool = False) -> Collection:
     global BEGINING_COUNT_DOCUMENTS
-    client = pymongo.MongoClient(
-        os.environ['MONGODB']
-    ) if server else pymongo.MongoClient(
-        os.environ['MONGODB'], directConnection=True, tlsCAFile=certifi.where())
+    client = get_mongo_client(server)
     col = client[os.environ['SUPER_PG_NAME']][collection_name]
     BEGINING_COUNT_DOCUMENTS = col.count_documents(
         {"chain": {"$exists": False}}) if check_beggining else BEGINING_COUNT_DOCUMENTS
@@ -108,7 +110,7 @@ def connect_mongo(server: bool = True, collection_name: str = "prices", check_be
 
 
 def _get_date(text: str) -> str:
-    return re.search(r'(?:(\d+-\d+){2})(?=\.json)', text).group()
+    return re.search(r'(?:(\d+-\d+){2})(?=\.(?:nd)?json)', text).group()
 
 
 def _get_chain(text: str) -> str:
@@ -119,9 +121,19 @@ def _get_store(text: str) -> str:
     return re.search(r'(?<=(promos-|prices-))\d+(?=-)', text).group()
 
 
-def read_json_export(json_file: str) -> dict:
+def read_json_export(json_file: str) -> Iterator[dict]:
+    '''read_json_export This function reads the records of a store export one at a time. Newline-delimited exports are streamed,
+    and exports of older runs (a single JSON object by barcode) are still supported.
+
+    :param json_file: the path of the export
+    :type json_file: str
+    :return: the export's records
+    :rtype: Iterator[dict]
+    '''
+    if is_ndjson_file(json_file):
+        return iter_ndjson(json_file)
     with open(json_file, "r", encoding="utf_8") as file:
-        return json.load(file)
+        return iter(json.load(file).values())
 
 
 def read_chain(json_file: str) -> dict:
@@ -133,100 +145,61 @@ def read_store_id(json_file: str) -> dict:
 
 
 def read_date(json_file: str) -> dict:
-    return {"date": re.search(r'(?:(\d+-\d+){2})(?=\.json)', json_file).group()}
+    return {"date": re.search(r'(?:(\d+-\d+){2})(?=\.(?:nd)?json)', json_file).group()}
 
 
-def update_json(json_file: str) -> dict:
+def update_json(json_file: str) -> Iterator[dict]:
     global UPDATED_CHAINS
-    json_update: dict = read_json_export(json_file)
-    send_data_to_db(
-        json_update, read_chain(json_file)["chain"],
-        read_store_id(json_file)["store_id"],
-        read_date(json_file)["date"])
-    for key in json_update:
-        json_update[key].update(read_chain(json_file))
-        json_update[key].update(read_store_id(json_file))
-        json_update[key].update(read_date(json_file))
-    UPDATED_CHAINS[f'{read_chain(json_file)},{read_store_id(json_file)}'] = len(json_update[key])
-    return json_update
-
-
-def create_store_dict(jsons_path: str):
-    return {_get_chain(jsonn): {_get_store(jsonn): {}} for jsonn in glob(f"{jsons_path}/*.json")}
-
-
-def create_date_dict(jsons_path: str):
-    return {_get_date(date): {} for date in glob(f"{jsons_path}/*.json")}
-
-
-def create_empty_global_dict(list_of_barcodes: list, jsons_path) -> dict:
-    return {barcode: create_date_dict(jsons_path) for barcode in list_of_barcodes}
-
-
-def create_another_global_dict(list_of_barcodes: list, jsons_path: str) -> dict:
-    return {barcode: create_store_dict(jsons_path) for barcode in list_of_barcodes}
-
-
-def join_jsons(jsons_path: str) -> dict:
-    global LIST_OF_DICTS, LIST_OF_BARCODES
-    # dict_of_dates = {_get_date(date): [] for date in glob(f"{jsons_path}/*.json")}
-    for jsond in glob(f"{jsons_path}/*.json"):
+    chain, store_id, date = read_chain(json_file)["chain"], read_store_id(json_file)["store_id"], read_date(json_file)["date"]
+    num_of_records = 0
+    for record in read_json_export(json_file):
+        record.update(chain=chain, store_id=store_id, date=date)
+        num_of_records += 1
+        yield record
+    UPDATED_CHAINS[f'{read_chain(json_file)},{read_store_id(json_file)}'] = num_of_records
+
+
+def iter_store_exports(jsons_path: str) -> Iterator[StoreExport]:
+    '''iter_store_exports This function reads the per-store JSON exports one at a time. They were already sent to Postgres when
+    they were mined, by download_from_chain.
+
+    :param jsons_path: the directory of the exports
+    :type jsons_path: str
+    :return: (chain name, store id, date, records) tuples
+    :rtype: Iterator[StoreExport]
+    '''
+    for jsond in glob(f"{jsons_path}/*.ndjson") + glob(f"{jsons_path}/*.json"):
         with open(jsond, "r", encoding="utf_8") as F:
-            if os.path.getsize(jsond) > 10 and F.read().startswith("{"):
-                json_file = update_json(jsond)
-                LIST_OF_BARCODES = list(set(list(json_file.keys())+LIST_OF_BARCODES))
-                LIST_OF_DICTS.append(json_file)
-    return create_global_dict(
-        LIST_OF_BARCODES, LIST_OF_DICTS, create_empty_global_dict(LIST_OF_BARCODES, jsons_path),
-        jsons_path)
-
-
-def join_more_jsons(jsons_path: str) -> dict:
-    global LIST_OF_DICTS, LIST_OF_BARCODES
-    for jsond in glob(f"{jsons_path}/*.json"):
-        if os.path.getsize(jsond) > 10:
-            json_file = update_json(jsond)
-            LIST_OF_BARCODES = list(set(list(json_file.keys())+LIST_OF_BARCODES))
-            LIST_OF_DICTS.append(json_file)
-    return create_global_dict(
-        LIST_OF_BARCODES, LIST_OF_DICTS, create_another_global_dict(LIST_OF_BARCODES, jsons_path),
-        jsons_path)
-
-
-def get_barcode_in_date(dict_of_dates: dict, json_dict: dict, barcode: str, date: str):
-    try:
-        dict_of_dates[barcode][date][json_dict[barcode]['chain']][json_dict[barcode]['store_id']] = json_dict[barcode]
-    except KeyError:
-        dict_of_dates[barcode][date][json_dict[barcode]['chain']] = {}
-        dict_of_dates[barcode][date][json_dict[barcode]['chain']][json_dict[barcode]['store_id']] = json_dict[barcode]
+            if os.path.getsize(jsond) <= 10 or F.read(1) != "{":
+                continue
+        yield read_chain(jsond)["chain"], read_store_id(jsond)["store_id"], read_date(jsond)["date"], update_json(jsond)
+
 
+def join_jsons(jsons_path: str) -> Iterator[Tuple[str, dict]]:
+    '''join_jsons This function merges the per-store JSON exports into an update per barcode, shaped {"date.chain.store_id": record},
+    so only the exported records are set. The exports are streamed once and merged in buckets, so the updates are emitted incrementally.
 
-def create_global_dict(barcode_list: list, list_of_dicts: list[dict], dict_of_dates: dict, jsons_path: str) -> dict:
-    global_dict = create_empty_global_dict(barcode_list, jsons_path)
-    for d in list_of_dicts:
-        for barcode in barcode_list:
-            if d.get(barcode):
-                temp_dict = {f"{d[barcode]['chain']},{d[barcode]['store_id']}": d[barcode]}
-                get_barcode_in_date(dict_of_dates, d, barcode, d[barcode]["date"])
-                global_dict.update(dict_of_dates)
-    return global_dict
+    :param jsons_path: the directory of the exports
+    :type jsons_path: str
+    :return: (barcode, update) tuples
+    :rtype: Iterator[Tuple[str, dict]]
+    '''
+    return merge_store_exports(iter_store_exports(jsons_path))
 
 
-def generate_jsonl(jsons_path: str, local: bool = True):
+def generate_jsonl(jsons_path: str, local: bool = True) -> bool:
     global END_COUNT_DOCUMENTS, BEG_TIME, ENDING_TIME, ITEMS_BEEN_UPDATED, UPDATED_CHAINS
     print(f"{datetime.datetime.now()}: connect to mongo")
     col: Collection = connect_mongo(local)
     print(f"{datetime.datetime.now()}: combine jsons")
-    dict_many = join_jsons(jsons_path)
-    ITEMS_BEEN_UPDATED = len(dict_many)
-    print(f"{datetime.datetime.now()}: add to db")
-    for item in dict_many:
-        # save_own={"_id":item}
-        # if col.find_one(save_own):
-        col.update_one({"_id": item}, {"$set": dict_many[item]}, True)
-        # else:
-        #     save_own.update(dict_many[item])
-        #     col.insert_one(save_own)
+    with BulkUpsertWriter(col, MONGO_BATCH_SIZE) as writer:
+        for item, update in join_jsons(jsons_path):
+            writer.upsert(item, update)
+    ITEMS_BEEN_UPDATED = writer.operations
+    for result in writer.failed_batches:
+        print(f"batch {result.batch_number} failed: {result.error}")
+    print(f"{datetime.datetime.now()}: added {ITEMS_BEEN_UPDATED} items to db in {len(writer.results)} batches "
+          f"({sum(result.seconds for result in writer.results):.1f}s writing)")
     END_COUNT_DOCUMENTS = col.count_documents({})
     ENDING_TIME = f"{datetime.datetime.now().strftime('%H:%M')}"
     print(f"{datetime.datetime.now()}: done")
@@ -242,32 +215,93 @@ def generate_jsonl(jsons_path: str, local: bool = True):
 
     #     ["ntfy", "send", "http://db.saret.tk:8080/saret", f"{datetime.date.today()}",
     #      f'done merging at {ENDING_TIME}, with {END_COUNT_DOCUMENTS}. {ITEMS_BEEN_UPDATED} items has been updated. Started at {BEG_TIME}'])
+    return not writer.failed_batches
 
 
 def run_this_shit(chain: str, _id: str, promos: bool = False):
     download_from_chain(chain, _id, promos)
 
 
+def mine_store(job: Tuple[str, int, bool]) -> Tuple[str, int, Optional[str]]:
+    '''mine_store This function runs a single (chain, store) mining job - download, parse and promotions evaluation.
+
+    :param job: the chain name, the store id and whether to download the promotions only
+    :type job: Tuple[str, int, bool]
+    :return: the chain name, the store id and the job's traceback, or None if it succeeded
+    :rtype: Tuple[str, int, Optional[str]]
+    '''
+    chain, store_id, promos = job
+    try:
+        run_this_shit(chain, store_id, promos)
+        return chain, store_id, None
+    except Exception:
+        return chain, store_id, traceback.format_exc()
+
+
+def run_mining_jobs(jobs: List[Tuple[str, int, bool]], workers: int = MINING_WORKERS) -> Dict[Tuple[str, int], Optional[str]]:
+    '''run_mining_jobs This function runs the given mining jobs in a pool of worker processes.
+    A failing job does not stop the others - its traceback is collected with the rest of the results.
+
+    :param jobs: (chain name, store id, promos) tuples
+    :type jobs: List[Tuple[str, int, bool]]
+    :param workers: the number of worker processes, defaults to the MINING_WORKERS environment variable or the number of cores
+    :type workers: int, optional
+    :return: the traceback of every job by its (chain, store id), or None for jobs that succeeded
+    :rtype: Dict[Tuple[str, int], Optional[str]]
+    '''
+    results = {}
+    if workers <= 1:
+        for job in jobs:
+            chain, store_id, error = mine_store(job)
+            results[(chain, store_id)] = error
+        return results
+    # Workers are spawned rather than forked, so they don't inherit the parent's Mongo client
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {executor.submit(mine_store, job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                chain, store_id, error = future.result()
+            except Exception:  # The worker process itself died
+                chain, store_id, _ = futures[future]
+                error = traceback.format_exc()
+            results[(chain, store_id)] = error
+    return results
+
+
+def prefetch_store_files(jobs: List[Tuple[str, int, bool]]) -> None:
+    '''prefetch_store_files This function downloads the raw files of all the given mining jobs up front, throttled per backend host,
+    so the worker processes only parse them.
+
+    :param jobs: (chain name, store id, promos) tuples
+    :type jobs: List[Tuple[str, int, bool]]
+    '''
+    for promos in {promos for _, _, promos in jobs}:
+        categories = get_price_file_types(False) + get_promo_file_types(promos)
+        stores = [(CHAINS_DICT[chain], store_id) for chain, store_id, job_promos in jobs if job_promos == promos]
+        for result in DownloadScheduler().run(create_store_jobs(stores, categories)):
+            if result.error:
+                print(f"{result.job.key} prefetch failed:\n{result.error}")
+
+
 def main_run_first(run: bool = False):
-    global RUNNER
     chain_stores = connect_mongo(check_beggining=True).find({"chain": {"$exists": True}}).sort("_id", pymongo.ASCENDING)
-    for chains in chain_stores:
-        p = False
-        for _id in chains["storeId"]:
-            try:
-                run_this_shit(chains["chain"], _id, run)
-            except Exception as e:
-                print(e)
-    while RUNNER:
-        sleep(1)
-        for ind, r in enumerate(RUNNER):
-            if not psutil.pid_exists(r):
-                RUNNER.pop(ind)
+    jobs = [(chains["chain"], _id, run) for chains in chain_stores for _id in chains["storeId"]]
+    prefetch_store_files(jobs)
+    results = run_mining_jobs(jobs)
+    for (chain, store_id), error in results.items():
+        if error:
+            print(f"{chain}, {store_id} failed:\n{error}")
+    print(f"{sum(error is None for error in results.values())}/{len(results)} stores were mined")
+    return results
 
 
 def main_run_secound():
-    generate_jsonl("results", local)
-    for file in glob("results/*.json"):
+    export_files = glob("results/*.ndjson") + glob("results/*.json")
+    if not generate_jsonl("results", local):
+        print("Some batches failed - the exports are kept, and merged again on the next run")
+        return
+    for file in export_files:
+        commit_pending_fingerprint(CHAINS_DICT[read_chain(file)["chain"]], int(read_store_id(file)["store_id"]))
         os.rename(file, f"{file}.done")
 
 
@@ -278,8 +312,7 @@ def another_connetction_to_mongo():
         if File and os.path.isfile(os.path.abspath(file)):
             with open(os.path.abspath(file), "r", encoding='utf_8') as f:
                 col.update_one({'file': file}, {"$set": {'value': f.read()}}, True)
-            fileees = pymongo.MongoClient(
-                os.environ['MONGODB']).get_database(os.environ['SUPER_PG_NAME'])
+            fileees = get_mongo_client().get_database(os.environ['SUPER_PG_NAME'])
             varme = gridfs.GridFSBucket(fileees, "hhh")
             with varme.open_upload_stream(file) as g:
                 with open(file, "rb") as read_binary_file:
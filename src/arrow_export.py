@@ -0,0 +1,206 @@
+import os
+from itertools import islice
+from os import path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # Columnar exports are optional - csv, xlsx and json outputs don't need pyarrow
+    pa = ipc = pq = None
+
+from src.item_table import ItemTable
+
+ARROW_FILE_EXTENSIONS = [".parquet", ".arrow"]
+BATCH_ROWS = 65536
+
+
+def _check_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("Parquet and Arrow outputs require pyarrow (pip install pyarrow)")
+
+
+def is_arrow_output_file(output_file: str) -> bool:
+    return any(output_file.endswith(extension) for extension in ARROW_FILE_EXTENSIONS)
+
+
+def get_promotions_schema(headers: List[str]) -> "pa.Schema":
+    """
+    This function returns the typed schema of the promotions table, whose columns are named by the given headers (in
+    the order of get_promotion_row_for_table). Repeating strings are dictionary encoded.
+    """
+    _check_pyarrow()
+    repeated_string = pa.dictionary(pa.int32(), pa.string())
+    types = [
+        repeated_string,  # Promotion content
+        pa.string(),  # Item name
+        pa.float64(),  # Price
+        pa.float64(),  # Discounted price
+        pa.float64(),  # Discount rate
+        repeated_string,  # Club
+        pa.float64(),  # Max quantity
+        pa.bool_(),  # Allows multiple discounts
+        pa.bool_(),  # Has started
+        pa.timestamp("s"),  # Start date
+        pa.timestamp("s"),  # End date
+        pa.timestamp("s"),  # Update date
+        repeated_string,  # Manufacturer
+        pa.string(),  # Item code
+        pa.int32(),  # Reward type
+    ]
+    assert len(types) == len(headers)
+    return pa.schema([pa.field(header, column_type) for header, column_type in zip(headers, types)])
+
+
+def get_items_schema() -> "pa.Schema":
+    _check_pyarrow()
+    return pa.schema(
+        [
+            pa.field("code", pa.string()),
+            pa.field("name", pa.string()),
+            pa.field("manufacturer", pa.dictionary(pa.int32(), pa.string())),
+            pa.field("price", pa.float64()),
+            pa.field("final_price", pa.float64()),
+            pa.field("price_by_measure", pa.float64()),
+            pa.field(
+                "promotions",
+                pa.list_(pa.struct([("content", pa.string()), ("discounted_price", pa.float64())])),
+            ),
+        ]
+    )
+
+
+class _BatchWriter:
+    """
+    A writer of record batches to a Parquet or an Arrow IPC file, chosen by the file's extension. The file is written
+    to a temporary path first and moved into place once complete.
+    """
+
+    def __init__(self, output_filename: str, schema: "pa.Schema"):
+        self.output_filename: str = output_filename
+        self.tmp_path: str = f"{output_filename}.{os.getpid()}.tmp"
+        if output_filename.endswith(".parquet"):
+            self._writer = pq.ParquetWriter(self.tmp_path, schema, compression="zstd")
+        elif output_filename.endswith(".arrow"):
+            self._writer = ipc.new_file(
+                self.tmp_path, schema, options=ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            )
+        else:
+            raise ValueError(f"The given output file has an invalid extension:\n{output_filename}")
+
+    def write(self, batch: "pa.RecordBatch") -> None:
+        if self.output_filename.endswith(".parquet"):
+            self._writer.write_batch(batch)
+        else:
+            self._writer.write(batch)
+
+    def __enter__(self) -> "_BatchWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        try:
+            self._writer.close()
+            if exc_type is None:
+                os.replace(self.tmp_path, self.output_filename)
+        finally:
+            if path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+
+class _DictionaryEncoder:
+    """
+    A dictionary encoder of a column that is written in batches. The dictionary only grows, so the dictionary of every
+    batch extends the previous one - Arrow IPC files support such deltas, but not replacing the dictionary.
+    """
+
+    def __init__(self, value_type: "pa.DataType"):
+        self.value_type: "pa.DataType" = value_type
+        self.indices: Dict[object, int] = dict()
+
+    def encode(self, values: Iterable) -> "pa.DictionaryArray":
+        indices = [
+            None if value is None else self.indices.setdefault(value, len(self.indices))
+            for value in values
+        ]
+        return pa.DictionaryArray.from_arrays(
+            pa.array(indices, pa.int32()), pa.array(list(self.indices), self.value_type)
+        )
+
+
+def _iter_batches(rows: Iterable[List], schema: "pa.Schema") -> Iterator["pa.RecordBatch"]:
+    encoders = {
+        i: _DictionaryEncoder(field.type.value_type)
+        for i, field in enumerate(schema)
+        if pa.types.is_dictionary(field.type)
+    }
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, BATCH_ROWS))
+        if not chunk:
+            return
+        yield pa.RecordBatch.from_arrays(
+            [
+                encoders[i].encode(column) if i in encoders else pa.array(column, field.type)
+                for i, (column, field) in enumerate(zip(zip(*chunk), schema))
+            ],
+            schema=schema,
+        )
+
+
+def write_rows_to_arrow(rows: Iterable[List], schema: "pa.Schema", output_filename: str) -> int:
+    """
+    This function writes the given rows to a Parquet or an Arrow IPC file. Rows are converted to columns in batches
+    of BATCH_ROWS rows, so only a single batch is held in memory.
+
+    :param rows: The rows of the table, with a value for every field of the schema
+    :param schema: The schema of the table
+    :param output_filename: A given file to write to
+    :return: The number of written rows
+    """
+    _check_pyarrow()
+    num_of_rows = 0
+    with _BatchWriter(output_filename, schema) as writer:
+        for batch in _iter_batches(rows, schema):
+            writer.write(batch)
+            num_of_rows += batch.num_rows
+    return num_of_rows
+
+
+def write_items_to_arrow(items_dict: ItemTable, output_filename: str) -> None:
+    """
+    This function writes the items of a store, with their final prices and promotions, to a Parquet or an Arrow IPC
+    file. The table's columns are converted as they are, without building a dictionary per item.
+
+    :param items_dict: A given table of items
+    :param output_filename: A given file to write to
+    """
+    _check_pyarrow()
+    schema = get_items_schema()
+    promotions = [items_dict.promotions.get(row) or [] for row in range(len(items_dict))]
+    batch = pa.RecordBatch.from_arrays(
+        [
+            pa.array(items_dict.codes, pa.string()),
+            pa.array(items_dict.names, pa.string()),
+            pa.array(items_dict.manufacturers, pa.string()).dictionary_encode(),
+            pa.array(items_dict.prices, pa.float64()),
+            pa.array(items_dict.final_prices, pa.float64()),
+            pa.array(items_dict.prices_by_measure, pa.float64()),
+            pa.array(promotions, schema.field("promotions").type),
+        ],
+        schema=schema,
+    )
+    with _BatchWriter(output_filename, schema) as writer:
+        writer.write(batch)
+
+
+def read_arrow_table(input_filename: str, columns: Optional[List[str]] = None) -> "pa.Table":
+    """
+    This function reads (only the given columns of) a Parquet or an Arrow IPC file written by this module.
+    """
+    _check_pyarrow()
+    if input_filename.endswith(".parquet"):
+        return pq.read_table(input_filename, columns=columns)
+    # The file is memory mapped, so the columns that aren't selected are never read
+    table = ipc.open_file(pa.memory_map(input_filename)).read_all()
+    return table.select(columns) if columns is not None else table
@@ -0,0 +1,144 @@
+import logging
+import os
+import pickle
+from datetime import date
+from os import path
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+
+from src.item_table import ItemTable
+from src.promotion import get_all_prices_with_promos
+from src.supermarket_chain import SupermarketChain
+from src.utils import RAW_FILES_DIRNAME
+
+
+class BasketCost(NamedTuple):
+    chain: str
+    store_id: int
+    total: float  # The cost of the basket's items found in the store
+    missing: List[str]  # Codes of the basket's items the store does not sell
+
+
+def parse_basket(basket_items: Iterable[str]) -> Dict[str, float]:
+    """
+    This function parses basket items given as "code" or "code:quantity" strings.
+
+    :param basket_items: A given list of items
+    :return: The quantity of every item code
+    """
+    basket = dict()
+    for basket_item in basket_items:
+        code, _, quantity = basket_item.partition(":")
+        basket[code] = basket.get(code, 0) + (float(quantity) if quantity else 1)
+    return basket
+
+
+def get_final_prices_path(chain: SupermarketChain, store_id: int) -> str:
+    return path.join(
+        RAW_FILES_DIRNAME, f"{repr(type(chain))}-FinalPrices-{store_id}-{date.today()}.table"
+    )
+
+
+def get_store_final_prices(chain: SupermarketChain, store_id: int, load_xml: bool) -> ItemTable:
+    """
+    This function returns the items of a given store with their final prices (after promotions). The table is built
+    once a day and saved, so comparing baskets across many stores only loads the saved tables.
+
+    :param chain: A given supermarket chain
+    :param store_id: A given store id
+    :param load_xml: A boolean representing whether to load existing prices and promotions xml files
+    """
+    table_path = get_final_prices_path(chain, store_id)
+    if path.isfile(table_path):
+        try:
+            with open(table_path, "rb") as f_in:
+                return pickle.load(f_in)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            logging.debug(f"Ignoring invalid prices table {table_path}: {e}")
+
+    items_dict = get_all_prices_with_promos(
+        store_id=store_id, chain=chain, load_promos=load_xml, load_prices=load_xml
+    )
+    tmp_path = f"{table_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f_out:
+            pickle.dump(items_dict, f_out, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, table_path)
+    finally:
+        if path.exists(tmp_path):
+            os.remove(tmp_path)
+    return items_dict
+
+
+def get_basket_cost(
+    chain_name: str, store_id: int, items_dict: ItemTable, basket: Dict[str, float]
+) -> BasketCost:
+    """
+    This function returns the cost of a given basket in a store with a given table of items.
+    """
+    codes = list(basket)
+    rows = [items_dict.row_of(code) for code in codes]
+    found = [i for i, row in enumerate(rows) if row is not None]
+    final_prices = np.frombuffer(items_dict.final_prices, dtype=np.float64)
+    quantities = np.fromiter(basket.values(), dtype=np.float64, count=len(codes))
+    total = float(final_prices[[rows[i] for i in found]] @ quantities[found])
+    missing = [code for code, row in zip(codes, rows) if row is None]
+    return BasketCost(chain_name, store_id, round(total, 2), missing)
+
+
+def compare_basket(
+    basket: Dict[str, float], stores: Dict[Tuple[str, int], ItemTable]
+) -> List[BasketCost]:
+    """
+    This function compares the cost of a given basket in the given stores.
+
+    :param basket: The quantity of every item code in the basket
+    :param stores: The items table of every (chain name, store id)
+    :return: The basket's cost in every store - stores missing fewer items first, then the cheaper stores
+    """
+    costs = [
+        get_basket_cost(chain_name, store_id, items_dict, basket)
+        for (chain_name, store_id), items_dict in stores.items()
+    ]
+    return sorted(costs, key=lambda cost: (len(cost.missing), cost.total))
+
+
+def compare_basket_in_stores(
+    basket: Dict[str, float],
+    stores: Dict[str, List],
+    chains_dict: Dict[str, SupermarketChain],
+    load_xml: bool,
+) -> List[BasketCost]:
+    """
+    This function compares the cost of a given basket in the given stores of the given chains.
+
+    :param basket: The quantity of every item code in the basket
+    :param stores: The store ids to compare, by chain name (e.g. MONITORED_STORES)
+    :param chains_dict: The supermarket chains, by their names
+    :param load_xml: A boolean representing whether to load existing prices and promotions xml files
+    """
+    store_tables = dict()
+    for chain_name, store_ids in stores.items():
+        for store_id in store_ids:
+            try:
+                store_tables[(chain_name, int(store_id))] = get_store_final_prices(
+                    chains_dict[chain_name], int(store_id), load_xml
+                )
+            except Exception as e:
+                logging.warning(f"Skipping {chain_name} store {store_id}: {e}")
+    return compare_basket(basket, store_tables)
+
+
+def log_basket_comparison(
+    basket: Dict[str, float],
+    stores: Dict[str, List],
+    chains_dict: Dict[str, SupermarketChain],
+    load_xml: bool,
+) -> None:
+    """
+    This function prints the cost of a given basket in the given stores, from the cheapest.
+    """
+    for cost in compare_basket_in_stores(basket, stores, chains_dict, load_xml):
+        missing = f" (missing: {', '.join(cost.missing)})" if cost.missing else ""
+        logging.info(f"{cost.chain} {cost.store_id}: {cost.total}{missing}")
@@ -0,0 +1,293 @@
+import heapq
+import logging
+from enum import Enum
+from math import ceil, floor, inf
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from src.item_table import ItemTable
+from src.promotion import ClubID, Promotion, RewardType, download_store_files, get_available_promos
+from src.supermarket_chain import SupermarketChain
+from src.utils import create_items_dict
+
+MIN_SAVING = 1e-6
+
+
+class AppliedPromotion(NamedTuple):
+    promotion_id: int
+    content: str
+    codes: List[str]  # The code of every unit in the bundle the promotion was applied to
+    saving: float
+
+
+class BasketOptimization(NamedTuple):
+    regular_total: float
+    total: float
+    applied_promotions: List[AppliedPromotion]
+    missing: List[str]  # Codes of the basket's items the store does not sell
+
+
+class _Unit:
+    """
+    A single unit of a basket item, with its price after the promotions applied to it so far.
+    """
+
+    __slots__ = ("code", "price", "promotion_ids", "is_exclusive")
+
+    def __init__(self, code: str, price: float):
+        self.code: str = code
+        self.price: float = price
+        self.promotion_ids: Set[int] = set()
+        self.is_exclusive: bool = False  # Whether a promotion that cannot be combined was applied to the unit
+
+
+class _BundleReward(Enum):
+    PER_UNIT = 0
+    THRESHOLD = 1
+    CHEAPEST_UNIT = 2
+    FIXED_PRICE = 3
+
+
+class _Deal:
+    """
+    A promotion restricted to the units of the basket it applies to. The promotion is applied to bundles of units,
+    and at most max_qty units (if given) are discounted. How a bundle is priced depends on the promotion's reward:
+    - A threshold discount is taken off the bundle once it costs at least the promotion's minimal purchase amount.
+    - A discount on the last of min_qty units ("1+1", "the second one for 10") goes to the cheapest unit of the bundle.
+    - A fixed price (min_qty units for the discounted price) is the price of the whole bundle.
+    - Any other discount is applied to every unit of the bundle by itself.
+    Discounts on a whole bundle are split between its units in proportion to their prices.
+    """
+
+    def __init__(self, promotion: Promotion, units: List[_Unit]):
+        rule = promotion.rule
+        self.promotion: Promotion = promotion
+        self.multiplier, self.addend, self.divisor = rule.coefficients()
+        self.units: List[_Unit] = units
+        self.bundle_size: int = max(1, ceil(rule.min_qty or 1))  # The minimal number of units in a bundle
+        self.remaining_units: float = floor(promotion.max_qty) if promotion.max_qty else inf
+        if rule.reward_type == RewardType.DISCOUNT_BY_THRESHOLD:
+            self.reward = _BundleReward.THRESHOLD
+        elif rule.reward_type in (
+            RewardType.SECOND_OR_THIRD_INSTANCE_FOR_FREE,
+            RewardType.SECOND_INSTANCE_DIFFERENT_DISCOUNT,
+        ):
+            self.reward = _BundleReward.CHEAPEST_UNIT
+        elif rule.is_second_instance and rule.reward_type in (
+            RewardType.SECOND_INSTANCE_SAME_DISCOUNT,
+            RewardType.DISCOUNT_IN_PERCENTAGE,
+        ):
+            self.reward = _BundleReward.CHEAPEST_UNIT
+            self.bundle_size = 2
+        elif self.multiplier == 0 and not rule.is_price_per_kg:
+            self.reward = _BundleReward.FIXED_PRICE
+        else:
+            self.reward = _BundleReward.PER_UNIT
+
+    def get_discounted_price(self, price: float) -> float:
+        """
+        This method returns the price of a unit under the promotion's rule, which averages the rewards of bundles over
+        their units.
+        """
+        return (price * self.multiplier + self.addend) / self.divisor
+
+    def get_bundle_prices(self, prices: List[float]) -> List[float]:
+        """
+        This method returns the prices of the units of a bundle after the promotion.
+
+        :param prices: The current prices of the bundle's units, from the most expensive to the cheapest
+        """
+        if self.reward == _BundleReward.PER_UNIT:
+            return [max(0.0, self.get_discounted_price(price)) for price in prices]
+        if self.reward == _BundleReward.CHEAPEST_UNIT:
+            # The rule's average price of a unit is the bundle's price over its size, so the cheapest unit's price is
+            # what is left of the bundle's price after the other units are paid in full
+            cheapest_price = prices[-1]
+            discounted_price = (
+                self.bundle_size * self.get_discounted_price(cheapest_price)
+                - (self.bundle_size - 1) * cheapest_price
+            )
+            return prices[:-1] + [min(cheapest_price, max(0.0, discounted_price))]
+        total = sum(prices)
+        if self.reward == _BundleReward.THRESHOLD:
+            discounted_total = total + self.addend / self.divisor
+        else:
+            discounted_total = self.bundle_size * self.addend / self.divisor
+        if total <= 0 or discounted_total >= total:
+            return list(prices)
+        return [price * max(0.0, discounted_total) / total for price in prices]
+
+    def is_eligible(self, unit: _Unit) -> bool:
+        if self.promotion.promotion_id in unit.promotion_ids:
+            return False
+        if self.promotion.allow_multiple_discounts:
+            return not unit.is_exclusive
+        return not unit.promotion_ids
+
+    def get_best_bundle(self) -> Tuple[float, List[_Unit], List[float]]:
+        """
+        This method returns the saving of the bundle of units the promotion saves the most on, its units and their
+        prices after the promotion.
+        The saving of a bundle never decreases with the prices of its units, so the best bundle is the most expensive
+        eligible units - as many as it takes to reach the promotion's minimal purchase amount, if it has one.
+        """
+        eligible_units = [unit for unit in self.units if self.is_eligible(unit)]
+        if self.reward == _BundleReward.THRESHOLD:
+            bundle = list()
+            spend = 0.0
+            for unit in sorted(eligible_units, key=lambda unit: unit.price, reverse=True):
+                if len(bundle) >= self.bundle_size and spend >= self.promotion.min_purchase_amount:
+                    break
+                bundle.append(unit)
+                spend += unit.price
+            if spend < self.promotion.min_purchase_amount:
+                return 0, [], []
+        else:
+            bundle = heapq.nlargest(self.bundle_size, eligible_units, key=lambda unit: unit.price)
+        if len(bundle) < self.bundle_size or len(bundle) > self.remaining_units:
+            return 0, [], []
+        prices = [unit.price for unit in bundle]
+        discounted_prices = self.get_bundle_prices(prices)
+        return sum(prices) - sum(discounted_prices), bundle, discounted_prices
+
+
+def _create_deals(promotions: Iterable[Promotion], units_by_code: Dict[str, List[_Unit]]) -> List[_Deal]:
+    deals = list()
+    for promotion in promotions:
+        units = [
+            unit
+            for code in {item.code for item in promotion.items}
+            for unit in units_by_code.get(code, [])
+        ]
+        if not units:
+            continue
+        try:
+            deal = _Deal(promotion, units)
+        except (TypeError, ZeroDivisionError) as e:
+            logging.debug(f"Skipping promotion {promotion.promotion_id} with an invalid rule: {e}")
+            continue
+        if promotion.rule.is_unknown():
+            continue
+        deals.append(deal)
+    return deals
+
+
+def optimize_basket(
+    basket: Dict[str, float],
+    items_dict: ItemTable,
+    promotions: Iterable[Promotion],
+    club_ids: Iterable[ClubID] = (ClubID.REGULAR,),
+) -> BasketOptimization:
+    """
+    This function picks the promotions that minimise the cost of a given basket.
+    Promotions are applied in bundles of their min_qty units (or of the units reaching their minimal purchase amount),
+    up to their max_qty units. A unit may get several
+    promotions only if all of them allow multiple discounts (later ones discount the already discounted price).
+    The promotions are picked greedily - the bundle saving the most is applied first. Applying a bundle can only lower
+    the savings of the other promotions, so the savings are re-evaluated lazily, only when a promotion reaches the top
+    of the queue, and promotions that cannot save anymore are dropped.
+
+    :param basket: The quantity of every item code in the basket. Fractional quantities (weighed items) are priced
+    regularly for their fractional part
+    :param items_dict: The items of the store
+    :param promotions: The available promotions in the store
+    :param club_ids: The club ids of the promotions the customer is entitled to
+    """
+    club_ids = set(club_ids)
+    units_by_code: Dict[str, List[_Unit]] = dict()
+    regular_total = 0.0
+    fractions_total = 0.0
+    missing = list()
+    for code, quantity in basket.items():
+        item = items_dict.get(code)
+        if item is None:
+            missing.append(code)
+            continue
+        regular_total += item.price * quantity
+        fractions_total += item.price * (quantity - floor(quantity))
+        units_by_code[code] = [_Unit(code, item.price) for _ in range(floor(quantity))]
+
+    deals = _create_deals(
+        (promotion for promotion in promotions if promotion.club_id in club_ids),
+        units_by_code,
+    )
+    queue = list()
+    for i, deal in enumerate(deals):
+        saving, _, _ = deal.get_best_bundle()
+        if saving > MIN_SAVING:
+            queue.append((-saving, i))
+    heapq.heapify(queue)
+
+    applied_promotions = list()
+    while queue:
+        negative_saving, i = heapq.heappop(queue)
+        deal = deals[i]
+        saving, bundle, discounted_prices = deal.get_best_bundle()
+        if saving <= MIN_SAVING:
+            continue
+        if saving < -negative_saving - MIN_SAVING:  # Outdated - requeue with the current saving
+            heapq.heappush(queue, (-saving, i))
+            continue
+
+        for unit, discounted_price in zip(bundle, discounted_prices):
+            unit.price = discounted_price
+            unit.promotion_ids.add(deal.promotion.promotion_id)
+            unit.is_exclusive |= not deal.promotion.allow_multiple_discounts
+        deal.remaining_units -= len(bundle)
+        applied_promotions.append(
+            AppliedPromotion(
+                deal.promotion.promotion_id,
+                deal.promotion.content,
+                [unit.code for unit in bundle],
+                round(saving, 2),
+            )
+        )
+        saving, _, _ = deal.get_best_bundle()
+        if saving > MIN_SAVING:
+            heapq.heappush(queue, (-saving, i))
+
+    total = fractions_total + sum(
+        unit.price for units in units_by_code.values() for unit in units
+    )
+    return BasketOptimization(
+        round(regular_total, 2), round(total, 2), applied_promotions, missing
+    )
+
+
+def optimize_basket_in_store(
+    chain: SupermarketChain,
+    store_id: int,
+    basket: Dict[str, float],
+    load_xml: bool,
+    club_ids: Optional[Iterable[ClubID]] = None,
+) -> BasketOptimization:
+    """
+    This function picks the promotions that minimise the cost of a given basket in a given store.
+
+    :param chain: A given supermarket chain
+    :param store_id: A given store id
+    :param basket: The quantity of every item code in the basket
+    :param load_xml: A boolean representing whether to load existing prices and promotions xml files
+    :param club_ids: The club ids of the promotions the customer is entitled to (regular promotions by default)
+    """
+    download_store_files(chain, store_id, False, check_latest=not load_xml)
+    items_dict = create_items_dict(chain, store_id, load_xml, False)
+    promotions = get_available_promos(chain, store_id, load_xml, load_xml, False, items_dict)
+    return optimize_basket(
+        basket, items_dict, promotions, club_ids if club_ids is not None else (ClubID.REGULAR,)
+    )
+
+
+def log_basket_optimization(
+    chain: SupermarketChain, store_id: int, basket: Dict[str, float], load_xml: bool
+) -> None:
+    """
+    This function prints the promotions that minimise the cost of a given basket in a given store.
+    """
+    optimization = optimize_basket_in_store(chain, store_id, basket, load_xml)
+    for applied_promotion in optimization.applied_promotions:
+        logging.info(
+            f"{applied_promotion.content}: {', '.join(applied_promotion.codes)} (-{applied_promotion.saving})"
+        )
+    if optimization.missing:
+        logging.info(f"Missing: {', '.join(optimization.missing)}")
+    logging.info(f"Total: {optimization.total} (instead of {optimization.regular_total})")
@@ -8,3 +8,4 @@ class BinaProjectWebClient(SupermarketChain):
     _update_date_format = "%Y-%m-%d %H:%M:%S"
     _path_prefix = ""
     _hostname_suffix = ".binaprojects.com"
+    _download_host = "binaprojects.com"
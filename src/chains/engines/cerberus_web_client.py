@@ -2,4 +2,4 @@ from src.supermarket_chain import SupermarketChain
 
 
 class CerberusWebClient(SupermarketChain):
-    pass
+    _download_host = "url.retail.publishedprices.co.il"
@@ -1,7 +1,6 @@
-from typing import Dict, List
-from bs4.element import Tag
+from typing import List
 
-from src.item import Item
+from src.promotion_record import PromotionRecord
 from src.supermarket_chain import SupermarketChain
 
 
@@ -12,8 +11,8 @@ class Matrix(SupermarketChain):
     _date_hour_format = "%Y/%m/%d %H:%M:%S"
     _update_date_format = "%Y/%m/%d %H:%M:%S"
     _item_tag_name = "Product"
+    _download_host = "matrixcatalog.co.il"
 
     @staticmethod
-    def get_items(promo: Tag, items_dict: Dict[str, Item]) -> List[Item]:
-        promo_item = items_dict.get(promo.find("ItemCode").text)
-        return [promo_item] if promo_item else []
+    def get_promo_item_codes(promo: PromotionRecord) -> List[str]:
+        return [promo.get("ItemCode")]
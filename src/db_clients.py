@@ -0,0 +1,127 @@
+import atexit
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Generic, Iterator, TypeVar
+
+import certifi
+import pymongo
+
+try:
+    from psycopg2.pool import ThreadedConnectionPool
+except ImportError:  # Only the stages writing to Postgres need psycopg2
+    ThreadedConnectionPool = None
+
+PG_POOL_SIZE = int(os.environ.get("PG_POOL_SIZE", 4))
+
+T = TypeVar("T")
+
+
+class ProcessLocal(Generic[T]):
+    """
+    A value that is created lazily, once per process, and shared by all the threads of the process.
+    A forked child never uses its parent's value (sockets must not be shared across processes) - it creates its own.
+    """
+
+    def __init__(self, factory: Callable[[], T], close: Callable[[T], None]):
+        self._factory: Callable[[], T] = factory
+        self._close: Callable[[T], None] = close
+        self._lock: threading.Lock = threading.Lock()
+        self._pid: int = 0
+        self._value = None
+
+    def get(self) -> T:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._value = self._factory()
+                self._pid = os.getpid()
+            return self._value
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                self._close(self._value)
+            self._pid, self._value = 0, None
+
+    def _after_fork(self) -> None:
+        # The lock may have been held by another thread of the parent while forking
+        self._lock = threading.Lock()
+        self._pid, self._value = 0, None
+
+
+def _create_mongo_client(server: bool) -> pymongo.MongoClient:
+    if server:
+        return pymongo.MongoClient(os.environ["MONGODB"])
+    return pymongo.MongoClient(os.environ["MONGODB"], directConnection=True, tlsCAFile=certifi.where())
+
+
+def _create_pg_pool():
+    if ThreadedConnectionPool is None:
+        raise ImportError("Writing to Postgres requires psycopg2 (pip install psycopg2-binary)")
+    return ThreadedConnectionPool(
+        1,
+        PG_POOL_SIZE,
+        dbname=os.environ["SUPER_PG_NAME"],
+        user=os.environ["SUPER_PG_USER"],
+        password=os.environ["SUPER_PG_PWD"],
+        host=os.environ["SUPER_PG_HOST"],
+        port=os.environ["SUPER_PG_PORT"],
+        sslmode=os.environ["SUPER_PG_SSL"],
+    )
+
+
+_MONGO_CLIENTS: Dict[bool, ProcessLocal[pymongo.MongoClient]] = {
+    server: ProcessLocal(lambda server=server: _create_mongo_client(server), lambda client: client.close())
+    for server in (True, False)
+}
+_PG_POOL: ProcessLocal = ProcessLocal(_create_pg_pool, lambda pool: pool.closeall())
+
+
+def get_mongo_client(server: bool = True) -> pymongo.MongoClient:
+    """
+    This function returns the process's MongoDB client, creating it on the first call. pymongo clients are thread
+    safe and pool their own connections, so a single client serves all the mining stages of the process.
+
+    :param server: Whether the script runs on the database's server (otherwise connects directly, over TLS)
+    """
+    return _MONGO_CLIENTS[bool(server)].get()
+
+
+def get_pg_pool():
+    """
+    This function returns the process's Postgres connection pool, creating it on the first call.
+    """
+    return _PG_POOL.get()
+
+
+@contextmanager
+def pg_connection() -> Iterator:
+    """
+    This function borrows a connection from the process's Postgres pool, and returns it to the pool when done.
+    A connection that was closed (e.g. by a network error) is discarded rather than reused.
+    """
+    pool = get_pg_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+def close_clients() -> None:
+    """
+    This function closes the process's database clients. They are created again if used afterwards.
+    """
+    for clients in _MONGO_CLIENTS.values():
+        clients.close()
+    _PG_POOL.close()
+
+
+def _reset_clients_after_fork() -> None:
+    for clients in _MONGO_CLIENTS.values():
+        clients._after_fork()
+    _PG_POOL._after_fork()
+
+
+atexit.register(close_clients)
+os.register_at_fork(after_in_child=_reset_clients_after_fork)
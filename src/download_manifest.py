@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import time
+from os import path
+from typing import Dict, Optional
+
+from src.snapshot_cache import get_file_hash
+
+MANIFEST_SUFFIX = ".manifest.json"
+# Seconds a check against the chain's latest files holds - files checked since (e.g. prefetched) are not listed again
+LATEST_FILE_CHECK_INTERVAL = int(os.environ.get("LATEST_FILE_CHECK_INTERVAL", 3600))
+
+
+def get_manifest_path(raw_files_dirname: str, chain_name: str, store_id: int) -> str:
+    """
+    This function returns the path of the download manifest of a given store.
+    Every store has its own manifest, so stores downloaded in parallel never write the same file.
+    """
+    return path.join(raw_files_dirname, f"{chain_name}-{store_id}{MANIFEST_SUFFIX}")
+
+
+def get_remote_file_key(file_name: str) -> str:
+    """
+    This function returns the name a remote file is recorded by - its name without any extension, as the listings of
+    some engines omit the extensions, and the downloaded files are already extracted.
+    """
+    return path.basename(file_name).split(".")[0]
+
+
+def get_remote_file_timestamp(file_name: str) -> str:
+    """
+    This function returns the publication timestamp encoded at the end of a remote file's name.
+    """
+    return get_remote_file_key(file_name).rsplit("-", maxsplit=1)[-1]
+
+
+def load_manifest(manifest_path: str) -> Dict[str, Dict]:
+    """
+    This function loads a given download manifest - a record of the latest downloaded file of every category, by the
+    category's name. A missing or broken manifest is treated as empty.
+    """
+    if not path.isfile(manifest_path):
+        return dict()
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f_in:
+            return json.load(f_in)
+    except (OSError, ValueError) as e:
+        logging.debug(f"Ignoring invalid manifest {manifest_path}: {e}")
+        return dict()
+
+
+def save_manifest(manifest_path: str, manifest: Dict[str, Dict]) -> None:
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f_out:
+            json.dump(manifest, f_out, indent=2)
+        os.replace(tmp_path, manifest_path)
+    finally:
+        if path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def create_manifest_entry(remote_file_name: str, xml_path: str) -> Dict:
+    """
+    This function creates the manifest entry of a remote file downloaded to a given path.
+
+    :param remote_file_name: The name of the file as published by the chain
+    :param xml_path: The path the file was downloaded to
+    """
+    return {
+        "name": get_remote_file_key(remote_file_name),
+        "timestamp": get_remote_file_timestamp(remote_file_name),
+        "size": path.getsize(xml_path),
+        "hash": get_file_hash(xml_path),
+        "path": xml_path,
+        "checked_at": time.time(),
+    }
+
+
+def create_unpublished_entry(xml_path: str) -> Dict:
+    """
+    This function creates the manifest entry of a category the chain did not publish, so it is not looked for again
+    until the check expires.
+    """
+    return {"name": None, "path": xml_path, "checked_at": time.time()}
+
+
+def is_recently_checked(entry: Optional[Dict]) -> bool:
+    """
+    This function returns whether the file of a given manifest entry was checked against the chain's latest files
+    in the last LATEST_FILE_CHECK_INTERVAL seconds.
+    """
+    return entry is not None and time.time() - entry.get("checked_at", 0) < LATEST_FILE_CHECK_INTERVAL
+
+
+def is_entry_on_disk(entry: Optional[Dict]) -> bool:
+    """
+    This function returns whether the file of a given manifest entry is still on the disk, unchanged.
+    """
+    return (
+        entry is not None
+        and entry["name"] is not None
+        and path.isfile(entry["path"])
+        and path.getsize(entry["path"]) == entry["size"]
+    )
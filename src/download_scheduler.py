@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from urllib.parse import urlparse
+
+import requests
+from il_supermarket_scarper.main import FileTypesFilters
+
+from src.supermarket_chain import SupermarketChain
+from src.utils import download_xml_files
+
+
+class HostLimits(NamedTuple):
+    """
+    The limits a single backend host is accessed with.
+    """
+
+    max_concurrency: int = 2  # Jobs running against the host at the same time
+    min_interval: float = 0.5  # Seconds between the starts of two jobs against the host
+
+
+class DownloadJob(NamedTuple):
+    """
+    A blocking download function, and the backend host it accesses.
+    """
+
+    host: str
+    func: Callable
+    args: Tuple = ()
+    key: Hashable = None  # Identifies the job in the results
+
+
+class JobResult(NamedTuple):
+    job: DownloadJob
+    result: object = None
+    error: Optional[str] = None  # The job's traceback, if it failed
+
+
+class _HostThrottle:
+    """
+    Enforces the limits of a single host: a semaphore caps the concurrent jobs, and the starts of the jobs are spaced
+    by at least min_interval.
+    """
+
+    def __init__(self, limits: HostLimits):
+        self._semaphore = asyncio.Semaphore(limits.max_concurrency)
+        self._lock = asyncio.Lock()
+        self._min_interval = limits.min_interval
+        self._next_start = 0.0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        async with self._semaphore:
+            async with self._lock:
+                loop = asyncio.get_running_loop()
+                delay = self._next_start - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self._next_start = loop.time() + self._min_interval
+            yield
+
+
+class DownloadScheduler:
+    """
+    Runs download jobs grouped by their backend host. Every host is throttled by its own limits, while different
+    hosts are accessed fully in parallel - many chains share the same engine's host (e.g. BinaProject, Cerberus and
+    Matrix), so limiting per chain would still flood it.
+    The jobs themselves are blocking (the scrapers are synchronous), so they run in a thread pool.
+    """
+
+    def __init__(
+        self,
+        default_limits: HostLimits = HostLimits(),
+        host_limits: Optional[Dict[str, HostLimits]] = None,
+    ):
+        self.default_limits: HostLimits = default_limits
+        self.host_limits: Dict[str, HostLimits] = host_limits or dict()
+
+    def get_limits(self, host: str) -> HostLimits:
+        return self.host_limits.get(host, self.default_limits)
+
+    def run(self, jobs: Iterable[DownloadJob]) -> List[JobResult]:
+        """
+        This method runs the given jobs and returns their results, in the order of the given jobs.
+        A failing job does not stop the others - its traceback is returned in its result.
+
+        :param jobs: The download jobs to run
+        """
+        return asyncio.run(self.run_async(list(jobs)))
+
+    async def run_async(self, jobs: List[DownloadJob]) -> List[JobResult]:
+        hosts = {job.host for job in jobs}
+        throttles = {host: _HostThrottle(self.get_limits(host)) for host in hosts}
+        max_workers = max(
+            1, sum(self.get_limits(host).max_concurrency for host in hosts)
+        )
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(
+                await asyncio.gather(
+                    *(
+                        self._run_job(job, throttles[job.host], executor)
+                        for job in jobs
+                    )
+                )
+            )
+
+    @staticmethod
+    async def _run_job(
+        job: DownloadJob, throttle: _HostThrottle, executor: ThreadPoolExecutor
+    ) -> JobResult:
+        async with throttle.slot():
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(
+                    executor, partial(job.func, *job.args)
+                )
+                return JobResult(job, result)
+            except Exception:
+                logging.warning(f"Download job {job.key or job.args} failed")
+                return JobResult(job, error=traceback.format_exc())
+
+
+def get_url_host(url: str) -> str:
+    return urlparse(url).netloc
+
+
+def download_url(url: str, file_path: str, timeout: float = 60) -> str:
+    """
+    This function downloads a given URL to a given path. The content is streamed to a temporary file, which is moved
+    into place only when the download completed.
+
+    :param url: A given URL
+    :param file_path: A given path to save the content to
+    :param timeout: A timeout in seconds for the connection and for every read
+    :return: The given file_path
+    """
+    tmp_path = f"{file_path}.{os.getpid()}.part"
+    try:
+        with requests.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f_out:
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    f_out.write(chunk)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return file_path
+
+
+def create_url_jobs(urls_to_paths: Dict[str, str]) -> List[DownloadJob]:
+    """
+    This function creates a download job for every given URL, throttled by the URL's host.
+
+    :param urls_to_paths: The path to save every URL to
+    """
+    return [
+        DownloadJob(get_url_host(url), download_url, (url, file_path), key=url)
+        for url, file_path in urls_to_paths.items()
+    ]
+
+
+def create_store_jobs(
+    stores: Iterable[Tuple[SupermarketChain, int]],
+    categories: List[FileTypesFilters],
+) -> List[DownloadJob]:
+    """
+    This function creates a job downloading the files of the given categories for every given store, throttled by
+    the backend host of the store's chain.
+
+    :param stores: (chain, store id) pairs
+    :param categories: The categories to download for every store
+    """
+    return [
+        DownloadJob(
+            chain.download_host,
+            download_xml_files,
+            (chain, store_id, categories),
+            key=(repr(type(chain)), store_id),
+        )
+        for chain, store_id in stores
+    ]
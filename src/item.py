@@ -1,8 +1,11 @@
 import json
 import re
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from bs4.element import Tag
+from lxml.etree import _Element
+
+from src.tag_schema import ITEM_TAG_PATTERNS, TagSchema
 
 
 class Item:
@@ -42,8 +45,35 @@ class Item:
             manufacturer=item.find(re.compile(r"Manufacture[r]?Name")).text,
         )
 
+    @classmethod
+    def from_element(cls, item: _Element, schema: Optional[TagSchema] = None):
+        """
+        This method creates an Item instance from an lxml element, as yielded by iterparse.
+        A schema should be shared by all the items of a file, so the chain's tag names are resolved only once.
+        """
+        if schema is None:
+            schema = TagSchema(ITEM_TAG_PATTERNS)
+        fields: Dict[str, str] = {
+            child.tag: child.text or "" for child in item if isinstance(child.tag, str)
+        }
+        return cls(
+            name=schema.get(fields, "ItemName"),
+            price=float(fields["ItemPrice"]),
+            price_by_measure=float(fields["UnitOfMeasurePrice"]),
+            code=fields["ItemCode"],
+            manufacturer=schema.get(fields, "ManufacturerName"),
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            k: v
+            for k, v in self.__dict__.items()
+            if not k.startswith("__") and not callable(k)
+        }
+
     def to_json(self):
         return json.dumps(self, default=lambda o: o.__dict__)
 
     def __repr__(self):
         return f"\nשם: {self.name}\nמחיר: {self.price}\nיצרן: {self.manufacturer}\nקוד: {self.code}\n"
+
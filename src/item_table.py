@@ -0,0 +1,190 @@
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.item import Item
+
+
+class ItemRow:
+    """
+    A lightweight view of a single row in an ItemTable.
+    It exposes the same attributes as Item, and writes to final_price (and promotions added with add_promotion) go
+    straight to the table.
+    """
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: "ItemTable", row: int):
+        self._table: ItemTable = table
+        self._row: int = row
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    @property
+    def name(self) -> str:
+        return self._table.names[self._row]
+
+    @property
+    def price(self) -> float:
+        return self._table.prices[self._row]
+
+    @property
+    def final_price(self) -> float:
+        return self._table.final_prices[self._row]
+
+    @final_price.setter
+    def final_price(self, final_price: float):
+        self._table.final_prices[self._row] = final_price
+
+    @property
+    def price_by_measure(self) -> float:
+        return self._table.prices_by_measure[self._row]
+
+    @property
+    def manufacturer(self) -> str:
+        return self._table.manufacturers[self._row]
+
+    @property
+    def code(self) -> str:
+        return self._table.codes[self._row]
+
+    @property
+    def promotions(self) -> List:
+        # Reading never adds the row to the sparse promotions map - promotions are added with add_promotion
+        return self._table.promotions.get(self._row, [])
+
+    def add_promotion(self, promotion: Dict) -> None:
+        self._table.add_promotion(self._row, promotion)
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "price": self.price,
+            "final_price": self.final_price,
+            "price_by_measure": self.price_by_measure,
+            "manufacturer": self.manufacturer,
+            "code": self.code,
+            "promotions": self._table.promotions.get(self._row, []),
+        }
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ItemRow)
+            and self._table is other._table
+            and self._row == other._row
+        )
+
+    def __hash__(self):
+        return hash((id(self._table), self._row))
+
+    def __repr__(self):
+        return f"\nשם: {self.name}\nמחיר: {self.price}\nיצרן: {self.manufacturer}\nקוד: {self.code}\n"
+
+
+class ItemTable:
+    """
+    A compact, columnar store of the items of a supermarket, keyed by their item codes.
+    Prices are kept in typed arrays, strings are kept in plain lists (manufacturers are interned, as they repeat a
+    lot), and promotions are kept only for the rows that have any. Lookups return ItemRow views, so the table can
+    replace a Dict[str, Item] wherever items_dict.get(code) is used.
+    """
+
+    def __init__(self, items: Iterable[Union[Item, ItemRow]] = ()):
+        self.codes: List[str] = list()
+        self.names: List[str] = list()
+        self.manufacturers: List[str] = list()
+        self.prices: array = array("d")
+        self.final_prices: array = array("d")
+        self.prices_by_measure: array = array("d")
+        self.promotions: Dict[int, List] = dict()
+        self._index: Dict[str, int] = dict()
+        self.update(items)
+
+    def add(self, item: Union[Item, ItemRow]) -> ItemRow:
+        """
+        This method adds a given item to the table. An existing item with the same code is overwritten (in place),
+        and its final price and promotions are reset - exactly like replacing an Item in a dictionary.
+
+        :param item: A given item
+        :return: A view of the item's row
+        """
+        row = self._index.get(item.code)
+        manufacturer = sys.intern(item.manufacturer) if item.manufacturer else ""
+        if row is None:
+            row = len(self.codes)
+            self._index[item.code] = row
+            self.codes.append(item.code)
+            self.names.append(item.name)
+            self.manufacturers.append(manufacturer)
+            self.prices.append(item.price)
+            self.final_prices.append(item.price)
+            self.prices_by_measure.append(item.price_by_measure)
+        else:
+            self.names[row] = item.name
+            self.manufacturers[row] = manufacturer
+            self.prices[row] = item.price
+            self.final_prices[row] = item.price
+            self.prices_by_measure[row] = item.price_by_measure
+            self.promotions.pop(row, None)
+        return ItemRow(self, row)
+
+    def add_promotion(self, row: int, promotion: Dict) -> None:
+        """
+        This method adds a given promotion to the promotions of a given row. Only rows with promotions are kept in
+        the promotions map.
+        """
+        self.promotions.setdefault(row, []).append(promotion)
+
+    def update(self, items: Iterable[Union[Item, ItemRow]]) -> None:
+        """
+        This method adds all the given items (or all the items of another ItemTable) to the table.
+        """
+        if isinstance(items, ItemTable):
+            items = items.values()
+        for item in items:
+            self.add(item)
+
+    def get(self, code: str, default=None) -> Optional[ItemRow]:
+        row = self._index.get(code)
+        return ItemRow(self, row) if row is not None else default
+
+    def row_of(self, code: str) -> Optional[int]:
+        return self._index.get(code)
+
+    def price_column(self) -> np.ndarray:
+        return np.array(self.prices, dtype=np.float64)
+
+    def final_price_column(self) -> np.ndarray:
+        return np.array(self.final_prices, dtype=np.float64)
+
+    def set_final_prices(self, final_prices: np.ndarray) -> None:
+        """
+        This method replaces the final prices column with a given array, aligned with the table's rows.
+        """
+        assert len(final_prices) == len(self.codes)
+        self.final_prices = array("d", np.asarray(final_prices, dtype=np.float64).tobytes())
+
+    def keys(self) -> Iterator[str]:
+        return iter(self.codes)
+
+    def values(self) -> Iterator[ItemRow]:
+        return (ItemRow(self, row) for row in range(len(self.codes)))
+
+    def items(self) -> Iterator[Tuple[str, ItemRow]]:
+        return ((code, ItemRow(self, row)) for row, code in enumerate(self.codes))
+
+    def __getitem__(self, code: str) -> ItemRow:
+        return ItemRow(self, self._index[code])
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.codes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+import zlib
+from os import path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+DEFAULT_BUCKETS = 64
+
+# (chain name, store id, date, the store's records - each with the barcode of its item as "code")
+StoreExport = Tuple[str, str, str, Iterable[dict]]
+
+
+def get_bucket(barcode: str, buckets: int) -> int:
+    """
+    This function returns the spill bucket of a given barcode. The hash is stable across processes and runs.
+    """
+    return zlib.crc32(barcode.encode("utf-8")) % buckets
+
+
+def _spill_store_exports(exports: Iterable[StoreExport], spill_dir: str, buckets: int) -> None:
+    """
+    This function writes every record of the given store exports to the spill file of its barcode's bucket, reading
+    every export once (records may be streamed).
+    """
+    bucket_files = dict()
+    try:
+        for chain, store_id, date, records in exports:
+            for record in records:
+                barcode = record["code"]
+                bucket = get_bucket(barcode, buckets)
+                f_out = bucket_files.get(bucket)
+                if f_out is None:
+                    f_out = bucket_files[bucket] = open(
+                        path.join(spill_dir, f"{bucket}.jsonl"), "w", encoding="utf-8"
+                    )
+                f_out.write(json.dumps([barcode, date, chain, store_id, record], ensure_ascii=False))
+                f_out.write("\n")
+    finally:
+        for f_out in bucket_files.values():
+            f_out.close()
+
+
+def get_record_path(date: str, chain: str, store_id: str) -> str:
+    """
+    This function returns the dotted path of a store's record in the document of its barcode.
+    """
+    return f"{date}.{chain}.{store_id}"
+
+
+def _merge_bucket(bucket_path: str) -> Dict[str, dict]:
+    merged = dict()
+    with open(bucket_path, "r", encoding="utf-8") as f_in:
+        for line in f_in:
+            barcode, date, chain, store_id, record = json.loads(line)
+            merged.setdefault(barcode, {})[get_record_path(date, chain, store_id)] = record
+    return merged
+
+
+def merge_store_exports(
+    exports: Iterable[StoreExport], buckets: int = DEFAULT_BUCKETS, spill_dir: Optional[str] = None
+) -> Iterator[Tuple[str, dict]]:
+    """
+    This function merges the per-store exports into a single update per barcode, shaped
+    {"date.chain.store_id": record} - the dotted paths of only the records that were exported, so setting them in the
+    database never touches the records of other stores and dates. A record exported more than once is taken from the
+    last export.
+    Merging is done in two linear passes: the exports are read once and their records are spilled to files by the
+    hash of their barcode, and then every bucket is grouped on its own. Only a single store export or a single
+    bucket is held in memory at a time, and documents are emitted as soon as their bucket is merged.
+
+    :param exports: (chain name, store id, date, records) tuples
+    :param buckets: The number of spill files - more buckets use less memory when merging
+    :param spill_dir: A directory for the spill files (a temporary directory by default)
+    :return: (barcode, update) tuples
+    """
+    with tempfile.TemporaryDirectory(dir=spill_dir) as bucket_dir:
+        _spill_store_exports(exports, bucket_dir, buckets)
+        for bucket in range(buckets):
+            bucket_path = path.join(bucket_dir, f"{bucket}.jsonl")
+            if not path.exists(bucket_path):
+                continue
+            merged = _merge_bucket(bucket_path)
+            os.remove(bucket_path)
+            yield from merged.items()
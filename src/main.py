@@ -33,15 +33,21 @@ from src.promotion import (
     log_promos_by_name,
     get_all_prices_with_promos,
 )
+from src.arrow_export import is_arrow_output_file, write_items_to_arrow
+from src.basket import log_basket_comparison, parse_basket
+from src.basket_optimizer import log_basket_optimization
+from src.ndjson_io import is_ndjson_file, write_ndjson
+from src.product_index import log_products_prices
 from src.store_utils import log_stores_ids
 from src.supermarket_chain import SupermarketChain
 from src.utils import (
     RESULTS_DIRNAME,
     RAW_FILES_DIRNAME,
     VALID_PROMOTION_FILE_EXTENSIONS,
-    log_products_prices,
-    valid_promotion_output_file,
+    VALID_PRICES_FILE_EXTENSIONS,
+    valid_output_file,
     is_valid_promotion_output_file,
+    is_valid_prices_output_file,
 )
 
 CHAINS_LIST = [
@@ -111,12 +117,30 @@ if __name__ == "__main__":
         nargs=1,
         type=SupermarketChain.store_id_type,
     )
+    parser.add_argument(
+        "--compare_basket",
+        help="compares the cost of a basket in all the monitored stores. Items are given as barcode or barcode:quantity",
+        metavar="barcode[:quantity]",
+        nargs="+",
+    )
+    parser.add_argument(
+        "--optimize_basket",
+        help="prints the promotions that minimise the cost of a basket in the requested store. Items are given as "
+        "barcode or barcode:quantity",
+        metavar="store_id barcode[:quantity]",
+        nargs="+",
+    )
     parser.add_argument(
         "--find_store_id",
-        help="prints all Shufersal stores in a given city. Input should be a city name in Hebrew",
+        help="prints all stores in a given city, in the given chain or in all chains. Input should be a city name in Hebrew",
         metavar="city",
         nargs=1,
     )
+    parser.add_argument(
+        "--fuzzy",
+        help="boolean flag representing whether --price should also print products with similar names",
+        action="store_true",
+    )
     parser.add_argument(
         "--load_prices",
         help="boolean flag representing whether to load an existing price XML file",
@@ -127,6 +151,12 @@ if __name__ == "__main__":
         help="boolean flag representing whether to load an existing promo XML file",
         action="store_true",
     )
+    parser.add_argument(
+        "--incremental_prices",
+        help="boolean flag representing whether to apply the latest non-full prices file onto the store's saved "
+        "prices, instead of loading the full prices file from scratch",
+        action="store_true",
+    )
     parser.add_argument(
         "--load_stores",
         help="boolean flag representing whether to load an existing stores XML file",
@@ -134,14 +164,13 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--chain",
-        required=True,
-        help="The name of the requested chain",
+        help="The name of the requested chain (optional for --find_store_id, which looks in all chains by default)",
         choices=CHAINS_DICT.keys(),
     )
     parser.add_argument(
         "--output_filename",
-        help="The path to write the promotions/prices to",
-        type=valid_promotion_output_file,
+        help="The path to write the promotions (csv, xlsx, parquet or arrow) or prices (json, ndjson, parquet or arrow) to",
+        type=valid_output_file,
     )
     parser.add_argument(
         "--only_export_to_file",
@@ -159,7 +188,9 @@ if __name__ == "__main__":
     else:
         logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(message)s")
 
-    chain: SupermarketChain = CHAINS_DICT[args.chain]
+    if args.chain is None and not (args.find_store_id or args.compare_basket):
+        parser.error("the following arguments are required: --chain")
+    chain: SupermarketChain = CHAINS_DICT.get(args.chain)
 
     if args.promos or args.prices_with_promos:
         arg_store_id = (
@@ -172,8 +203,12 @@ if __name__ == "__main__":
                 raise ValueError(
                     f"Output filename for promos must end with: {VALID_PROMOTION_FILE_EXTENSIONS}"
                 )
-            if args.prices_with_promos and not output_filename.endswith(".json"):
-                raise ValueError(f"Output filename for promos must be a json file")
+            if args.prices_with_promos and not is_valid_prices_output_file(
+                output_filename
+            ):
+                raise ValueError(
+                    f"Output filename for prices must end with: {VALID_PRICES_FILE_EXTENSIONS}"
+                )
             directory = os.path.dirname(output_filename)
             Path(directory).mkdir(parents=True, exist_ok=True)
         else:
@@ -197,18 +232,21 @@ if __name__ == "__main__":
                 chain=chain,
                 load_promos=args.load_promos,
                 load_prices=args.load_prices,
+                incremental_prices=args.incremental_prices,
             )
-            items_dict_to_json = {
-                item_code: {
-                    k: v
-                    for k, v in item.__dict__.items()
-                    if not k.startswith("__") and not callable(k)
+            if is_arrow_output_file(output_filename):
+                write_items_to_arrow(items_dict, output_filename)
+            elif is_ndjson_file(output_filename):
+                write_ndjson(
+                    (item.to_dict() for item in items_dict.values()), output_filename
+                )
+            else:
+                items_dict_to_json = {
+                    item_code: item.to_dict() for item_code, item in items_dict.items()
                 }
-                for item_code, item in items_dict.items()
-            }
 
-            with open(output_filename, "w") as fOut:
-                json.dump(items_dict_to_json, fOut)
+                with open(output_filename, "w") as fOut:
+                    json.dump(items_dict_to_json, fOut)
 
         if not args.only_export_to_file:
             opener = "open" if sys.platform == "darwin" else "xdg-open"
@@ -222,11 +260,32 @@ if __name__ == "__main__":
             store_id=args.price[0],
             load_xml=args.load_prices,
             product_name=args.price[1],
+            fuzzy=args.fuzzy,
         )
 
     elif args.find_store_id:
         arg_city = args.find_store_id[0]
-        log_stores_ids(city=arg_city, load_xml=args.load_stores, chain=chain)
+        log_stores_ids(
+            city=arg_city,
+            load_xml=args.load_stores,
+            chains=[chain] if chain else list(CHAINS_DICT.values()),
+        )
+
+    elif args.compare_basket:
+        log_basket_comparison(
+            basket=parse_basket(args.compare_basket),
+            stores=MONITORED_STORES,
+            chains_dict=CHAINS_DICT,
+            load_xml=args.load_prices,
+        )
+
+    elif args.optimize_basket:
+        log_basket_optimization(
+            chain,
+            store_id=int(args.optimize_basket[0]),
+            basket=parse_basket(args.optimize_basket[1:]),
+            load_xml=args.load_prices,
+        )
 
     elif args.find_promos_by_name:
         arg_store_id = int(args.find_promos_by_name[0])
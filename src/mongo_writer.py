@@ -0,0 +1,119 @@
+import logging
+import queue
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_PENDING_BATCHES = 4
+
+
+class BatchResult(NamedTuple):
+    batch_number: int
+    operations: int
+    seconds: float
+    upserted: int
+    modified: int
+    error: Optional[str]  # A description of the batch's failure, or None if all of its operations succeeded
+
+
+class BulkUpsertWriter:
+    """
+    A writer that upserts documents into a MongoDB collection in unordered bulk writes, instead of a round-trip per
+    document. Batches are sent from a background thread, so the caller keeps producing documents while a batch is
+    written. The number of batches waiting to be sent is bounded, so a slow database slows the producer down rather
+    than filling the memory.
+    A failing batch does not stop the writer - its error is reported with the results of the other batches.
+    """
+
+    def __init__(
+        self,
+        collection: Collection,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_pending_batches: int = DEFAULT_PENDING_BATCHES,
+    ):
+        self.collection: Collection = collection
+        self.batch_size: int = batch_size
+        self.results: List[BatchResult] = list()
+        self._batch: List[UpdateOne] = list()
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending_batches)
+        self._thread: threading.Thread = threading.Thread(
+            target=self._send_batches, name="BulkUpsertWriter", daemon=True
+        )
+        self._thread.start()
+
+    def upsert(self, document_id, fields: dict) -> None:
+        """
+        This method sets the given fields of the document with a given id, creating the document if needed.
+        """
+        self._batch.append(UpdateOne({"_id": document_id}, {"$set": fields}, upsert=True))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        This method queues the current batch to be sent.
+        """
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = list()
+
+    def close(self) -> List[BatchResult]:
+        """
+        This method sends the remaining operations and waits for all the batches to be written.
+
+        :return: The results of all the batches
+        """
+        if self._thread.is_alive():
+            self.flush()
+            self._queue.put(None)
+            self._thread.join()
+        return self.results
+
+    def __enter__(self) -> "BulkUpsertWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def operations(self) -> int:
+        return sum(result.operations for result in self.results)
+
+    @property
+    def failed_batches(self) -> List[BatchResult]:
+        return [result for result in self.results if result.error]
+
+    def _send_batches(self) -> None:
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            self.results.append(self._send_batch(len(self.results) + 1, batch))
+
+    def _send_batch(self, batch_number: int, batch: List[UpdateOne]) -> BatchResult:
+        start = time.perf_counter()
+        error = None
+        try:
+            result = self.collection.bulk_write(batch, ordered=False)
+            upserted, modified = result.upserted_count, result.modified_count
+        except BulkWriteError as e:
+            details = e.details or {}
+            upserted, modified = details.get("nUpserted", 0), details.get("nModified", 0)
+            write_errors = details.get("writeErrors", [])
+            error = f"{len(write_errors)} failed operations: " + "; ".join(
+                write_error.get("errmsg", "") for write_error in write_errors[:3]
+            )
+        except Exception as e:  # A connection error, a timeout etc. - the writer keeps going with the next batches
+            upserted = modified = 0
+            error = f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - start
+        if error:
+            logging.error(f"Batch {batch_number} ({len(batch)} operations) failed after {seconds:.2f}s: {error}")
+        else:
+            logging.debug(f"Batch {batch_number} ({len(batch)} operations) was written in {seconds:.2f}s")
+        return BatchResult(batch_number, len(batch), seconds, upserted, modified, error)
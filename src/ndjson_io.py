@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+from os import path
+from typing import Iterable, Iterator
+
+try:
+    import orjson
+except ImportError:  # orjson only makes encoding and decoding faster
+    orjson = None
+
+NDJSON_FILE_EXTENSIONS = [".ndjson", ".jsonl"]
+FLUSH_EVERY = 1000  # Records between flushes, so a killed run loses only its last few records
+
+
+def is_ndjson_file(file_name: str) -> bool:
+    return any(file_name.endswith(extension) for extension in NDJSON_FILE_EXTENSIONS)
+
+
+def dumps_line(record: dict) -> bytes:
+    """
+    This function encodes a given record as a single line of newline-delimited JSON.
+    """
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def loads_line(line: bytes) -> dict:
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+def _drop_truncated_last_line(output_filename: str) -> None:
+    """
+    This function removes the truncated last line a writer that died mid-record left in a given file, so appending
+    to the file doesn't corrupt the next record.
+    """
+    with open(output_filename, "r+b") as f_out:
+        end = f_out.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            chunk_start = max(0, position - 4096)
+            f_out.seek(chunk_start)
+            last_newline = f_out.read(position - chunk_start).rfind(b"\n")
+            if last_newline != -1:
+                position = chunk_start + last_newline + 1
+                break
+            position = chunk_start
+        if position != end:
+            logging.warning(f"Dropping the truncated last record of {output_filename}")
+            f_out.truncate(position)
+
+
+def write_ndjson(records: Iterable[dict], output_filename: str, append: bool = False) -> int:
+    """
+    This function writes the given records to a newline-delimited JSON file, a record per line, as they are produced.
+    The file is flushed every FLUSH_EVERY records, so the records written before a crash can still be read.
+
+    :param records: A given iterable of records
+    :param output_filename: A given file to write to
+    :param append: Whether to append the records to the file if it exists (otherwise it is overwritten)
+    :return: The number of written records
+    """
+    if append and path.isfile(output_filename):
+        _drop_truncated_last_line(output_filename)
+    num_of_records = 0
+    with open(output_filename, "ab" if append else "wb") as f_out:
+        for num_of_records, record in enumerate(records, start=1):
+            f_out.write(dumps_line(record))
+            if num_of_records % FLUSH_EVERY == 0:
+                f_out.flush()
+    return num_of_records
+
+
+def iter_ndjson(input_filename: str) -> Iterator[dict]:
+    """
+    This function reads the records of a newline-delimited JSON file one at a time.
+    A file whose writer died mid-record ends with a truncated line - that line is skipped, and the complete records
+    before it are returned.
+
+    :param input_filename: A given file to read
+    """
+    with open(input_filename, "rb") as f_in:
+        for line in f_in:
+            if not line.strip():
+                continue
+            try:
+                yield loads_line(line)
+            except ValueError:
+                if line.endswith(b"\n"):
+                    raise
+                logging.warning(f"Skipping the truncated last record of {input_filename}")
@@ -0,0 +1,123 @@
+import csv
+import io
+import logging
+import time
+from typing import Iterable
+
+STAGING_TABLE = "price_staging"
+STAGING_COLUMNS = ["code", "name", "price", "final_price", "price_by_measure", "manufacturer"]
+PRICE_COLUMNS = ["price", "final_price", "price_by_measure"]
+
+CREATE_STAGING_TABLE = f"""
+CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+    code text,
+    name text,
+    price numeric,
+    final_price numeric,
+    price_by_measure numeric,
+    manufacturer text
+) ON COMMIT DELETE ROWS
+"""
+COPY_TO_STAGING = (
+    f"COPY {STAGING_TABLE} ({', '.join(STAGING_COLUMNS)}) FROM STDIN "
+    f"WITH (FORMAT csv, FORCE_NULL ({', '.join(PRICE_COLUMNS)}))"
+)
+MERGE_PRODUCT_NAMES = f"SELECT insert_product_name(code, name, %(chain)s) FROM {STAGING_TABLE}"
+MERGE_PRICES = (
+    "SELECT insert_price(code, price, final_price, price_by_measure, manufacturer, "
+    f"%(chain)s, %(date)s, %(store_id)s) FROM {STAGING_TABLE}"
+)
+
+REMOVALS_STAGING_TABLE = "price_removal_staging"
+REMOVALS_TABLE = "price_removals"
+CREATE_REMOVALS_STAGING_TABLE = f"""
+CREATE TEMP TABLE IF NOT EXISTS {REMOVALS_STAGING_TABLE} (
+    code text
+) ON COMMIT DELETE ROWS
+"""
+CREATE_REMOVALS_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {REMOVALS_TABLE} (
+    code text,
+    chain int,
+    store_id int,
+    date date
+)
+"""
+COPY_TO_REMOVALS_STAGING = f"COPY {REMOVALS_STAGING_TABLE} (code) FROM STDIN WITH (FORMAT csv)"
+MERGE_REMOVALS = (
+    f"INSERT INTO {REMOVALS_TABLE} (code, chain, store_id, date) "
+    f"SELECT code, %(chain)s, %(store_id)s, %(date)s FROM {REMOVALS_STAGING_TABLE}"
+)
+
+
+def create_copy_buffer(records: Iterable[dict]) -> io.StringIO:
+    """
+    This function writes the given price records as the CSV payload of a COPY into the staging table.
+    Every string (and missing value) is quoted, so an empty name stays an empty string, while an empty price is
+    forced to NULL by the COPY.
+
+    :param records: Item dictionaries, as returned by Item.to_dict
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+    for record in records:
+        writer.writerow([record.get(column) for column in STAGING_COLUMNS])
+    buffer.seek(0)
+    return buffer
+
+
+def create_codes_buffer(codes: Iterable[str]) -> io.StringIO:
+    """
+    This function writes the given item codes as the CSV payload of a COPY into the removals staging table.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator="\n")
+    for code in codes:
+        writer.writerow([code])
+    buffer.seek(0)
+    return buffer
+
+
+def copy_store_prices(
+    conn, records: Iterable[dict], chain_index: int, store_id: int, date: str, removed_codes: Iterable[str] = ()
+) -> int:
+    """
+    This function ingests the prices of a given store into the database in a single transaction. The rows are
+    COPY-ed into a temporary staging table, and the product names and the prices are merged from it with one
+    statement each, instead of a round-trip per row. The codes of the items the store stopped selling are COPY-ed
+    into a staging table of their own and recorded in the removals table, in the same transaction.
+
+    :param conn: A psycopg2 connection
+    :param records: The store's item dictionaries, as returned by Item.to_dict
+    :param chain_index: The chain's id in the database
+    :param store_id: A given store id
+    :param date: The date of the prices
+    :param removed_codes: The codes of the items the store stopped selling
+    :return: The number of ingested rows
+    """
+    start = time.perf_counter()
+    params = {"chain": chain_index, "date": date, "store_id": int(store_id)}
+    removed_codes = list(removed_codes)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(CREATE_STAGING_TABLE)
+            cur.execute(f"TRUNCATE {STAGING_TABLE}")
+            cur.copy_expert(COPY_TO_STAGING, create_copy_buffer(records))
+            rows = cur.rowcount
+            cur.execute(MERGE_PRODUCT_NAMES, params)
+            cur.execute(MERGE_PRICES, params)
+            if removed_codes:
+                cur.execute(CREATE_REMOVALS_STAGING_TABLE)
+                cur.execute(CREATE_REMOVALS_TABLE)
+                cur.execute(f"TRUNCATE {REMOVALS_STAGING_TABLE}")
+                cur.copy_expert(COPY_TO_REMOVALS_STAGING, create_codes_buffer(removed_codes))
+                cur.execute(MERGE_REMOVALS, params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    logging.debug(
+        f"Ingested {rows} prices and {len(removed_codes)} removals of store {store_id} "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return rows
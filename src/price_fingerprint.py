@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+import pickle
+from array import array
+from os import path
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from src.item_table import ItemTable
+from src.supermarket_chain import SupermarketChain
+from src.utils import RAW_FILES_DIRNAME
+
+FINGERPRINT_VERSION = 1
+
+
+class StoreDiff(NamedTuple):
+    changed: List[str]  # Codes of the items that are new in the store, or whose name, manufacturer or prices changed
+    removed: List[str]  # Codes of the items the store stopped selling
+
+
+def get_item_digest(name: str, manufacturer: str, price: float, final_price: float, price_by_measure: float) -> int:
+    """
+    This function returns a 64 bit digest of the fields of an item that are written to the databases.
+    """
+    fields = f"{name}\0{manufacturer}\0{price!r}\0{final_price!r}\0{price_by_measure!r}"
+    return int.from_bytes(hashlib.blake2b(fields.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class StoreFingerprint:
+    """
+    A compact summary of the items of a store, as last written to the databases: the item codes and a 64 bit digest
+    of every item's fields. Comparing the fingerprints of two days tells which items changed without keeping the
+    previous day's items.
+    """
+
+    def __init__(self, codes: List[str] = None, digests: array = None):
+        self.codes: List[str] = codes if codes is not None else list()
+        self.digests: array = digests if digests is not None else array("Q")
+
+    @classmethod
+    def from_items(cls, items_dict: ItemTable):
+        return cls(
+            list(items_dict.codes),
+            array(
+                "Q",
+                map(
+                    get_item_digest,
+                    items_dict.names,
+                    items_dict.manufacturers,
+                    items_dict.prices,
+                    items_dict.final_prices,
+                    items_dict.prices_by_measure,
+                ),
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def diff(self, new: "StoreFingerprint") -> StoreDiff:
+        """
+        This method returns the changes from this fingerprint to a newer fingerprint of the same store.
+        """
+        previous_digests = dict(zip(self.codes, self.digests))
+        changed = [
+            code for code, digest in zip(new.codes, new.digests) if previous_digests.pop(code, None) != digest
+        ]
+        return StoreDiff(changed, removed=list(previous_digests))
+
+    @classmethod
+    def load(cls, fingerprint_path: str):
+        """
+        This method loads a fingerprint saved to a given path, or returns an empty fingerprint if there is no valid
+        one (so every item is considered new).
+        """
+        if path.isfile(fingerprint_path):
+            try:
+                with open(fingerprint_path, "rb") as f_in:
+                    version, codes, digests = pickle.load(f_in)
+                if version == FINGERPRINT_VERSION:
+                    return cls(codes, digests)
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError) as e:
+                logging.debug(f"Ignoring invalid fingerprint {fingerprint_path}: {e}")
+        return cls()
+
+    def save(self, fingerprint_path: str) -> None:
+        """
+        This method saves the fingerprint to a given path. It is written to a temporary file first, so a failed write
+        never corrupts the previous fingerprint.
+        """
+        tmp_path = f"{fingerprint_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f_out:
+                pickle.dump((FINGERPRINT_VERSION, self.codes, self.digests), f_out, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, fingerprint_path)
+        finally:
+            if path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def get_fingerprint_path(chain: SupermarketChain, store_id: int) -> str:
+    return path.join(RAW_FILES_DIRNAME, f"{repr(type(chain))}-Fingerprint-{store_id}.fingerprint")
+
+
+def get_pg_fingerprint_path(chain: SupermarketChain, store_id: int) -> str:
+    """
+    This function returns the path of the fingerprint of a store's items as last written to Postgres. Postgres is
+    written to right away, so its fingerprint is kept apart from the one of the exports waiting to be merged into
+    Mongo.
+    """
+    return path.join(RAW_FILES_DIRNAME, f"{repr(type(chain))}-PgFingerprint-{store_id}.fingerprint")
+
+
+def get_pending_fingerprint_path(chain: SupermarketChain, store_id: int) -> str:
+    """
+    This function returns the path of the fingerprint of a store's changes which were exported, but not written to
+    all the databases yet.
+    """
+    return f"{get_fingerprint_path(chain, store_id)}.pending"
+
+
+def commit_pending_fingerprint(chain: SupermarketChain, store_id: int) -> bool:
+    """
+    This function makes the pending fingerprint of a given store its fingerprint, once the store's exported changes
+    were written, so the next diff starts from them.
+
+    :return: Whether there was a pending fingerprint
+    """
+    pending_path = get_pending_fingerprint_path(chain, store_id)
+    if not path.isfile(pending_path):
+        return False
+    os.replace(pending_path, get_fingerprint_path(chain, store_id))
+    return True
+
+
+def diff_store_items(
+    chain: SupermarketChain, store_id: int, items_dict: ItemTable, fingerprint_path: Optional[str] = None
+) -> Tuple[StoreDiff, StoreFingerprint]:
+    """
+    This function compares the items of a given store with the items last written for it.
+    The new fingerprint is not saved - it should be saved only once the changes were written, so failed writes are
+    retried on the next run.
+
+    :param chain: A given supermarket chain
+    :param store_id: A given store id
+    :param items_dict: The store's current items, with their final prices
+    :param fingerprint_path: The path of the fingerprint to compare with, the store's fingerprint by default
+    :return: The changes, and the store's new fingerprint
+    """
+    fingerprint = StoreFingerprint.from_items(items_dict)
+    if fingerprint_path is None:
+        fingerprint_path = get_fingerprint_path(chain, store_id)
+    store_diff = StoreFingerprint.load(fingerprint_path).diff(fingerprint)
+    logging.debug(
+        f"{len(store_diff.changed)} changed and {len(store_diff.removed)} removed items "
+        f"out of {len(fingerprint)} in store {store_id}"
+    )
+    return store_diff, fingerprint
+
+
+def iter_diff_records(items_dict: ItemTable, store_diff: StoreDiff) -> Iterator[dict]:
+    """
+    This function yields the records to write for the changes of a store: the new and changed items, and a tombstone
+    for every removed item.
+    """
+    for code in store_diff.changed:
+        yield items_dict[code].to_dict()
+    for code in store_diff.removed:
+        yield {"code": code, "removed": True}
@@ -0,0 +1,160 @@
+import logging
+import os
+from datetime import date, timedelta
+from os import path
+from typing import Iterable, List, Optional, Union
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # The history store is optional - only the mining server needs it
+    pa = ds = pq = None
+
+from src.item_table import ItemTable
+
+HISTORY_DIRNAME = "price_history"
+HISTORY_COLUMNS = ["code", "name", "manufacturer", "price", "final_price", "price_by_measure", "store_id"]
+PRICE_COLUMNS = ["code", "price", "final_price", "price_by_measure", "store_id"]
+ROW_GROUP_SIZE = 16384
+
+
+def _check_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("The price history store requires pyarrow (pip install pyarrow)")
+
+
+def _get_partitioning():
+    return ds.partitioning(pa.schema([("date", pa.string()), ("chain", pa.string())]), flavor="hive")
+
+
+def get_partition_dir(chain_name: str, day: Union[date, str], history_dir: str = HISTORY_DIRNAME) -> str:
+    return path.join(history_dir, f"date={day}", f"chain={chain_name}")
+
+
+def get_history_file_path(
+    chain_name: str, store_id: int, day: Union[date, str], history_dir: str = HISTORY_DIRNAME
+) -> str:
+    return path.join(get_partition_dir(chain_name, day, history_dir), f"{store_id}.parquet")
+
+
+def write_store_prices(
+    items_dict: ItemTable,
+    chain_name: str,
+    store_id: int,
+    day: Union[date, str],
+    history_dir: str = HISTORY_DIRNAME,
+) -> str:
+    """
+    This function appends the prices of a given store in a given day to the price history. The history is partitioned
+    by date and chain, with a single file per store, so writing a store again in the same day replaces its file.
+    Rows are sorted by item code, so the row groups' statistics let code lookups skip most of the file.
+
+    :param items_dict: The items of the store, with their final prices
+    :param chain_name: The name of the store's chain
+    :param store_id: A given store id
+    :param day: The day of the prices
+    :param history_dir: The root directory of the history
+    :return: The path of the written file
+    """
+    _check_pyarrow()
+    table = pa.table(
+        {
+            "code": pa.array(items_dict.codes, pa.string()),
+            "name": pa.array(items_dict.names, pa.string()),
+            "manufacturer": pa.array(items_dict.manufacturers, pa.string()),
+            "price": pa.array(items_dict.prices, pa.float64()),
+            "final_price": pa.array(items_dict.final_prices, pa.float64()),
+            "price_by_measure": pa.array(items_dict.prices_by_measure, pa.float64()),
+            "store_id": pa.array([int(store_id)] * len(items_dict), pa.int64()),
+        }
+    ).sort_by("code")
+
+    file_path = get_history_file_path(chain_name, store_id, day, history_dir)
+    os.makedirs(path.dirname(file_path), exist_ok=True)
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        pq.write_table(
+            table,
+            tmp_path,
+            row_group_size=ROW_GROUP_SIZE,
+            compression="zstd",
+            use_dictionary=["name", "manufacturer"],
+        )
+        os.replace(tmp_path, file_path)
+    finally:
+        if path.exists(tmp_path):
+            os.remove(tmp_path)
+    return file_path
+
+
+def _find_history_files(
+    history_dir: str, start_date: date, end_date: date, chain_names: Optional[Iterable[str]]
+) -> List[str]:
+    """
+    This function lists the files of the partitions in the given range of dates and chains, without looking into
+    any other partition.
+    """
+    if not path.isdir(history_dir):
+        return []
+    chain_names = set(chain_names) if chain_names is not None else None
+    files = list()
+    for date_dir in sorted(os.listdir(history_dir)):
+        _, _, day = date_dir.partition("date=")
+        if not day or not str(start_date) <= day <= str(end_date):
+            continue
+        for chain_dir in sorted(os.listdir(path.join(history_dir, date_dir))):
+            _, _, chain_name = chain_dir.partition("chain=")
+            if not chain_name or (chain_names is not None and chain_name not in chain_names):
+                continue
+            partition_dir = path.join(history_dir, date_dir, chain_dir)
+            files.extend(
+                path.join(partition_dir, file_name)
+                for file_name in sorted(os.listdir(partition_dir))
+                if file_name.endswith(".parquet")
+            )
+    return files
+
+
+def read_price_history(
+    codes: Iterable[str],
+    days: int = 90,
+    end_date: Optional[date] = None,
+    chain_names: Optional[Iterable[str]] = None,
+    columns: Iterable[str] = PRICE_COLUMNS,
+    history_dir: str = HISTORY_DIRNAME,
+) -> pd.DataFrame:
+    """
+    This function returns the prices of the given items across the stores in the given period.
+    Only the partitions of the period (and of the given chains) are opened, and only the requested columns are read.
+
+    :param codes: A given list of item codes
+    :param days: The number of days to look back
+    :param end_date: The last day of the period (today by default)
+    :param chain_names: The chains to look in (all of them by default)
+    :param columns: The columns to read (the date and chain are always returned)
+    :param history_dir: The root directory of the history
+    :return: A row for every item, store and day, sorted by the item code, date, chain and store
+    """
+    _check_pyarrow()
+    end_date = end_date or date.today()
+    start_date = end_date - timedelta(days=days - 1)
+    columns = list(dict.fromkeys(["code", *columns, "store_id"]))
+    files = _find_history_files(history_dir, start_date, end_date, chain_names)
+    if not files:
+        return pd.DataFrame(columns=["date", "chain", *columns])
+
+    dataset = ds.dataset(
+        files, format="parquet", partitioning=_get_partitioning(), partition_base_dir=history_dir
+    )
+    table = dataset.to_table(
+        columns=["date", "chain", *columns], filter=ds.field("code").isin(list(codes))
+    )
+    logging.debug(f"Read {table.num_rows} price history rows from {len(files)} files")
+    return (
+        table.to_pandas()
+        .sort_values(["code", "date", "chain", "store_id"])
+        .reset_index(drop=True)
+    )
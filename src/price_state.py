@@ -0,0 +1,144 @@
+import logging
+import os
+import pickle
+from os import path
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from il_supermarket_scarper.main import FileTypesFilters
+
+from src.item import Item
+from src.item_table import ItemTable
+from src.snapshot_cache import get_file_hash
+from src.supermarket_chain import SupermarketChain
+from src.utils import (
+    RAW_FILES_DIRNAME,
+    download_xml_files,
+    get_recorded_file_name,
+    parse_price_updates_from_xml,
+    xml_file_gen,
+)
+
+PRICE_STATE_VERSION = 1
+
+
+class PriceState:
+    """
+    The prices of a single store: the items of its last full prices file, with the newer non-full prices files
+    applied onto them. Every item keeps the update date of its price, so an older price never overrides a newer one.
+    """
+
+    def __init__(self):
+        self.base_hash: Optional[str] = None  # The content hash of the full prices file the state is based on
+        self.applied_deltas: Set[str] = set()  # Names of the non-full prices files applied since
+        self.items: ItemTable = ItemTable()
+        self.update_dates: Dict[str, str] = dict()
+
+    def rebase(self, base_hash: str, price_updates: Iterable[Tuple[Item, str]]) -> None:
+        """
+        This method replaces the state with the items of a new full prices file.
+
+        :param base_hash: The content hash of the full prices file
+        :param price_updates: The (item, price update date) pairs of the file
+        """
+        self.base_hash = base_hash
+        self.applied_deltas = set()
+        self.items = ItemTable()
+        self.update_dates = dict()
+        for item, update_date in price_updates:
+            self.items.add(item)
+            self.update_dates[item.code] = update_date
+
+    def apply_delta(
+        self, delta_name: str, price_updates: Iterable[Tuple[Item, str]]
+    ) -> int:
+        """
+        This method applies the items of a non-full prices file onto the state, in their price update date order.
+        Items whose price is older than the price already in the state are skipped.
+
+        :param delta_name: The name of the non-full prices file
+        :param price_updates: The (item, price update date) pairs of the file
+        :return: The number of updated items
+        """
+        num_of_updates = 0
+        for item, update_date in sorted(price_updates, key=lambda update: update[1]):
+            current_update_date = self.update_dates.get(item.code)
+            if current_update_date and update_date and update_date < current_update_date:
+                continue
+            self.items.add(item)
+            self.update_dates[item.code] = update_date
+            num_of_updates += 1
+        self.applied_deltas.add(delta_name)
+        return num_of_updates
+
+    @classmethod
+    def load(cls, state_path: str):
+        """
+        This method loads a state saved to a given path, or returns an empty state if there is no valid one.
+        """
+        if path.isfile(state_path):
+            try:
+                with open(state_path, "rb") as f_in:
+                    version, state = pickle.load(f_in)
+                if version == PRICE_STATE_VERSION:
+                    return state
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError) as e:
+                logging.debug(f"Ignoring invalid price state {state_path}: {e}")
+        return cls()
+
+    def save(self, state_path: str) -> None:
+        """
+        This method saves the state to a given path. The state is written to a temporary file first, so a failed
+        write never corrupts the previous state.
+        """
+        tmp_path = f"{state_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f_out:
+                pickle.dump((PRICE_STATE_VERSION, self), f_out, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, state_path)
+        finally:
+            if path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def get_price_state_path(chain: SupermarketChain, store_id: int) -> str:
+    return path.join(RAW_FILES_DIRNAME, f"{repr(type(chain))}-PriceState-{store_id}.state")
+
+
+def update_price_state(chain: SupermarketChain, store_id: int, load_prices: bool = False) -> ItemTable:
+    """
+    This function brings the persisted price state of a given store up to date, and returns its items.
+    The state is rebuilt only when a new full prices file appears (the chains publish one a day). Otherwise, only the
+    latest non-full prices file is applied onto the state, unless it was applied already. Non-full files that were
+    published between two updates are not applied, so a store that must be complete is loaded from its full file.
+    Both files are fetched through the download manifest, so a file that was already downloaded (e.g. prefetched) is
+    neither listed nor downloaded again.
+
+    :param chain: A given supermarket chain
+    :param store_id: A given store id
+    :param load_prices: A boolean representing whether to use the prices files on disk without checking the chain
+    :return: A table of the store's items, keyed by their item codes
+    """
+    state_path = get_price_state_path(chain, store_id)
+    state = PriceState.load(state_path)
+
+    download_xml_files(
+        chain,
+        store_id,
+        [FileTypesFilters.PRICE_FULL_FILE, FileTypesFilters.PRICE_FILE],
+        check_latest=not load_prices,
+    )
+    full_xml_path = xml_file_gen(chain, store_id, FileTypesFilters.PRICE_FULL_FILE.name)
+    if path.isfile(full_xml_path):
+        full_hash = get_file_hash(full_xml_path)
+        if full_hash != state.base_hash:
+            logging.debug(f"Rebasing the price state of {state_path} on {full_xml_path}")
+            state.rebase(full_hash, parse_price_updates_from_xml(chain, full_xml_path))
+
+    delta_xml_path = xml_file_gen(chain, store_id, FileTypesFilters.PRICE_FILE.name)
+    delta_name = get_recorded_file_name(chain, store_id, FileTypesFilters.PRICE_FILE, delta_xml_path)
+    if delta_name is not None and delta_name not in state.applied_deltas:
+        num_of_updates = state.apply_delta(delta_name, parse_price_updates_from_xml(chain, delta_xml_path))
+        logging.debug(f"Applied {num_of_updates} price updates from {delta_name}")
+
+    state.save(state_path)
+    return state.items
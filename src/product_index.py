@@ -0,0 +1,186 @@
+import logging
+import os
+import pickle
+from array import array
+from bisect import bisect_left
+from os import path
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.item_table import ItemRow, ItemTable
+from src.supermarket_chain import SupermarketChain
+from src.text_utils import normalize_hebrew
+from src.utils import (
+    RAW_FILES_DIRNAME,
+    create_items_dict,
+    download_xml_files,
+    get_price_file_types,
+    xml_file_gen,
+)
+
+PRODUCT_INDEX_VERSION = 1
+N_GRAM = 3
+
+
+def get_ngrams(text: str, n: int = N_GRAM) -> Set[str]:
+    return {text[i : i + n] for i in range(len(text) - n + 1)}
+
+
+class ProductIndex:
+    """
+    An inverted index of the character n-grams in the normalised names of a store's items.
+    The items are ranked by their price by measure when the index is built, and every posting list is kept in rank
+    order - so matches come out already sorted by price, and a limited lookup stops at the first matches.
+    """
+
+    def __init__(self, items: ItemTable):
+        self.items: ItemTable = items
+        self._rows: array = array(
+            "I", sorted(range(len(items)), key=lambda row: items.prices_by_measure[row])
+        )  # The table row of every rank
+        self._names: List[str] = [normalize_hebrew(items.names[row]) for row in self._rows]
+        self._num_of_ngrams: array = array("I")
+        self._postings: Dict[str, array] = dict()
+        for rank, name in enumerate(self._names):
+            ngrams = get_ngrams(name)
+            self._num_of_ngrams.append(len(ngrams))
+            for ngram in ngrams:
+                self._postings.setdefault(ngram, array("I")).append(rank)
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[ItemRow]:
+        """
+        This method returns the items whose names contain a given query, sorted by their price by measure.
+        The names and the query are compared after normalisation. Queries shorter than N_GRAM characters have no
+        n-grams to look up, so they are matched against all the names.
+
+        :param query: A given product name, or a part of it
+        :param limit: The maximal number of items to return
+        """
+        query = normalize_hebrew(query)
+        ngrams = get_ngrams(query)
+        if ngrams:
+            if any(ngram not in self._postings for ngram in ngrams):
+                return []
+            postings = sorted((self._postings[ngram] for ngram in ngrams), key=len)
+            candidates = (
+                rank
+                for rank in postings[0]
+                if all(_is_in_posting(posting, rank) for posting in postings[1:])
+            )
+        else:
+            candidates = range(len(self._names))
+
+        matches = list()
+        for rank in candidates:
+            if query in self._names[rank]:
+                matches.append(ItemRow(self.items, self._rows[rank]))
+                if limit is not None and len(matches) == limit:
+                    break
+        return matches
+
+    def fuzzy_search(
+        self, query: str, min_similarity: float = 0.5, limit: Optional[int] = None
+    ) -> List[ItemRow]:
+        """
+        This method returns the items whose names are similar to a given query, sorted by their price by measure.
+        The similarity of a name is the Jaccard similarity of its n-grams and the query's n-grams, so misspelled or
+        reordered names are found as well.
+
+        :param query: A given product name
+        :param min_similarity: The minimal similarity of a returned item, between 0 and 1
+        :param limit: The maximal number of items to return
+        """
+        ngrams = get_ngrams(normalize_hebrew(query))
+        shared_ngrams: Dict[int, int] = dict()
+        for ngram in ngrams:
+            for rank in self._postings.get(ngram, ()):
+                shared_ngrams[rank] = shared_ngrams.get(rank, 0) + 1
+
+        matching_ranks = sorted(
+            rank
+            for rank, num_of_shared in shared_ngrams.items()
+            if num_of_shared / (len(ngrams) + self._num_of_ngrams[rank] - num_of_shared)
+            >= min_similarity
+        )
+        return [ItemRow(self.items, self._rows[rank]) for rank in matching_ranks[:limit]]
+
+
+def _is_in_posting(posting: array, rank: int) -> bool:
+    i = bisect_left(posting, rank)
+    return i < len(posting) and posting[i] == rank
+
+
+def get_product_index_path(chain: SupermarketChain, store_id: int) -> str:
+    return path.join(RAW_FILES_DIRNAME, f"{repr(type(chain))}-ProductIndex-{store_id}.index")
+
+
+def _get_index_sources(chain: SupermarketChain, store_id: int) -> Dict[str, Tuple[int, int]]:
+    """
+    This function returns the size and modification time of every prices file of a given store, by its category.
+    """
+    sources = dict()
+    for category in get_price_file_types(include_non_full_price_file=True):
+        xml_path = xml_file_gen(chain, store_id, category.name)
+        if path.isfile(xml_path):
+            stat = os.stat(xml_path)
+            sources[category.name] = (stat.st_size, stat.st_mtime_ns)
+    return sources
+
+
+def get_product_index(chain: SupermarketChain, store_id: int, load_xml: bool) -> ProductIndex:
+    """
+    This function returns the product index of a given store. The index is saved next to the prices files, and is
+    built again only when the prices files change.
+
+    :param chain: A given supermarket chain
+    :param store_id: A given store id
+    :param load_xml: A boolean representing whether to load an existing prices xml file
+    """
+    download_xml_files(
+        chain, store_id, get_price_file_types(include_non_full_price_file=True), check_latest=not load_xml
+    )
+    sources = _get_index_sources(chain, store_id)
+    index_path = get_product_index_path(chain, store_id)
+    if path.isfile(index_path):
+        try:
+            with open(index_path, "rb") as f_in:
+                version, index_sources, index = pickle.load(f_in)
+            if version == PRODUCT_INDEX_VERSION and index_sources == sources:
+                return index
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError) as e:
+            logging.debug(f"Ignoring invalid product index {index_path}: {e}")
+
+    index = ProductIndex(create_items_dict(chain, store_id, load_xml, True))
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f_out:
+            pickle.dump((PRODUCT_INDEX_VERSION, sources, index), f_out, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+    finally:
+        if path.exists(tmp_path):
+            os.remove(tmp_path)
+    return index
+
+
+def log_products_prices(
+    chain: SupermarketChain,
+    store_id: int,
+    load_xml: bool,
+    product_name: str,
+    fuzzy: bool = False,
+) -> None:
+    """
+    This function prints the products in a given store which contains a given product_name, sorted by their price by
+    measure.
+
+    :param chain: A given supermarket chain
+    :param store_id: A given store id
+    :param product_name: A given product name
+    :param load_xml: A boolean representing whether to load an existing xml or load an already saved one
+    :param fuzzy: Whether to print products with similar names as well
+    """
+    index = get_product_index(chain, store_id, load_xml)
+    products = (
+        index.fuzzy_search(product_name) if fuzzy else index.search(product_name)
+    )
+    for prod in products:
+        logging.info(prod)
@@ -1,22 +1,31 @@
 import csv
 import logging
-import re
 import sys
 from datetime import datetime
-from typing import Dict, List, Union
+from itertools import compress
+from typing import Iterator, List, NamedTuple, Optional, Tuple, Union
 
-import pandas as pd
+import numpy as np
 import xlsxwriter
 from enum import Enum
-from bs4.element import Tag
 from tqdm import tqdm
 
+from src.arrow_export import (
+    get_promotions_schema,
+    is_arrow_output_file,
+    write_rows_to_arrow,
+)
 from src.item import Item
+from src.item_table import ItemTable
+from src.price_state import update_price_state
+from src.promotion_record import PromotionRecord
 from src.supermarket_chain import SupermarketChain
 from src.utils import (
-    create_bs_object,
     create_items_dict,
-    get_float_from_tag,
+    download_xml_files,
+    get_float_from_record,
+    get_price_file_types,
+    iter_promotion_records,
     xml_file_gen,
 )
 from src.utils import (
@@ -25,6 +34,7 @@ from src.utils import (
 from il_supermarket_scarper.main import FileTypesFilters
 
 INVALID_OR_UNKNOWN_PROMOTION_FUNCTION = -1
+UNKNOWN_PROMOTION_COEFFICIENTS = (0, INVALID_OR_UNKNOWN_PROMOTION_FUNCTION, 1)
 
 PROMOTIONS_TABLE_HEADERS = [
     "תיאור מבצע",
@@ -55,10 +65,12 @@ class ClubID(Enum):
 
     @classmethod
     def _missing_(cls, value):
-        return ClubID.OTHER
+        return next(
+            (club_id for club_id in cls if club_id.value[0] == value), ClubID.OTHER
+        )
 
     def __str__(self):
-        return self.string
+        return self.value[1]
 
 
 class RewardType(Enum):
@@ -87,24 +99,36 @@ class Promotion:
         end_date: datetime,
         update_date: datetime,
         items: List[Item],
-        promo_func: callable,
+        rule: "PromotionRule",
         club_id: ClubID,
         promotion_id: int,
         max_qty: int,
         allow_multiple_discounts: bool,
         reward_type: RewardType,
+        min_purchase_amount: float = 0,
     ):
         self.content: str = content
         self.start_date: datetime = start_date
         self.end_date: datetime = end_date
         self.update_date: datetime = update_date
-        self.promo_func: callable = promo_func
+        self.rule: PromotionRule = rule
         self.items: List[Item] = items
         self.club_id: ClubID = club_id
         self.max_qty: int = max_qty
         self.allow_multiple_discounts: bool = allow_multiple_discounts
         self.reward_type: RewardType = reward_type
         self.promotion_id: int = promotion_id
+        self.min_purchase_amount: float = min_purchase_amount  # The spend that entitles to the promotion, if any
+
+    @property
+    def promo_func(self) -> "PromotionRule":
+        return self.rule
+
+    def get_discounted_prices(self) -> np.ndarray:
+        """
+        This method returns the price of every participating item after the promotion, aligned with self.items.
+        """
+        return self.rule.apply([item.price for item in self.items])
 
     def repr_ltr(self):
         title = self.content
@@ -120,17 +144,14 @@ def write_promotions_to_table(
     promotions: List[Promotion], output_filename: str
 ) -> None:
     """
-    This function writes a List of promotions to a csv or xlsx output file.
+    This function writes a List of promotions to a csv, xlsx, parquet or arrow output file.
+    Rows are produced lazily and written as they come, so the memory used does not depend on the size of the table.
 
     :param promotions: A given list of promotions
     :param output_filename: A given file to write to
     """
     log_message_and_time_if_debug("Writing promotions to output file")
-    rows = [
-        get_promotion_row_for_table(promo, item)
-        for promo in promotions
-        for item in promo.items
-    ]
+    rows = iter_promotion_rows(promotions)
     if output_filename.endswith(".csv"):
         encoding_file = "utf_8_sig" if sys.platform == "win32" else "utf_8"
         with open(
@@ -141,10 +162,15 @@ def write_promotions_to_table(
             promos_writer.writerows(rows)
 
     elif output_filename.endswith(".xlsx"):
-        df = pd.DataFrame(rows, columns=PROMOTIONS_TABLE_HEADERS)
-        workbook = xlsxwriter.Workbook(output_filename)
+        # In constant memory mode every row is flushed to disk once the next row is written. Worksheet tables aren't
+        # supported in this mode, so the table's header, filters and banded rows are written as plain formatting.
+        workbook = xlsxwriter.Workbook(output_filename, {"constant_memory": True})
         worksheet1 = workbook.add_worksheet()
         worksheet1.right_to_left()
+        header_format = workbook.add_format(
+            {"bold": True, "font_color": "white", "bg_color": "#70AD47"}
+        )
+        band_format = workbook.add_format({"bg_color": "#E2EFDA"})
         date_time_format = workbook.add_format({"num_format": "m/d/yy h:mm;@"})
         number_format = workbook.add_format({"num_format": "0.00"})
         percentage_format = workbook.add_format({"num_format": "0.00%"})
@@ -153,38 +179,67 @@ def write_promotions_to_table(
         worksheet1.set_column("C:D", cell_format=number_format)
         worksheet1.set_column("E:E", cell_format=percentage_format)
         worksheet1.set_column("J:L", width=15, cell_format=date_time_format)
-        worksheet1.add_table(
-            first_row=0,
-            first_col=0,
-            last_row=len(df),
-            last_col=len(df.columns) - 1,
-            options={
-                "columns": [{"header": i} for i in PROMOTIONS_TABLE_HEADERS],
-                "data": df.values.tolist(),
-                "style": "Table Style Medium 11",
-            },
-        )
+        worksheet1.freeze_panes(1, 0)
+        worksheet1.write_row(0, 0, PROMOTIONS_TABLE_HEADERS, header_format)
+        num_of_rows = 0
+        for num_of_rows, row in enumerate(rows, start=1):
+            worksheet1.write_row(num_of_rows, 0, row)
+        last_col = len(PROMOTIONS_TABLE_HEADERS) - 1
+        worksheet1.autofilter(0, 0, num_of_rows, last_col)
+        if num_of_rows:
+            worksheet1.conditional_format(
+                1,
+                0,
+                num_of_rows,
+                last_col,
+                {
+                    "type": "formula",
+                    "criteria": "=MOD(ROW(),2)=0",
+                    "format": band_format,
+                },
+            )
         workbook.close()
 
+    elif is_arrow_output_file(output_filename):
+        write_rows_to_arrow(
+            rows, get_promotions_schema(PROMOTIONS_TABLE_HEADERS), output_filename
+        )
+
     else:
         raise ValueError(
             f"The given output file has an invalid extension:\n{output_filename}"
         )
 
 
-def get_promotion_row_for_table(promo: Promotion, item: Item) -> List:
+def iter_promotion_rows(promotions: List[Promotion]) -> Iterator[List]:
+    """
+    This function yields the rows of the promotions table - a row for every item participating in every promotion.
+
+    :param promotions: A given list of promotions
+    """
+    for promo in promotions:
+        for item, discounted_price in zip(
+            promo.items, promo.get_discounted_prices().tolist()
+        ):
+            yield get_promotion_row_for_table(promo, item, discounted_price)
+
+
+def get_promotion_row_for_table(
+    promo: Promotion, item: Item, discounted_price: float
+) -> List:
     """
     This function returns a row in the promotions XLSX table.
 
     :param promo: A given Promotion object
     :param item: A given item object participating in the promotion
+    :param discounted_price: The item's price after the promotion
     """
     return [
         promo.content,
         item.name,
         item.price,
-        promo.promo_func(item),
-        (item.price - promo.promo_func(item)) / max(item.price, 1),
+        discounted_price,
+        (item.price - discounted_price) / max(item.price, 1),
         promo.club_id.name,
         promo.max_qty,
         promo.allow_multiple_discounts,
@@ -204,6 +259,7 @@ def get_available_promos(
     load_prices: bool,
     load_promos: bool,
     include_non_full_files: bool,
+    items_dict: Optional[ItemTable] = None,
 ) -> List[Promotion]:
     """
     This function return the available promotions given a BeautifulSoup object.
@@ -213,14 +269,16 @@ def get_available_promos(
     :param load_prices: A boolean representing whether to load an existing prices file or download it
     :param load_promos: A boolean representing whether to load an existing promotion file or download it
     :param include_non_full_files: Whether to include non full files (promos/prices)
+    :param items_dict: The store's items, if they were already parsed (otherwise they are parsed from its prices files)
     :return: Promotions that are not included in PRODUCTS_TO_IGNORE and are currently available
     """
-    log_message_and_time_if_debug("Importing prices XML file")
-    items_dict: Dict[str, Item] = create_items_dict(
-        chain, store_id, load_prices, include_non_full_files
-    )
+    if items_dict is None:
+        if load_prices == load_promos:
+            download_store_files(chain, store_id, include_non_full_files, check_latest=not load_prices)
+        log_message_and_time_if_debug("Importing prices XML file")
+        items_dict = create_items_dict(chain, store_id, load_prices, include_non_full_files)
     log_message_and_time_if_debug("Importing promotions XML file")
-    promo_tags = get_all_promos_tags(
+    promo_records = iter_promos_records(
         chain, store_id, load_promos, include_non_full_files
     )
 
@@ -228,84 +286,85 @@ def get_available_promos(
     promo_objs = list()
     previous_promotion_id = -1
     cur_promo = None
-    for promo_tag in tqdm(promo_tags, desc="creating_promotions"):
-        new_promotion_id = int(
-            promo_tag.find(re.compile("PromotionId", re.IGNORECASE)).text
-        )
+    for promo_record in tqdm(promo_records, desc="creating_promotions"):
+        new_promotion_id = int(promo_record.get("PromotionId"))
         if previous_promotion_id != new_promotion_id:  # New promotion
             if cur_promo is not None and is_valid_promo(cur_promo):
                 promo_objs.append(cur_promo)
 
             # Initialize a new promotion
             cur_promo = create_new_promo_instance(
-                chain, items_dict, promo_tag, new_promotion_id
+                chain, items_dict, promo_record, new_promotion_id
             )
             previous_promotion_id = new_promotion_id
-        else:
-            cur_promo.items.extend(chain.get_items(promo_tag, items_dict))
+        elif cur_promo is not None:
+            cur_promo.items.extend(chain.get_items(promo_record, items_dict))
 
     return promo_objs
 
 
 def is_valid_promo(promo: Promotion) -> bool:
+    prices = np.array([item.price for item in promo.items[:50]], dtype=np.float64)
     return (
         "קופון" not in promo.content
-        and any([promo.promo_func(item) != item.price for item in promo.items[:50]])
+        and not promo.rule.is_unknown()
+        and len(prices) > 0
+        and bool(np.any(promo.rule.apply(prices) != prices))
         and len(promo.items) < 1000
     )
 
 
 def create_new_promo_instance(
-    chain: SupermarketChain, items_dict: Dict[str, Item], promo: Tag, promotion_id: int
+    chain: SupermarketChain,
+    items_dict: ItemTable,
+    promo: PromotionRecord,
+    promotion_id: int,
 ) -> Union[Promotion, None]:
     """
-    This function generates a Promotion object from a promotion tag.
+    This function generates a Promotion object from a promotion record.
 
     :param chain: The supermarket chain publishing the promotion
     :param items_dict: A dictionary of items that might participate in the promotion
-    :param promo: An xml Tag representing the promotion
+    :param promo: A record of the promotion's xml tag
     :param promotion_id: An integer representing the promotion ID
     :return: If the promotion expired - return None, else return the Promotion object
     """
     promo_end_time = datetime.strptime(
-        promo.find("PromotionEndDate").text + " " + promo.find("PromotionEndHour").text,
+        promo.get("PromotionEndDate") + " " + promo.get("PromotionEndHour"),
         chain.date_hour_format,
     )
     if promo_end_time < datetime.now():
         return None
 
-    reward_type = RewardType(int(promo.find("RewardType").text))
+    reward_type = RewardType(int(promo.get("RewardType")))
     discounted_price = get_discounted_price(promo)
-    promo_description = promo.find("PromotionDescription").text
+    promo_description = promo.get("PromotionDescription")
     is_discount_in_percentage = (
         reward_type == RewardType.DISCOUNT_IN_PERCENTAGE or not discounted_price
     )
-    raw_discount_rate = (
-        promo.find("DiscountRate").text if promo.find("DiscountRate") else None
-    )
+    raw_discount_rate = promo.get("DiscountRate")
     discount_rate = get_discount_rate(raw_discount_rate, is_discount_in_percentage)
-    min_qty = get_float_from_tag(promo, "MinQty")
-    max_qty = get_float_from_tag(promo, "MaxQty")
-    remark = promo.find("Remark")
-    promo_func = find_promo_function(
+    min_qty = get_float_from_record(promo, "MinQty")
+    max_qty = get_float_from_record(promo, "MaxQty")
+    min_purchase_amount = get_float_from_record(promo, "MinPurchaseAmnt")
+    remark = promo.get("Remark")
+    rule = find_promo_function(
         reward_type=reward_type,
-        remark=remark.text if remark else "",
+        remark=remark if remark is not None else "",
         promo_description=promo_description,
         min_qty=min_qty,
         discount_rate=discount_rate,
         discounted_price=discounted_price,
     )
     promo_start_time = datetime.strptime(
-        promo.find("PromotionStartDate").text
-        + " "
-        + promo.find("PromotionStartHour").text,
+        promo.get("PromotionStartDate") + " " + promo.get("PromotionStartHour"),
         chain.date_hour_format,
     )
     promo_update_time = datetime.strptime(
-        promo.find(chain.promotion_update_tag_name).text, chain.update_date_format
+        promo.get(chain.promotion_update_tag_name), chain.update_date_format
     )
-    club_id = ClubID(int(promo.find(re.compile("ClubId", re.IGNORECASE)).text))
-    multiple_discounts_allowed = bool(int(promo.find("AllowMultipleDiscounts").text))
+    club_id = ClubID(int(promo.get("ClubId")))
+    multiple_discounts_allowed = bool(int(promo.get("AllowMultipleDiscounts")))
     items = chain.get_items(promo, items_dict)
 
     return Promotion(
@@ -314,19 +373,20 @@ def create_new_promo_instance(
         end_date=promo_end_time,
         update_date=promo_update_time,
         items=items,
-        promo_func=promo_func,
+        rule=rule,
         club_id=club_id,
         promotion_id=promotion_id,
         max_qty=max_qty,
         allow_multiple_discounts=multiple_discounts_allowed,
         reward_type=reward_type,
+        min_purchase_amount=min_purchase_amount,
     )
 
 
-def get_discounted_price(promo):
-    discounted_price = promo.find("DiscountedPrice")
-    if discounted_price:
-        return float(discounted_price.text)
+def get_discounted_price(promo: PromotionRecord):
+    discounted_price = promo.get("DiscountedPrice")
+    if discounted_price is not None:
+        return float(discounted_price)
 
 
 def get_discount_rate(discount_rate: Union[float, None], discount_in_percentage: bool):
@@ -336,6 +396,104 @@ def get_discount_rate(discount_rate: Union[float, None], discount_in_percentage:
         return float(discount_rate)
 
 
+class PromotionRule(NamedTuple):
+    """
+    A parameterised description of how a promotion prices a single unit of its items.
+    Every rule boils down to discounted_price = (price * multiplier + addend) / divisor, so it can be applied to a
+    whole column of prices at once.
+    """
+
+    reward_type: RewardType
+    discount_rate: Optional[float]
+    discounted_price: Optional[float]
+    min_qty: float
+    is_price_per_kg: bool  # The remark states that the discounted price is the price per kg
+    is_second_instance: bool  # The description refers to the second instance ("השני ב")
+
+    def coefficients(self) -> Tuple[float, float, float]:
+        """
+        This method returns the (multiplier, addend, divisor) of the rule.
+        Like the per-item prices it replaces, it raises if the promotion lacks a parameter its reward type needs.
+        """
+        reward_type = self.reward_type
+        discount_rate = self.discount_rate
+        discounted_price = self.discounted_price
+        min_qty = self.min_qty
+
+        if reward_type == RewardType.SECOND_INSTANCE_DIFFERENT_DISCOUNT:
+            if not discounted_price:
+                return 1 - (discount_rate / min_qty), 0, 1
+            if not min_qty:
+                raise ZeroDivisionError(f"Invalid min_qty in rule: {self}")
+            return min_qty - 1, discounted_price, min_qty
+
+        if reward_type == RewardType.DISCOUNT_IN_ITEM_IF_PURCHASING_OTHER_ITEMS:
+            return 1, 0, 1
+
+        if reward_type == RewardType.SECOND_OR_THIRD_INSTANCE_FOR_FREE:
+            return 1 - (1 / min_qty), 0, 1
+
+        if reward_type == RewardType.DISCOUNT_IN_PERCENTAGE:
+            return 1 - discount_rate / (2 if self.is_second_instance else 1), 0, 1
+
+        if reward_type == RewardType.SECOND_INSTANCE_SAME_DISCOUNT:
+            if self.is_second_instance:
+                return 1, discounted_price, 2
+            return 0, discounted_price / min_qty, 1
+
+        if reward_type == RewardType.DISCOUNT_BY_THRESHOLD:
+            return 1, -discount_rate, 1
+
+        if reward_type == RewardType.OTHER:
+            return 1, 0, 1
+
+        if self.is_price_per_kg:
+            return 0, discounted_price, 1
+
+        if discounted_price and min_qty:
+            return 0, discounted_price / min_qty, 1
+
+        return UNKNOWN_PROMOTION_COEFFICIENTS
+
+    def is_unknown(self) -> bool:
+        """
+        This method returns whether the rule's promotion function is unknown (or the promotion lacks its parameters),
+        in which case its coefficients are a sentinel rather than a price.
+        """
+        return self.coefficients() == UNKNOWN_PROMOTION_COEFFICIENTS
+
+    def apply(self, prices) -> np.ndarray:
+        """
+        This method returns the discounted prices of a given price or array of prices. An unknown rule discounts
+        nothing, so its prices are returned as they are.
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        if self.is_unknown():
+            return prices.copy()
+        multiplier, addend, divisor = self.coefficients()
+        return (prices * multiplier + addend) / divisor
+
+    def __call__(self, item: Item) -> float:
+        return float(self.apply(item.price))
+
+
+def apply_promotion_rules(
+    prices: np.ndarray, rows: np.ndarray, coefficients: np.ndarray
+) -> np.ndarray:
+    """
+    This function applies many promotion rules at once. Pairs with the coefficients of an unknown rule keep their
+    prices, like PromotionRule.apply.
+
+    :param prices: A column of prices (e.g. ItemTable.price_column())
+    :param rows: The rows of the prices to discount, one entry per (promotion, item) pair
+    :param coefficients: An array of shape (len(rows), 3) with the coefficients of each pair's rule
+    :return: The discounted price of every pair
+    """
+    multipliers, addends, divisors = coefficients.T
+    is_unknown = np.all(coefficients == UNKNOWN_PROMOTION_COEFFICIENTS, axis=1)
+    return np.where(is_unknown, prices[rows], (prices[rows] * multipliers + addends) / divisors)
+
+
 def find_promo_function(
     reward_type: RewardType,
     remark: str,
@@ -343,41 +501,15 @@ def find_promo_function(
     min_qty: float,
     discount_rate: Union[float, None],
     discounted_price: Union[float, None],
-):
-    if reward_type == RewardType.SECOND_INSTANCE_DIFFERENT_DISCOUNT:
-        if not discounted_price:
-            return lambda item: item.price * (1 - (discount_rate / min_qty))
-        return lambda item: (item.price * (min_qty - 1) + discounted_price) / min_qty
-
-    if reward_type == RewardType.DISCOUNT_IN_ITEM_IF_PURCHASING_OTHER_ITEMS:
-        return lambda item: item.price
-
-    if reward_type == RewardType.SECOND_OR_THIRD_INSTANCE_FOR_FREE:
-        return lambda item: item.price * (1 - (1 / min_qty))
-
-    if reward_type == RewardType.DISCOUNT_IN_PERCENTAGE:
-        return lambda item: item.price * (
-            1 - discount_rate / (2 if "השני ב" in promo_description else 1)
-        )
-
-    if reward_type == RewardType.SECOND_INSTANCE_SAME_DISCOUNT:
-        if "השני ב" in promo_description:
-            return lambda item: (item.price + discounted_price) / 2
-        return lambda item: discounted_price / min_qty
-
-    if reward_type == RewardType.DISCOUNT_BY_THRESHOLD:
-        return lambda item: item.price - discount_rate
-
-    if reward_type == RewardType.OTHER:
-        return lambda item: item.price
-
-    if 'מחיר המבצע הינו המחיר לק"ג' in remark:
-        return lambda item: discounted_price
-
-    if discounted_price and min_qty:
-        return lambda item: discounted_price / min_qty
-
-    return lambda item: INVALID_OR_UNKNOWN_PROMOTION_FUNCTION
+) -> PromotionRule:
+    return PromotionRule(
+        reward_type=reward_type,
+        discount_rate=discount_rate,
+        discounted_price=discounted_price,
+        min_qty=min_qty,
+        is_price_per_kg='מחיר המבצע הינו המחיר לק"ג' in remark,
+        is_second_instance="השני ב" in promo_description,
+    )
 
 
 def main_latest_promos(
@@ -412,40 +544,72 @@ def main_latest_promos(
 
 
 def get_all_prices_with_promos(
-    store_id: int, chain: SupermarketChain, load_promos: bool, load_prices: bool
+    store_id: int,
+    chain: SupermarketChain,
+    load_promos: bool,
+    load_prices: bool,
+    incremental_prices: bool = False,
 ):
+    if load_prices == load_promos:
+        # All the files are fetched in a single scraping pass. The incremental price state also applies the latest
+        # non-full prices file
+        download_xml_files(
+            chain,
+            store_id,
+            get_price_file_types(incremental_prices) + get_promo_file_types(False),
+            check_latest=not load_prices,
+        )
     log_message_and_time_if_debug("Importing prices XML file")
-    items_dict: Dict[str, Item] = create_items_dict(chain, store_id, load_prices, False)
+    if incremental_prices:
+        items_dict: ItemTable = update_price_state(chain, store_id, load_prices)
+    else:
+        items_dict: ItemTable = create_items_dict(chain, store_id, load_prices, False)
     log_message_and_time_if_debug("Importing promotions XML file")
-    promo_tags = get_all_promos_tags(chain, store_id, load_promos, False)
+    promo_records = iter_promos_records(chain, store_id, load_promos, False)
 
     log_message_and_time_if_debug("Creating promotions objects")
+    rows = list()
+    coefficients = list()
+    contents = list()
     cur_promo = None
-    for promo_tag in tqdm(promo_tags, desc="creating_promotions"):
-        promo_id = int(promo_tag.find(re.compile("PromotionId", re.IGNORECASE)).text)
+    cur_promo_is_applicable = False
+    for promo_record in tqdm(promo_records, desc="creating_promotions"):
+        promo_id = int(promo_record.get("PromotionId"))
 
         if cur_promo is None or cur_promo.promotion_id != promo_id:
             cur_promo = create_new_promo_instance(
-                chain, items_dict, promo_tag, promo_id
+                chain, items_dict, promo_record, promo_id
             )
-        if (
-            cur_promo is not None
-            and cur_promo.club_id == ClubID.REGULAR
-            and is_valid_promo(cur_promo)
-        ):
-            for item in promo_tag.find_all("Item"):
-                cur_item = items_dict.get(item.find("ItemCode").text)
-                if cur_item is not None:
-                    discounted_price = cur_promo.promo_func(cur_item)
-                    if cur_item.price > discounted_price:
-                        cur_item.promotions.append(
-                            {
-                                "content": cur_promo.content,
-                                "discounted_price": discounted_price,
-                            }
-                        )
-                    if cur_item.final_price > discounted_price:
-                        cur_item.final_price = discounted_price
+            cur_promo_is_applicable = (
+                cur_promo is not None
+                and cur_promo.club_id == ClubID.REGULAR
+                and is_valid_promo(cur_promo)
+            )
+        if cur_promo_is_applicable:
+            promo_rows = [
+                item.row for item in chain.get_items(promo_record, items_dict)
+            ]
+            rows.extend(promo_rows)
+            coefficients.extend([cur_promo.rule.coefficients()] * len(promo_rows))
+            contents.extend([cur_promo.content] * len(promo_rows))
+
+    log_message_and_time_if_debug("Applying promotions")
+    prices = items_dict.price_column()
+    rows = np.array(rows, dtype=np.intp)
+    discounted_prices = apply_promotion_rules(
+        prices, rows, np.array(coefficients, dtype=np.float64).reshape(-1, 3)
+    )
+    final_prices = items_dict.final_price_column()
+    np.fmin.at(final_prices, rows, discounted_prices)
+    items_dict.set_final_prices(final_prices)
+
+    is_discounted = prices[rows] > discounted_prices
+    for row, content, discounted_price in zip(
+        rows[is_discounted].tolist(),
+        compress(contents, is_discounted),
+        discounted_prices[is_discounted].tolist(),
+    ):
+        items_dict.add_promotion(row, {"content": content, "discounted_price": discounted_price})
 
     return items_dict
 
@@ -481,44 +645,64 @@ def get_all_null_items_in_promos(chain, store_id) -> List[str]:
     This function finds all items appearing in the chain's promotions file but not in the chain's prices file.
     Outdated.
     """
-    items_dict: Dict[str, Item] = create_items_dict(
+    download_store_files(chain, store_id, include_non_full_files=True)
+    items_dict: ItemTable = create_items_dict(
         chain, store_id, load_xml=True, include_non_full_price_file=True
     )
-    promo_tags = get_all_promos_tags(
+    promo_records = iter_promos_records(
         chain, store_id, load_xml=True, include_non_full_files=True
     )
     return [
         item
-        for promo_tag in promo_tags
-        for item in chain.get_null_items(promo_tag, items_dict)
+        for promo_record in promo_records
+        for item in chain.get_null_items(promo_record, items_dict)
     ]
 
 
-def get_all_promos_tags(
+def iter_promos_records(
     chain: SupermarketChain, store_id: int, load_xml: bool, include_non_full_files: bool
-) -> List[Tag]:
+) -> Iterator[PromotionRecord]:
     """
-    This function gets all the promotions tags for a given store in a given chain.
-    It includes both the full and not full promotions files.
+    This function streams the promotions records of a given store in a given chain.
+    It includes both the full and not full promotions files, which are parsed lazily one after the other,
+    so only the promotion currently being consumed is held in memory.
 
     :param chain: A given supermarket chain
     :param store_id: A given store ID
     :param load_xml: A boolean representing whether to try loading the promotions from an existing XML file
     :param include_non_full_files: Whether to include non full promo file
-    :return: A list of promotions tags
+    :return: An iterator over the promotions records
     """
-    bs_objects = list()
+    promotion_xml_file_types = get_promo_file_types(include_non_full_files)
+    download_xml_files(chain, store_id, promotion_xml_file_types, check_latest=not load_xml)
+    for category in promotion_xml_file_types:
+        xml_path = xml_file_gen(chain, store_id, category.name)
+        yield from iter_promotion_records(chain, xml_path)
+
+
+def get_promo_file_types(include_non_full_files: bool) -> List[FileTypesFilters]:
     promotion_xml_file_types = [FileTypesFilters.PROMO_FULL_FILE]
     if include_non_full_files:
         promotion_xml_file_types.append(FileTypesFilters.PROMO_FILE)
-    for category in tqdm(promotion_xml_file_types, desc="promotions_files"):
-        xml_path = xml_file_gen(chain, store_id, category.name)
-        bs_objects.append(
-            create_bs_object(chain, store_id, category, load_xml, xml_path)
-        )
+    return promotion_xml_file_types
 
-    return [
-        promo
-        for bs_obj in bs_objects
-        for promo in bs_obj.find_all(chain.promotion_tag_name)
-    ]
+
+def download_store_files(
+    chain: SupermarketChain, store_id: int, include_non_full_files: bool, check_latest: bool = True
+) -> None:
+    """
+    This function downloads all the prices and promotions files of a given store in a single scraping pass.
+
+    :param chain: A given supermarket chain
+    :param store_id: A given store ID
+    :param include_non_full_files: Whether to include non full files (promos/prices)
+    :param check_latest: Whether to check the existing files against the chain's latest files (otherwise only
+    missing files are downloaded)
+    """
+    download_xml_files(
+        chain,
+        store_id,
+        get_price_file_types(include_non_full_files)
+        + get_promo_file_types(include_non_full_files),
+        check_latest,
+    )
@@ -0,0 +1,58 @@
+from typing import Dict, List, Optional
+
+from bs4.element import Tag
+from lxml.etree import _Element
+
+from src.tag_schema import TagSchema
+
+
+class PromotionRecord:
+    """
+    A lightweight, flattened copy of a promotion tag - the text of its fields and the codes of its items.
+    Unlike a Tag, a record does not keep its XML tree alive, so it can be dropped as soon as it is processed.
+    """
+
+    __slots__ = ("fields", "item_codes")
+
+    def __init__(self, fields: Dict[str, str], item_codes: List[str]):
+        self.fields: Dict[str, str] = fields  # The first value of every leaf tag, as Tag.find would return
+        self.item_codes: List[str] = item_codes  # Codes of the <Item> tags nested in the promotion
+
+    @classmethod
+    def from_element(cls, promo: _Element, schema: TagSchema):
+        """
+        This method creates a PromotionRecord instance from an lxml element, as yielded by iterparse.
+        The fields of the given schema are also stored under their canonical names.
+        """
+        fields = dict()
+        item_codes = list()
+        for element in promo.iterdescendants():
+            if not isinstance(element.tag, str):
+                continue
+            if element.tag == "Item":
+                item_code = element.findtext("ItemCode")
+                if item_code is not None:
+                    item_codes.append(item_code)
+            elif len(element) == 0:
+                fields.setdefault(element.tag, element.text or "")
+        return cls(schema.canonize(fields), item_codes)
+
+    @classmethod
+    def from_tag(cls, promo: Tag, schema: TagSchema):
+        """
+        This method creates a PromotionRecord instance from a BeautifulSoup tag.
+        The fields of the given schema are also stored under their canonical names.
+        """
+        fields = dict()
+        item_codes = list()
+        for tag in promo.find_all(True):
+            if tag.name == "Item":
+                item_code = tag.find("ItemCode")
+                if item_code is not None:
+                    item_codes.append(item_code.text)
+            elif tag.find(True) is None:
+                fields.setdefault(tag.name, tag.text)
+        return cls(schema.canonize(fields), item_codes)
+
+    def get(self, field_name: str) -> Optional[str]:
+        return self.fields.get(field_name)
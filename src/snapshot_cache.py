@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import os
+import pickle
+from contextlib import contextmanager
+from os import path
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, TypeVar
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".snapshot"
+
+T = TypeVar("T")
+
+
+def get_snapshot_path(xml_path: str) -> str:
+    """
+    This function returns the path of the parsed snapshot of a given XML file.
+    XML filenames already encode the chain, category and store, so the snapshot lives right next to its source.
+    """
+    return xml_path + SNAPSHOT_SUFFIX
+
+
+def get_file_hash(file_path: str) -> str:
+    """
+    This function returns a hash of a given file's content.
+    """
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f_in:
+        for chunk in iter(lambda: f_in.read(1 << 20), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def load_or_build(xml_path: str, build: Callable[[], T]) -> T:
+    """
+    This function returns the parsed content of a given XML file, loading it from its snapshot if it is up to date.
+    Otherwise, the content is built with the given function and a new snapshot is written.
+
+    :param xml_path: A given path to an XML file
+    :param build: A function parsing the XML file
+    """
+    snapshot = _open_valid_snapshot(xml_path)
+    if snapshot is not None:
+        with snapshot:
+            return pickle.load(snapshot)
+
+    parsed = build()
+    with _write_snapshot(xml_path) as f_out:
+        pickle.dump(parsed, f_out, pickle.HIGHEST_PROTOCOL)
+    return parsed
+
+
+def iter_or_build(xml_path: str, build: Callable[[], Iterator[T]]) -> Iterator[T]:
+    """
+    This function streams the parsed records of a given XML file, loading them from its snapshot if it is up to
+    date. Otherwise, the records are streamed from the given function and written to a new snapshot on the fly,
+    which is kept only if the stream was fully consumed.
+
+    :param xml_path: A given path to an XML file
+    :param build: A function streaming the records of the XML file
+    """
+    snapshot = _open_valid_snapshot(xml_path)
+    if snapshot is not None:
+        with snapshot:
+            while True:
+                try:
+                    yield pickle.load(snapshot)
+                except EOFError:
+                    return
+
+    with _write_snapshot(xml_path) as f_out:
+        for record in build():
+            pickle.dump(record, f_out, pickle.HIGHEST_PROTOCOL)
+            yield record
+
+
+def _get_source_header(xml_path: str) -> Dict:
+    stat = os.stat(xml_path)
+    return {
+        "version": SNAPSHOT_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": get_file_hash(xml_path),
+    }
+
+
+def _open_valid_snapshot(xml_path: str) -> Optional[BinaryIO]:
+    """
+    This function opens the snapshot of a given XML file, positioned after its header, if it matches the file.
+    A snapshot matches if it has the file's size and modification time, or else the file's content hash.
+    """
+    snapshot_path = get_snapshot_path(xml_path)
+    if not (path.isfile(xml_path) and path.isfile(snapshot_path)):
+        return None
+
+    snapshot = open(snapshot_path, "rb")
+    try:
+        header = pickle.load(snapshot)
+        stat = os.stat(xml_path)
+        if (
+            header.get("version") == SNAPSHOT_VERSION
+            and header.get("size") == stat.st_size
+            and (
+                header.get("mtime_ns") == stat.st_mtime_ns
+                or header.get("hash") == get_file_hash(xml_path)
+            )
+        ):
+            return snapshot
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+        logging.debug(f"Ignoring invalid snapshot {snapshot_path}: {e}")
+    snapshot.close()
+    return None
+
+
+@contextmanager
+def _write_snapshot(xml_path: str) -> Iterator[BinaryIO]:
+    """
+    This function opens a temporary snapshot file for a given XML file, and moves it into place only if the
+    writing completed successfully.
+    """
+    snapshot_path = get_snapshot_path(xml_path)
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f_out:
+            pickle.dump(_get_source_header(xml_path), f_out, pickle.HIGHEST_PROTOCOL)
+            yield f_out
+        os.replace(tmp_path, snapshot_path)
+    finally:
+        if path.exists(tmp_path):
+            os.remove(tmp_path)
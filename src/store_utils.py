@@ -1,38 +1,261 @@
 import logging
-import re
+import os
+import pickle
+import time
+from os import path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
 
 from bs4 import BeautifulSoup
+from lxml import etree
 
-from src.utils import xml_file_gen, create_bs_object
+from src.download_manifest import get_manifest_path, load_manifest
+from src.download_scheduler import DownloadScheduler, create_store_jobs
+from src.product_index import get_ngrams
+from src.snapshot_cache import get_file_hash
+from src.text_utils import normalize_hebrew
+from src.utils import (
+    RAW_FILES_DIRNAME,
+    get_bs_object_from_xml,
+    iter_xml_elements,
+    xml_file_gen,
+)
 from src.supermarket_chain import SupermarketChain
 from il_supermarket_scarper.main import FileTypesFilters
 
+STORE_INDEX_VERSION = 1
+STORE_INDEX_FILENAME = "stores.index"
+STORE_TAG_NAMES = ("STORE", "Store", "store")
+STORES_FILE_MAX_AGE = 24 * 60 * 60  # Seconds - the chains rarely open or close stores
 
-def log_stores_ids(city: str, load_xml: bool, chain: SupermarketChain):
+
+class StoreInfo(NamedTuple):
+    chain: str
+    store_id: str
+    name: str
+    city: str
+    address: str
+    sub_chain: str
+
+
+def _create_store_info(chain_name: str, fields: Dict[str, str]) -> StoreInfo:
+    """
+    This function creates a StoreInfo from the fields of a store tag, given by their lowercase tag names (the chains
+    do not agree on the case of the tag names).
+    """
+    return StoreInfo(
+        chain=chain_name,
+        store_id=fields.get("storeid", ""),
+        name=fields.get("storename", ""),
+        city=fields.get("city", ""),
+        address=fields.get("address", ""),
+        sub_chain=fields.get("subchainname", ""),
+    )
+
+
+def iter_stores_from_xml(chain: SupermarketChain, xml_path: str) -> Iterator[StoreInfo]:
     """
-    This function prints the stores IDs of stores in a given city.
-    The city must match its spelling in Shufersal's website (hence it should be in Hebrew).
+    This function streams the stores in a given stores XML file.
 
     :param chain: A given supermarket chain
-    :param load_xml: A boolean representing whether to load an existing xml or load an already saved one
-    :param city: A string representing the city of the requested store.
+    :param xml_path: A given path to a stores XML file
     """
-    xml_path: str = xml_file_gen(chain, -1, FileTypesFilters.STORE_FILE.name)
-    bs_stores: BeautifulSoup = create_bs_object(
-        chain, -1, FileTypesFilters.STORE_FILE, load_xml, xml_path
-    )
+    for store_element in iter_xml_elements(xml_path, STORE_TAG_NAMES):
+        yield _create_store_info(
+            repr(type(chain)),
+            {
+                child.tag.lower(): (child.text or "").strip()
+                for child in store_element
+                if isinstance(child.tag, str)
+            },
+        )
+
+
+def parse_stores_from_xml(chain: SupermarketChain, xml_path: str) -> List[StoreInfo]:
+    """
+    This function parses the stores in a given stores XML file.
+    The file is streamed with iterparse, and parsed with BeautifulSoup only if lxml fails to parse it.
+
+    :param chain: A given supermarket chain
+    :param xml_path: A given path to a stores XML file
+    """
+    try:
+        return list(iter_stores_from_xml(chain, xml_path))
+    except etree.XMLSyntaxError as e:
+        logging.debug(f"Falling back to BeautifulSoup for {xml_path}: {e}")
+    bs_stores: BeautifulSoup = get_bs_object_from_xml(xml_path)
+    return [
+        _create_store_info(
+            repr(type(chain)),
+            {tag.name.lower(): tag.text.strip() for tag in store.find_all(True)},
+        )
+        for store in bs_stores.find_all(lambda tag: tag.name.lower() == "store")
+    ]
+
+
+class StoreIndex:
+    """
+    An index of the stores of all the chains, by their normalised city and by the character n-grams of their
+    normalised name. The stores of every chain are kept with the hash of the stores file they were parsed from, so a
+    chain is parsed again only when its stores file changes.
+    """
+
+    def __init__(self):
+        self.stores: Dict[str, List[StoreInfo]] = dict()  # By chain name
+        self.sources: Dict[str, str] = dict()  # The hash of the stores file of every chain
+        self._by_city: Dict[str, List[StoreInfo]] = dict()
+        self._all_stores: List[StoreInfo] = list()
+        self._names: List[str] = list()  # The normalised name of every store in _all_stores
+        self._by_name_ngram: Dict[str, List[int]] = dict()  # The positions of the stores in _all_stores, in order
+
+    def update_chain(
+        self, chain_name: str, stores: Iterable[StoreInfo], source_hash: str
+    ) -> None:
+        self.stores[chain_name] = list(stores)
+        self.sources[chain_name] = source_hash
+        self._build_lookups()
+
+    def _build_lookups(self) -> None:
+        self._by_city = dict()
+        self._all_stores = [store for chain_stores in self.stores.values() for store in chain_stores]
+        self._names = [normalize_hebrew(store.name) for store in self._all_stores]
+        self._by_name_ngram = dict()
+        for position, (store, name) in enumerate(zip(self._all_stores, self._names)):
+            self._by_city.setdefault(normalize_hebrew(store.city), []).append(store)
+            for ngram in get_ngrams(name):
+                self._by_name_ngram.setdefault(ngram, []).append(position)
 
-    for store in bs_stores.find_all(lambda tag: tag.name.lower() == "store"):
-        if store.find(re.compile(f"^city$", re.I), attrs={"text": city}) or store.find(
-            re.compile(f"^storename$", re.I),
-            attrs={"name": lambda x: x and city in x.lower()},
-        ):
-            # if store.find(lambda tag: tag.name.lower() == "city", name=city) or city in store.find(lambda tag: city in tag.name.lower()):
-            # if store.find("CITY").text == city or city in store.find("Store").text:
-            logging.info(
-                (
-                    store.find("ADDRESS").text,
-                    store.find("STOREID").text,
-                    store.find("SUBCHAINNAME").text,
+    def find(self, city: str, chain_names: Optional[Iterable[str]] = None) -> List[StoreInfo]:
+        """
+        This method returns the stores in a given city, or whose name contains the given city.
+        Only the stores whose names share all the n-grams of the city are compared with it. Cities too short to have
+        n-grams are compared with all the names.
+
+        :param city: A given city name (in Hebrew)
+        :param chain_names: The chains to look in, or None for all the chains
+        """
+        city = normalize_hebrew(city)
+        if not city:
+            return []
+        chain_names = set(chain_names) if chain_names is not None else None
+        found = list(self._by_city.get(city, []))
+        found_ids = set(map(id, found))
+        ngrams = get_ngrams(city)
+        if ngrams:
+            if any(ngram not in self._by_name_ngram for ngram in ngrams):
+                positions = []
+            else:
+                postings = sorted((self._by_name_ngram[ngram] for ngram in ngrams), key=len)
+                positions = sorted(set(postings[0]).intersection(*postings[1:]))
+        else:
+            positions = range(len(self._all_stores))
+        found.extend(
+            self._all_stores[position]
+            for position in positions
+            if city in self._names[position] and id(self._all_stores[position]) not in found_ids
+        )
+        return [store for store in found if chain_names is None or store.chain in chain_names]
+
+    @classmethod
+    def load(cls, index_path: str):
+        """
+        This method loads an index saved to a given path, or returns an empty index if there is no valid one.
+        """
+        if path.isfile(index_path):
+            try:
+                with open(index_path, "rb") as f_in:
+                    version, stores, sources = pickle.load(f_in)
+                if version == STORE_INDEX_VERSION:
+                    index = cls()
+                    index.stores, index.sources = stores, sources
+                    index._build_lookups()
+                    return index
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError) as e:
+                logging.debug(f"Ignoring invalid store index {index_path}: {e}")
+        return cls()
+
+    def save(self, index_path: str) -> None:
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f_out:
+                pickle.dump(
+                    (STORE_INDEX_VERSION, self.stores, self.sources),
+                    f_out,
+                    pickle.HIGHEST_PROTOCOL,
                 )
+            os.replace(tmp_path, index_path)
+        finally:
+            if path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def _is_stores_file_fresh(chain: SupermarketChain) -> bool:
+    """
+    This function returns whether the stores file of a given chain was checked against the chain's latest stores
+    file in the last STORES_FILE_MAX_AGE seconds, according to the chain's manifest.
+    """
+    entry = load_manifest(get_manifest_path(RAW_FILES_DIRNAME, repr(type(chain)), -1)).get(
+        FileTypesFilters.STORE_FILE.name
+    )
+    return (
+        entry is not None
+        and entry["name"] is not None
+        and time.time() - entry.get("checked_at", 0) < STORES_FILE_MAX_AGE
+    )
+
+
+def get_store_index(chains: List[SupermarketChain], load_xml: bool) -> StoreIndex:
+    """
+    This function returns the index of the stores of the given chains, refreshing the chains whose stores files
+    changed since the index was saved. The stores files are downloaded only for chains which are not indexed yet, or
+    whose stores file is older than STORES_FILE_MAX_AGE.
+
+    :param chains: The chains to index
+    :param load_xml: A boolean representing whether to use the existing stores files when they exist
+    """
+    index_path = path.join(RAW_FILES_DIRNAME, STORE_INDEX_FILENAME)
+    index = StoreIndex.load(index_path)
+    chains_to_download = list()
+    for chain in chains:
+        is_indexed = repr(type(chain)) in index.sources
+        if load_xml:
+            should_download = not is_indexed and not path.isfile(
+                xml_file_gen(chain, -1, FileTypesFilters.STORE_FILE.name)
+            )
+        else:
+            should_download = not is_indexed or not _is_stores_file_fresh(chain)
+        if should_download:
+            chains_to_download.append(chain)
+    for result in DownloadScheduler().run(
+        create_store_jobs(((chain, -1) for chain in chains_to_download), [FileTypesFilters.STORE_FILE])
+    ):
+        if result.error:
+            logging.warning(f"Could not download the stores file of {result.job.key[0]}")
+
+    is_updated = False
+    for chain in chains:
+        xml_path = xml_file_gen(chain, -1, FileTypesFilters.STORE_FILE.name)
+        if not path.isfile(xml_path):
+            continue
+        source_hash = get_file_hash(xml_path)
+        if index.sources.get(repr(type(chain))) != source_hash:
+            index.update_chain(
+                repr(type(chain)), parse_stores_from_xml(chain, xml_path), source_hash
             )
+            is_updated = True
+    if is_updated:
+        index.save(index_path)
+    return index
+
+
+def log_stores_ids(city: str, load_xml: bool, chains: List[SupermarketChain]):
+    """
+    This function prints the stores IDs of stores in a given city, in all the given chains.
+    The city should be in Hebrew, and is matched regardless of final letters, gershayim and spacing.
+
+    :param chains: The supermarket chains to look in
+    :param load_xml: A boolean representing whether to load an existing xml or load an already saved one
+    :param city: A string representing the city of the requested store.
+    """
+    index = get_store_index(chains, load_xml)
+    for store in index.find(city, [repr(type(chain)) for chain in chains]):
+        logging.info((store.chain, store.address, store.store_id, store.sub_chain))
@@ -4,9 +4,10 @@ from typing import Dict, List, Tuple
 
 from il_supermarket_scarper.main import FileTypesFilters
 import os
-from bs4.element import Tag
 
 from src.item import Item
+from src.item_table import ItemTable
+from src.promotion_record import PromotionRecord
 
 
 class Meta(type):
@@ -30,6 +31,7 @@ class SupermarketChain(object, metaclass=Meta):
     _date_hour_format = "%Y-%m-%d %H:%M"
     _update_date_format = "%Y-%m-%d %H:%M"
     _item_tag_name = "Item"
+    _download_host = None  # The backend host serving the chain's files, if shared with other chains
 
     @property
     def promotion_tag_name(self):
@@ -55,6 +57,10 @@ class SupermarketChain(object, metaclass=Meta):
     def item_tag_name(self):
         return type(self)._item_tag_name
 
+    @property
+    def download_host(self):
+        return type(self)._download_host or repr(type(self))
+
     @staticmethod
     def is_valid_store_id(store_id: int) -> bool:
         """
@@ -89,8 +95,81 @@ class SupermarketChain(object, metaclass=Meta):
 
         return scraper.get_storage_path(), os.listdir(scraper.get_storage_path())
 
+    def get_download_urls_or_paths(
+        self,
+        store_id: int,
+        categories: List[FileTypesFilters],
+        dump_folder: str,
+    ) -> Tuple[str, Dict[FileTypesFilters, str]]:
+        """
+        This method downloads the latest files of all the given categories in a single scraping pass.
+
+        :param store_id: A given store ID
+        :param categories: The categories to download
+        :param dump_folder: A folder to download the files to
+        :return: The folder the files were downloaded to, and the downloaded filename of every found category
+        """
+        scraper = self.scraper.value(folder_name=dump_folder)
+        scraper.scrape(
+            store_id=store_id,
+            files_types=[category.name for category in categories],
+            only_latest=True,
+        )
+
+        storage_path = scraper.get_storage_path()
+        downloaded_files = (
+            os.listdir(storage_path) if os.path.isdir(storage_path) else []
+        )
+        return storage_path, {
+            category: file_name
+            for category in categories
+            for file_name in downloaded_files
+            if FileTypesFilters.is_file_from_type(file_name, category.name)
+        }
+
+    def get_latest_file_names(
+        self,
+        store_id: int,
+        categories: List[FileTypesFilters],
+        dump_folder: str,
+    ) -> Dict[FileTypesFilters, str]:
+        """
+        This method lists the names of the latest published files of the given categories, without downloading them.
+
+        :param store_id: A given store ID
+        :param categories: The categories to look for
+        :param dump_folder: A folder the scraper may use, which is expected to be empty
+        :return: The published filename of every found category
+        """
+        scraper = self.scraper.value(folder_name=dump_folder)
+        os.makedirs(scraper.get_storage_path(), exist_ok=True)
+        files_details = scraper.collect_files_details_from_site(
+            files_types=[category.name for category in categories],
+            store_id=store_id,
+            only_latest=True,
+        )
+        # Web engines return (download_urls, file_names), while FTP engines return the file names alone
+        file_names = files_details[1] if isinstance(files_details, tuple) else files_details
+        return {
+            category: file_name
+            for category in categories
+            for file_name in file_names
+            if FileTypesFilters.is_file_from_type(file_name, category.name)
+        }
+
     @staticmethod
-    def get_items(promo: Tag, items_dict: Dict[str, Item]) -> List[Item]:
+    def get_promo_item_codes(promo: PromotionRecord) -> List[str]:
+        """
+        This method returns the codes of the items that participate in a given promotion.
+
+        :param promo: A given promotion
+        """
+        return promo.item_codes
+
+    @classmethod
+    def get_items(
+        cls, promo: PromotionRecord, items_dict: ItemTable
+    ) -> List[Item]:
         """
         This method returns a list of the items that participate in a given promotion.
 
@@ -98,20 +177,21 @@ class SupermarketChain(object, metaclass=Meta):
         :param items_dict: A given dictionary of products
         """
         items = list()
-        for item in promo.find_all("Item"):
-            item_code = item.find("ItemCode").text
+        for item_code in cls.get_promo_item_codes(promo):
             full_item_info = items_dict.get(item_code)
             if full_item_info:
                 items.append(full_item_info)
         return items
 
-    @staticmethod
-    def get_null_items(promo: Tag, items_dict: Dict[str, Item]) -> List[str]:
+    @classmethod
+    def get_null_items(
+        cls, promo: PromotionRecord, items_dict: ItemTable
+    ) -> List[str]:
         """
         This function returns all the items in a given promotion which do not appear in the given items_dict.
         """
         return [
-            item.find("ItemCode").text
-            for item in promo.find_all("Item")
-            if not items_dict.get(item.find("ItemCode").text)
+            item_code
+            for item_code in cls.get_promo_item_codes(promo)
+            if not items_dict.get(item_code)
         ]
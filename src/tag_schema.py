@@ -0,0 +1,56 @@
+import re
+from typing import Dict, Optional
+
+ITEM_TAG_PATTERNS = {
+    "ItemName": re.compile(r"ItemN[a]?m[e]?"),
+    "ManufacturerName": re.compile(r"Manufacture[r]?Name"),
+}
+PROMOTION_TAG_PATTERNS = {
+    "PromotionId": re.compile("PromotionId", re.IGNORECASE),
+    "ClubId": re.compile("ClubId", re.IGNORECASE),
+}
+
+
+class TagSchema:
+    """
+    A class resolving the concrete tag names a file uses for fields whose spelling differs between chains
+    (e.g. ItemName/ItemNm, PromotionId/PromotionID).
+    Every field is resolved by its pattern once - from the first record containing it - and later lookups are plain
+    dictionary accesses.
+    """
+
+    def __init__(self, tag_patterns: Dict[str, re.Pattern]):
+        self._tag_patterns: Dict[str, re.Pattern] = tag_patterns
+        self._tag_names: Dict[str, str] = dict()
+
+    def get(self, fields: Dict[str, str], field_name: str) -> Optional[str]:
+        """
+        This method returns the value of a given field in a given record's fields.
+
+        :param fields: A mapping from the record's tag names to their values, in document order
+        :param field_name: The name of the field, as a key of the schema's patterns
+        """
+        value = fields.get(self._tag_names.get(field_name))
+        if value is None:
+            tag_name = self._resolve(fields, field_name)
+            if tag_name is not None:
+                value = fields[tag_name]
+        return value
+
+    def canonize(self, fields: Dict[str, str]) -> Dict[str, str]:
+        """
+        This method adds the schema's fields to a given record's fields under their canonical names, so they can be
+        accessed directly regardless of the chain's spelling.
+        """
+        for field_name in self._tag_patterns:
+            value = self.get(fields, field_name)
+            if value is not None:
+                fields[field_name] = value
+        return fields
+
+    def _resolve(self, fields: Dict[str, str], field_name: str) -> Optional[str]:
+        pattern = self._tag_patterns[field_name]
+        tag_name = next((tag for tag in fields if pattern.search(tag)), None)
+        if tag_name is not None:
+            self._tag_names[field_name] = tag_name
+        return tag_name
@@ -0,0 +1,20 @@
+import re
+from typing import Optional
+
+HEBREW_FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+SEPARATORS_PATTERN = re.compile(r"[\s\-\u05BE.,()]+")  # Including the Hebrew maqaf
+HEBREW_MARKS_PATTERN = re.compile(r"[\u0591-\u05C7\"'`\u05F3\u05F4]")  # Niqqud, geresh and gershayim
+
+
+def normalize_hebrew(text: Optional[str]) -> str:
+    """
+    This function normalises a Hebrew name for lookups: final letters are replaced by their regular forms, niqqud and
+    gershayim are dropped, and separators are collapsed into single spaces. E.g. "תל-אביב  יפו" and "תל אביב-יפו" are
+    normalised the same, and so are "ראשל"צ" and "ראשלצ".
+
+    :param text: A given name, possibly None
+    """
+    if not text:
+        return ""
+    text = SEPARATORS_PATTERN.sub(" ", text.lower().translate(HEBREW_FINAL_LETTERS))
+    return " ".join(HEBREW_MARKS_PATTERN.sub("", text).split())
@@ -1,25 +1,48 @@
+import gzip
 import uuid
 import shutil
 import logging
 import os.path
+import time
+import zipfile
 from argparse import ArgumentTypeError
 from datetime import date
 from datetime import datetime
 from os import path
-from typing import Dict
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 from il_supermarket_scarper.main import FileTypesFilters
 
 import requests
 from bs4 import BeautifulSoup
+from lxml import etree
 from tqdm import tqdm
 
+from src.download_manifest import (
+    create_manifest_entry,
+    create_unpublished_entry,
+    get_manifest_path,
+    get_remote_file_key,
+    is_entry_on_disk,
+    is_recently_checked,
+    load_manifest,
+    save_manifest,
+)
 from src.item import Item
+from src.item_table import ItemTable
+from src.promotion_record import PromotionRecord
+from src.snapshot_cache import get_file_hash, get_snapshot_path, iter_or_build, load_or_build
 from src.supermarket_chain import SupermarketChain
+from src.tag_schema import ITEM_TAG_PATTERNS, PROMOTION_TAG_PATTERNS, TagSchema
 
 
 RESULTS_DIRNAME = "results"
 RAW_FILES_DIRNAME = "raw_files"
-VALID_PROMOTION_FILE_EXTENSIONS = [".csv", ".xlsx"]
+PRICE_UPDATE_TAG_NAME = "PriceUpdateDate"
+GZIP_MAGIC = b"\x1f\x8b"
+ZIP_MAGIC = b"PK\x03\x04"
+
+VALID_PROMOTION_FILE_EXTENSIONS = [".csv", ".xlsx", ".parquet", ".arrow"]
+VALID_PRICES_FILE_EXTENSIONS = [".json", ".ndjson", ".jsonl", ".parquet", ".arrow"]
 
 
 def xml_file_gen(chain: SupermarketChain, store_id: int, category_name: str) -> str:
@@ -81,16 +104,7 @@ def get_bs_object_from_link(
     :param category: A given category
     :return: A BeautifulSoup object with xml content.
     """
-    if not os.path.exists(xml_path):
-        dump_folder = ".dump_" + str(uuid.uuid4())
-        base_folder, download_url_or_path = chain.get_download_url_or_path(
-            store_id, category, dump_folder
-        )
-        assert len(download_url_or_path) <= 1
-        if len(download_url_or_path) == 1:
-            downloaded_file = os.path.join(base_folder, download_url_or_path[0])
-            shutil.copyfile(downloaded_file, xml_path)
-        shutil.rmtree(dump_folder)
+    download_xml_file(chain, store_id, category, xml_path)
 
     if not os.path.exists(xml_path):
         return BeautifulSoup()
@@ -98,6 +112,181 @@ def get_bs_object_from_link(
     return get_bs_object_from_xml(xml_path)
 
 
+def download_xml_file(
+    chain: SupermarketChain,
+    store_id: int,
+    category: FileTypesFilters,
+    xml_path: str,
+) -> None:
+    """
+    This function downloads the latest file of a given category to xml_path, unless it already exists.
+    If the chain did not publish such a file, nothing is written.
+
+    :param chain: A given supermarket chain
+    :param store_id: A given id of a store
+    :param category: A given category
+    :param xml_path: A given path to save the XML file to
+    """
+    _download_xml_files(chain, store_id, {category: xml_path})
+
+
+def download_xml_files(
+    chain: SupermarketChain,
+    store_id: int,
+    categories: List[FileTypesFilters],
+    check_latest: bool = True,
+) -> None:
+    """
+    This function downloads the latest files of the given categories which are not downloaded yet, fetching all of
+    them in a single scraping pass.
+
+    :param chain: A given supermarket chain
+    :param store_id: A given id of a store
+    :param categories: The categories to download
+    :param check_latest: Whether to check the existing files against the chain's latest files (otherwise only
+    missing files are downloaded)
+    """
+    _download_xml_files(
+        chain,
+        store_id,
+        {category: xml_file_gen(chain, store_id, category.name) for category in categories},
+        check_latest,
+    )
+
+
+def get_recorded_file_name(
+    chain: SupermarketChain,
+    store_id: int,
+    category: FileTypesFilters,
+    xml_path: str,
+) -> Optional[str]:
+    """
+    This function returns the name (as published by the chain) of the file of a given category that was downloaded
+    to a given path, according to the store's manifest, or None if there is no such file.
+    Files which are not recorded in the manifest are named by their content hash.
+    """
+    if not path.isfile(xml_path):
+        return None
+    entry = load_manifest(get_manifest_path(RAW_FILES_DIRNAME, repr(type(chain)), store_id)).get(category.name)
+    if is_entry_on_disk(entry) and entry["path"] == xml_path:
+        return entry["name"]
+    return get_file_hash(xml_path)
+
+
+def _download_xml_files(
+    chain: SupermarketChain,
+    store_id: int,
+    xml_paths: Dict[FileTypesFilters, str],
+    check_latest: bool = True,
+) -> None:
+    """
+    This function makes sure the latest file of every given category is at its given path, downloading only files
+    which are genuinely new.
+    Every downloaded file is recorded in the store's manifest. A recorded file is checked against the latest file the
+    chain lists: if it is still the latest, it is reused - moved to the given path together with its parsed
+    snapshot - instead of being downloaded and parsed again. The time of every check is recorded as well, so files
+    checked recently (by any process, e.g. when prefetching) are reused without listing them again, and categories
+    the chain did not publish are not looked for again. Files which are not recorded are trusted if they exist, as
+    before.
+    The scraper dumps into a folder next to the XML files, so the downloaded files are moved into place without
+    copying.
+    """
+    manifest_path = get_manifest_path(RAW_FILES_DIRNAME, repr(type(chain)), store_id)
+    manifest = load_manifest(manifest_path)
+    categories_to_check = list()
+    for category, xml_path in xml_paths.items():
+        entry = manifest.get(category.name)
+        if path.exists(xml_path) and (not check_latest or entry is None):
+            continue
+        if is_recently_checked(entry):
+            if is_entry_on_disk(entry) and entry["path"] != xml_path:
+                _move_xml_file(entry["path"], xml_path)
+                entry["path"] = xml_path
+                save_manifest(manifest_path, manifest)
+            if entry["name"] is None or path.exists(xml_path):
+                continue
+        categories_to_check.append(category)
+    if not categories_to_check:
+        return
+    dump_folder = path.join(
+        path.dirname(xml_paths[categories_to_check[0]]), ".dump_" + str(uuid.uuid4())
+    )
+    try:
+        categories_to_download = list()
+        recorded_categories = [
+            c
+            for c in categories_to_check
+            if check_latest and c.name in manifest and manifest[c.name]["name"] is not None
+        ]
+        latest_file_names = (
+            _get_latest_file_names(chain, store_id, recorded_categories, dump_folder)
+            if recorded_categories
+            else None
+        )
+        for category in categories_to_check:
+            xml_path = xml_paths[category]
+            entry = manifest.get(category.name)
+            if category not in recorded_categories or latest_file_names is None:
+                # Nothing to compare with - download the file only if there is no local copy
+                if not path.exists(xml_path):
+                    categories_to_download.append(category)
+            elif (
+                category in latest_file_names
+                and get_remote_file_key(latest_file_names[category]) == entry["name"]
+                and is_entry_on_disk(entry)
+            ):
+                if entry["path"] != xml_path:
+                    _move_xml_file(entry["path"], xml_path)
+                    entry["path"] = xml_path
+                entry["checked_at"] = time.time()
+            else:
+                categories_to_download.append(category)
+
+        if categories_to_download:
+            shutil.rmtree(dump_folder, ignore_errors=True)
+            base_folder, downloaded_files = chain.get_download_urls_or_paths(
+                store_id, categories_to_download, dump_folder
+            )
+            for category in categories_to_download:
+                xml_path = xml_paths[category]
+                if category in downloaded_files:
+                    downloaded_file = os.path.join(base_folder, downloaded_files[category])
+                    shutil.move(downloaded_file, xml_path)
+                    manifest[category.name] = create_manifest_entry(
+                        downloaded_files[category], xml_path
+                    )
+                elif not path.exists(xml_path):
+                    manifest[category.name] = create_unpublished_entry(xml_path)
+        save_manifest(manifest_path, manifest)
+    finally:
+        shutil.rmtree(dump_folder, ignore_errors=True)
+
+
+def _get_latest_file_names(
+    chain: SupermarketChain,
+    store_id: int,
+    categories: List[FileTypesFilters],
+    dump_folder: str,
+) -> Optional[Dict[FileTypesFilters, str]]:
+    """
+    This function lists the latest published files of the given categories, or returns None if the listing failed.
+    """
+    try:
+        return chain.get_latest_file_names(store_id, categories, dump_folder)
+    except Exception as e:
+        logging.warning(f"Could not list the latest files of {repr(type(chain))} store {store_id}: {e}")
+        return None
+
+
+def _move_xml_file(src_xml_path: str, dst_xml_path: str) -> None:
+    """
+    This function moves an XML file together with its parsed snapshot, so the snapshot stays valid.
+    """
+    shutil.move(src_xml_path, dst_xml_path)
+    if path.isfile(get_snapshot_path(src_xml_path)):
+        shutil.move(get_snapshot_path(src_xml_path), get_snapshot_path(dst_xml_path))
+
+
 def get_bs_object_from_xml(xml_path: str) -> BeautifulSoup:
     """
     This function creates a BeautifulSoup (BS) object from a given XML file.
@@ -105,15 +294,179 @@ def get_bs_object_from_xml(xml_path: str) -> BeautifulSoup:
     :param xml_path: A given path to an xml file to load/save the BS object from/to.
     :return: A BeautifulSoup object with xml content.
     """
-    with open(xml_path, "rb") as f_in:
+    with open_xml_file(xml_path) as f_in:
         return BeautifulSoup(f_in, features="xml")
 
 
+def open_xml_file(xml_path: str) -> BinaryIO:
+    """
+    This function opens a given XML file for reading. Files which are still gzip/zip compressed are decompressed
+    on the fly while they are read, rather than extracted to disk.
+
+    :param xml_path: A given path to an XML file, possibly compressed
+    :return: A binary file object with the XML content
+    """
+    with open(xml_path, "rb") as f_in:
+        magic = f_in.read(len(ZIP_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(xml_path, "rb")
+    if magic == ZIP_MAGIC:
+        with zipfile.ZipFile(xml_path) as zip_file:
+            return zip_file.open(zip_file.infolist()[0])
+    return open(xml_path, "rb")
+
+
+def iter_xml_elements(
+    xml_path: str, tag_name: Union[str, Sequence[str]]
+) -> Iterator[etree._Element]:
+    """
+    This function streams the elements with a given tag name from an XML file using lxml's iterparse.
+    Every element is cleared (together with its already handled siblings) once the consumer asks for the next one,
+    so memory stays flat regardless of the file's size.
+
+    :param xml_path: A given path to an XML file
+    :param tag_name: The name of the tags to yield, or a sequence of names
+    :return: An iterator over the matching elements
+    """
+    with open_xml_file(xml_path) as f_in:
+        for _, element in etree.iterparse(f_in, events=("end",), tag=tag_name):
+            yield element
+            element.clear(keep_tail=True)
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def iter_items_from_xml(chain: SupermarketChain, xml_path: str) -> Iterator[Item]:
+    """
+    This function streams Item instances from a given prices XML file.
+
+    :param chain: A given supermarket chain
+    :param xml_path: A given path to a prices XML file
+    :return: An iterator over the items in the file
+    """
+    schema = TagSchema(ITEM_TAG_PATTERNS)
+    for item_element in iter_xml_elements(xml_path, chain.item_tag_name):
+        yield Item.from_element(item_element, schema)
+
+
+def get_items_from_xml(chain: SupermarketChain, xml_path: str) -> ItemTable:
+    """
+    This function returns a table of the items in a given prices XML file, keyed by their item codes.
+    The table is loaded from the file's parsed snapshot if the file did not change since it was last parsed.
+
+    :param chain: A given supermarket chain
+    :param xml_path: A given path to a prices XML file
+    """
+    if not path.isfile(xml_path):
+        return ItemTable()
+    return load_or_build(xml_path, lambda: parse_items_from_xml(chain, xml_path))
+
+
+def parse_items_from_xml(chain: SupermarketChain, xml_path: str) -> ItemTable:
+    """
+    This function parses a table of the items in a given prices XML file.
+    The file is streamed with iterparse, and parsed with BeautifulSoup only if lxml fails to parse it.
+
+    :param chain: A given supermarket chain
+    :param xml_path: A given path to a prices XML file
+    """
+    try:
+        return ItemTable(iter_items_from_xml(chain, xml_path))
+    except etree.XMLSyntaxError as e:
+        logging.debug(f"Falling back to BeautifulSoup for {xml_path}: {e}")
+    bs_prices: BeautifulSoup = get_bs_object_from_xml(xml_path)
+    return ItemTable(
+        Item.from_tag(item_tag) for item_tag in bs_prices.find_all(chain.item_tag_name)
+    )
+
+
+def parse_price_updates_from_xml(
+    chain: SupermarketChain, xml_path: str
+) -> List[Tuple[Item, str]]:
+    """
+    This function parses the items in a given prices XML file together with their price update dates.
+    The file is streamed with iterparse, and parsed with BeautifulSoup only if lxml fails to parse it.
+
+    :param chain: A given supermarket chain
+    :param xml_path: A given path to a prices XML file
+    :return: (item, price update date) pairs, where a missing update date is an empty string
+    """
+    schema = TagSchema(ITEM_TAG_PATTERNS)
+    try:
+        return [
+            (
+                Item.from_element(item_element, schema),
+                item_element.findtext(PRICE_UPDATE_TAG_NAME) or "",
+            )
+            for item_element in iter_xml_elements(xml_path, chain.item_tag_name)
+        ]
+    except etree.XMLSyntaxError as e:
+        logging.debug(f"Falling back to BeautifulSoup for {xml_path}: {e}")
+    bs_prices: BeautifulSoup = get_bs_object_from_xml(xml_path)
+    price_updates = list()
+    for item_tag in bs_prices.find_all(chain.item_tag_name):
+        update_date_tag = item_tag.find(PRICE_UPDATE_TAG_NAME)
+        price_updates.append(
+            (Item.from_tag(item_tag), update_date_tag.text if update_date_tag else "")
+        )
+    return price_updates
+
+
+def iter_promotion_records(
+    chain: SupermarketChain, xml_path: str
+) -> Iterator[PromotionRecord]:
+    """
+    This function streams the promotions in a given promotions XML file, one record at a time.
+    The records are loaded from the file's parsed snapshot if the file did not change since it was last parsed.
+
+    :param chain: A given supermarket chain
+    :param xml_path: A given path to a promotions XML file
+    :return: An iterator over the promotions in the file
+    """
+    if not path.isfile(xml_path):
+        return iter(())
+    return iter_or_build(xml_path, lambda: parse_promotion_records(chain, xml_path))
+
+
+def parse_promotion_records(
+    chain: SupermarketChain, xml_path: str
+) -> Iterator[PromotionRecord]:
+    """
+    This function parses the promotions in a given promotions XML file, one record at a time.
+    The file is streamed with iterparse, and parsed with BeautifulSoup only if lxml fails to parse it - in that case
+    the records that were already yielded are skipped.
+
+    :param chain: A given supermarket chain
+    :param xml_path: A given path to a promotions XML file
+    """
+    schema = TagSchema(PROMOTION_TAG_PATTERNS)
+    num_of_yielded_records = 0
+    try:
+        for promo_element in iter_xml_elements(xml_path, chain.promotion_tag_name):
+            yield PromotionRecord.from_element(promo_element, schema)
+            num_of_yielded_records += 1
+        return
+    except etree.XMLSyntaxError as e:
+        logging.debug(f"Falling back to BeautifulSoup for {xml_path}: {e}")
+    bs_promos: BeautifulSoup = get_bs_object_from_xml(xml_path)
+    for promo_tag in bs_promos.find_all(chain.promotion_tag_name)[
+        num_of_yielded_records:
+    ]:
+        yield PromotionRecord.from_tag(promo_tag, schema)
+
+
+def get_price_file_types(include_non_full_price_file: bool) -> List[FileTypesFilters]:
+    price_file_types = [FileTypesFilters.PRICE_FULL_FILE]
+    if include_non_full_price_file:
+        price_file_types.append(FileTypesFilters.PRICE_FILE)
+    return price_file_types
+
+
 def create_items_dict(
     chain: SupermarketChain, store_id: int, load_xml, include_non_full_price_file: bool
-) -> Dict[str, Item]:
+) -> ItemTable:
     """
-    This function creates a dictionary where every key is an item code and its value is its corresponding Item instance.
+    This function creates a table of items, where every item can be looked up by its item code.
     We take both full and not full prices files, and assume that the no full is more updated (in case of overwriting).
 
     :param chain: A given supermarket chain
@@ -121,55 +474,22 @@ def create_items_dict(
     :param store_id: A given store id
     :param include_non_full_price_file: Whether to include "Price" file as well or only "PriceFull" file
     """
-    items_dict = dict()
-    price_file_types = [FileTypesFilters.PRICE_FULL_FILE]
-    if include_non_full_price_file:
-        price_file_types.append(FileTypesFilters.PRICE_FILE)
+    items_dict = ItemTable()
+    price_file_types = get_price_file_types(include_non_full_price_file)
+    download_xml_files(chain, store_id, price_file_types, check_latest=not load_xml)
     for category in tqdm(
         price_file_types,
         desc="prices_files",
     ):
         xml_path: str = xml_file_gen(chain, store_id, category.name)
-        bs_prices: BeautifulSoup = create_bs_object(
-            chain, store_id, category, load_xml, xml_path
-        )
-        items_tags = bs_prices.find_all(chain.item_tag_name)
-        items_dict.update(
-            {
-                item_tag.find("ItemCode").text: Item.from_tag(item_tag)
-                for item_tag in items_tags
-            }
-        )
+        items_dict.update(get_items_from_xml(chain, xml_path))
 
     return items_dict
 
 
-def log_products_prices(
-    chain: SupermarketChain, store_id: int, load_xml: bool, product_name: str
-) -> None:
-    """
-    This function prints the products in a given store which contains a given product_name.
-
-    :param chain: A given supermarket chain
-    :param store_id: A given store id
-    :param product_name: A given product name
-    :param load_xml: A boolean representing whether to load an existing xml or load an already saved one
-    """
-    items_dict: Dict[str, Item] = create_items_dict(chain, store_id, load_xml, True)
-    products_by_name = [
-        item for item in items_dict.values() if product_name in item.name
-    ]
-    products_by_name_sorted_by_price = sorted(
-        products_by_name, key=lambda item: item.price_by_measure
-    )
-
-    for prod in products_by_name_sorted_by_price:
-        logging.info(prod)
-
-
-def get_float_from_tag(tag, int_tag) -> int:
-    content = tag.find(int_tag)
-    return float(content.text) if content else 0
+def get_float_from_record(record: PromotionRecord, field_name: str) -> float:
+    content = record.get(field_name)
+    return float(content) if content is not None else 0
 
 
 def is_valid_promotion_output_file(output_file: str) -> bool:
@@ -178,6 +498,12 @@ def is_valid_promotion_output_file(output_file: str) -> bool:
     )
 
 
+def is_valid_prices_output_file(output_file: str) -> bool:
+    return any(
+        output_file.endswith(extension) for extension in VALID_PRICES_FILE_EXTENSIONS
+    )
+
+
 def valid_promotion_output_file(output_file: str) -> str:
     if not is_valid_promotion_output_file(output_file):
         raise ArgumentTypeError(
@@ -186,6 +512,17 @@ def valid_promotion_output_file(output_file: str) -> str:
     return output_file
 
 
+def valid_output_file(output_file: str) -> str:
+    if not (
+        is_valid_promotion_output_file(output_file)
+        or is_valid_prices_output_file(output_file)
+    ):
+        raise ArgumentTypeError(
+            f"Given output file has an invalid extension is invalid: {output_file}"
+        )
+    return output_file
+
+
 def log_message_and_time_if_debug(msg: str) -> None:
     logging.info(msg)
     logging.debug(datetime.now())
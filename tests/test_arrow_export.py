@@ -0,0 +1,70 @@
+import sys, os
+from datetime import datetime
+
+import pytest
+
+sys.path.append(os.path.abspath(os.curdir))
+pa = pytest.importorskip("pyarrow")
+from src import arrow_export
+from src.arrow_export import read_arrow_table, write_items_to_arrow
+from src.item import Item
+from src.item_table import ItemTable
+from src.promotion import (
+    PROMOTIONS_TABLE_HEADERS,
+    ClubID,
+    Promotion,
+    RewardType,
+    find_promo_function,
+    write_promotions_to_table,
+)
+
+
+def _create_promotion(promotion_id, items):
+    return Promotion(
+        content=f"מבצע {promotion_id}",
+        start_date=datetime(2023, 1, 1),
+        end_date=datetime(2030, 1, 1),
+        update_date=datetime(2023, 1, 1, 8, 30),
+        items=items,
+        rule=find_promo_function(RewardType.DISCOUNT_IN_PERCENTAGE, "", "", 1, 0.25, None),
+        club_id=ClubID.REGULAR,
+        promotion_id=promotion_id,
+        max_qty=2,
+        allow_multiple_discounts=False,
+        reward_type=RewardType.DISCOUNT_IN_PERCENTAGE,
+    )
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".arrow"])
+def test_promotions_are_written_in_typed_batches(tmp_path, monkeypatch, extension):
+    monkeypatch.setattr(arrow_export, "BATCH_ROWS", 3)
+    items = [Item(f"מוצר {i}", 8.0, 8.0, str(i), "תנובה") for i in range(4)]
+    output_filename = str(tmp_path / f"promos{extension}")
+    write_promotions_to_table([_create_promotion(1, items), _create_promotion(2, items[:3])], output_filename)
+
+    table = read_arrow_table(output_filename)
+    assert table.column_names == PROMOTIONS_TABLE_HEADERS
+    assert table.num_rows == 7
+    assert pa.types.is_dictionary(table.schema.field(PROMOTIONS_TABLE_HEADERS[0]).type)
+    assert table.schema.field(PROMOTIONS_TABLE_HEADERS[3]).type == pa.float64()
+    assert table.column(PROMOTIONS_TABLE_HEADERS[3]).to_pylist() == [6.0] * 7
+    assert table.column(PROMOTIONS_TABLE_HEADERS[11])[0].as_py() == datetime(2023, 1, 1, 8, 30)
+
+    columns = [PROMOTIONS_TABLE_HEADERS[0], PROMOTIONS_TABLE_HEADERS[13]]
+    table = read_arrow_table(output_filename, columns=columns)
+    assert table.column_names == columns
+    assert table.column(columns[0]).to_pylist()[2:5] == ["מבצע 1", "מבצע 1", "מבצע 2"]
+
+
+def test_items_are_written_with_their_promotions(tmp_path):
+    items_dict = ItemTable([Item("חלב", 6.2, 6.2, "1", "תנובה"), Item("לחם", 8.5, 11.3, "2", "ברמן")])
+    items_dict.get("1").final_price = 5.0
+    items_dict.get("1").add_promotion({"content": "מבצע", "discounted_price": 5.0})
+    output_filename = str(tmp_path / "prices.parquet")
+    write_items_to_arrow(items_dict, output_filename)
+
+    assert read_arrow_table(output_filename).to_pylist() == [
+        item.to_dict() for item in items_dict.values()
+    ]
+    assert read_arrow_table(output_filename, columns=["final_price"]).to_pydict() == {"final_price": [5.0, 8.5]}
+    assert os.listdir(tmp_path) == ["prices.parquet"]
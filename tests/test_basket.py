@@ -0,0 +1,58 @@
+import sys, os
+
+sys.path.append(os.path.abspath(os.curdir))
+from src import basket as basket_module
+from src.basket import (
+    BasketCost,
+    compare_basket,
+    compare_basket_in_stores,
+    parse_basket,
+)
+from src.chains.shufersal import Shufersal
+from src.item import Item
+from src.item_table import ItemTable
+from src.utils import RAW_FILES_DIRNAME
+
+
+def _create_items_dict(prices):
+    return ItemTable(
+        Item(f"item {code}", price, price, code, "") for code, price in prices.items()
+    )
+
+
+def test_parse_basket():
+    assert parse_basket(["1", "2:3", "1:0.5"]) == {"1": 1.5, "2": 3.0}
+
+
+def test_compare_basket_uses_final_prices():
+    cheap = _create_items_dict({"1": 5.0, "2": 10.0})
+    cheap.get("2").final_price = 7.5  # A promotion
+    expensive = _create_items_dict({"1": 6.0, "2": 9.0})
+    partial = _create_items_dict({"1": 1.0})
+    costs = compare_basket(
+        {"1": 2, "2": 1},
+        {("A", 1): expensive, ("B", 2): partial, ("C", 3): cheap},
+    )
+    assert costs == [
+        BasketCost("C", 3, 17.5, []),
+        BasketCost("A", 1, 21.0, []),
+        BasketCost("B", 2, 2.0, ["2"]),
+    ]
+
+
+def test_store_tables_are_built_once_a_day(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / RAW_FILES_DIRNAME).mkdir()
+    built_stores = list()
+
+    def fake_prices_with_promos(store_id, chain, load_promos, load_prices):
+        built_stores.append(store_id)
+        return _create_items_dict({"1": float(store_id)})
+
+    monkeypatch.setattr(basket_module, "get_all_prices_with_promos", fake_prices_with_promos)
+    stores = {"Shufersal": [2, "001"]}
+    chains_dict = {"Shufersal": Shufersal()}
+    for _ in range(2):
+        costs = compare_basket_in_stores({"1": 1}, stores, chains_dict, load_xml=True)
+        assert [(cost.store_id, cost.total) for cost in costs] == [(1, 1.0), (2, 2.0)]
+    assert built_stores == [2, 1]
@@ -0,0 +1,196 @@
+import sys, os
+import time
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.curdir))
+from src import basket_optimizer, promotion
+from src.basket_optimizer import optimize_basket, optimize_basket_in_store
+from src.chains.shufersal import Shufersal
+from src.item import Item
+from src.item_table import ItemTable
+from src.promotion import ClubID, Promotion, RewardType, find_promo_function
+
+ITEMS = ItemTable(
+    [
+        Item("במבה", 5.0, 5.0, "1", "אסם"),
+        Item("ביסלי", 6.0, 6.0, "2", "אסם"),
+        Item("חלב", 6.2, 6.2, "3", "תנובה"),
+        Item("קפה", 30.0, 30.0, "4", "עלית"),
+    ]
+)
+
+
+def _create_promotion(
+    promotion_id: int,
+    codes,
+    reward_type: RewardType,
+    min_qty: float = 1,
+    max_qty: float = 0,
+    discounted_price=None,
+    discount_rate=None,
+    allow_multiple_discounts: bool = False,
+    club_id: ClubID = ClubID.REGULAR,
+    min_purchase_amount: float = 0,
+) -> Promotion:
+    return Promotion(
+        content=f"מבצע {promotion_id}",
+        start_date=datetime(2023, 1, 1),
+        end_date=datetime(2030, 1, 1),
+        update_date=datetime(2023, 1, 1),
+        items=[ITEMS[code] for code in codes],
+        rule=find_promo_function(
+            reward_type=reward_type,
+            remark="",
+            promo_description="",
+            min_qty=min_qty,
+            discount_rate=discount_rate,
+            discounted_price=discounted_price,
+        ),
+        club_id=club_id,
+        promotion_id=promotion_id,
+        max_qty=max_qty,
+        allow_multiple_discounts=allow_multiple_discounts,
+        reward_type=reward_type,
+        min_purchase_amount=min_purchase_amount,
+    )
+
+
+def test_bundles_respect_min_qty_and_max_qty():
+    # 3 snacks for 12, mixing both snacks, up to 6 units
+    snacks = _create_promotion(
+        1, ["1", "2"], RewardType.DISCOUNT_IN_MULTIPLE_INSTANCES, min_qty=3, max_qty=6, discounted_price=12
+    )
+    optimization = optimize_basket({"1": 5, "2": 3, "3": 1}, ITEMS, [snacks])
+    assert optimization.regular_total == 49.2
+    # The most expensive units are bundled first: (6, 6, 6) and then (5, 5, 5)
+    assert [p.codes for p in optimization.applied_promotions] == [["2", "2", "2"], ["1", "1", "1"]]
+    assert optimization.total == 12 + 12 + 2 * 5.0 + 6.2
+    assert optimization.missing == []
+
+
+def test_best_exclusive_promotion_is_picked():
+    ten_percent = _create_promotion(1, ["4"], RewardType.DISCOUNT_IN_PERCENTAGE, discount_rate=0.1)
+    two_for_50 = _create_promotion(
+        2, ["4"], RewardType.DISCOUNT_IN_MULTIPLE_INSTANCES, min_qty=2, discounted_price=50
+    )
+    club = _create_promotion(
+        3, ["4"], RewardType.DISCOUNT_IN_MULTIPLE_INSTANCES, discounted_price=10, club_id=ClubID.CLUB
+    )
+    promotions = [ten_percent, two_for_50, club]
+    optimization = optimize_basket({"4": 3}, ITEMS, promotions)
+    assert [p.promotion_id for p in optimization.applied_promotions] == [2, 1]
+    assert optimization.total == 50 + 27
+    assert optimize_basket({"4": 3}, ITEMS, promotions, [ClubID.REGULAR, ClubID.CLUB]).total == 30
+
+
+def test_only_combinable_promotions_are_stacked():
+    ten_percent = _create_promotion(
+        1, ["3"], RewardType.DISCOUNT_IN_PERCENTAGE, discount_rate=0.1, allow_multiple_discounts=True
+    )
+    # 1 off purchases of 10 - saves more than 10% off a milk, so it is applied first
+    one_shekel_off = _create_promotion(
+        2, ["3"], RewardType.DISCOUNT_BY_THRESHOLD, discount_rate=1, allow_multiple_discounts=True,
+        min_purchase_amount=10,
+    )
+    optimization = optimize_basket({"3": 2}, ITEMS, [ten_percent, one_shekel_off])
+    assert [p.promotion_id for p in optimization.applied_promotions] == [2, 1, 1]
+    assert optimization.total == round((6.2 * 2 - 1) * 0.9, 2)
+    # A single milk does not reach the threshold
+    assert optimize_basket({"3": 1}, ITEMS, [ten_percent, one_shekel_off]).total == round(6.2 * 0.9, 2)
+    exclusive_off = _create_promotion(
+        2, ["3"], RewardType.DISCOUNT_BY_THRESHOLD, discount_rate=1, min_purchase_amount=10
+    )
+    assert optimize_basket({"3": 2}, ITEMS, [ten_percent, exclusive_off]).total == 6.2 * 2 - 1
+
+
+def test_threshold_discounts_are_taken_off_the_bundle_spend():
+    # 20 off purchases of 100
+    twenty_off = _create_promotion(
+        1, ["4", "1"], RewardType.DISCOUNT_BY_THRESHOLD, discount_rate=20, min_purchase_amount=100
+    )
+    optimization = optimize_basket({"4": 5}, ITEMS, [twenty_off])
+    # Four coffees reach the threshold, and the discount is taken off them once
+    assert [p.codes for p in optimization.applied_promotions] == [["4"] * 4]
+    assert optimization.applied_promotions[0].saving == 20
+    assert optimization.total == 150 - 20
+    assert optimize_basket({"4": 3, "1": 1}, ITEMS, [twenty_off]).total == 95
+    assert optimize_basket({"4": 3, "1": 2}, ITEMS, [twenty_off]).total == 100 - 20
+    # Without a minimal purchase amount, the discount is taken off every bundle of min_qty units
+    two_off = _create_promotion(2, ["4"], RewardType.DISCOUNT_BY_THRESHOLD, min_qty=2, discount_rate=2)
+    assert optimize_basket({"4": 5}, ITEMS, [two_off]).total == 150 - 2 * 2
+
+
+def test_mixed_price_bundles():
+    # 1+1: the cheaper unit is free
+    one_plus_one = _create_promotion(1, ["4", "1"], RewardType.SECOND_OR_THIRD_INSTANCE_FOR_FREE, min_qty=2)
+    optimization = optimize_basket({"4": 1, "1": 1}, ITEMS, [one_plus_one])
+    assert optimization.applied_promotions[0].saving == 5
+    assert optimization.total == 30
+    # The second unit for 1
+    second_for_one = _create_promotion(
+        2, ["4", "1"], RewardType.SECOND_INSTANCE_DIFFERENT_DISCOUNT, min_qty=2, discounted_price=1
+    )
+    assert optimize_basket({"4": 1, "1": 1}, ITEMS, [second_for_one]).total == 31
+    assert optimize_basket({"4": 2, "1": 1}, ITEMS, [second_for_one]).total == 30 + 1 + 5
+    # 2 snacks for 10
+    two_for_ten = _create_promotion(
+        3, ["1", "2"], RewardType.DISCOUNT_IN_MULTIPLE_INSTANCES, min_qty=2, discounted_price=10
+    )
+    optimization = optimize_basket({"1": 1, "2": 1}, ITEMS, [two_for_ten])
+    assert [p.codes for p in optimization.applied_promotions] == [["2", "1"]]
+    assert optimization.total == 10
+    # A fixed price higher than the bundle's regular price saves nothing
+    assert optimize_basket({"1": 2}, ITEMS, [two_for_ten]).applied_promotions == []
+
+
+def test_missing_items_and_fractional_quantities():
+    optimization = optimize_basket({"3": 1.5, "9": 1}, ITEMS, [])
+    assert optimization.total == optimization.regular_total == 9.3
+    assert optimization.missing == ["9"]
+
+
+def test_large_baskets_are_optimized_quickly():
+    items = ItemTable(Item(f"item {i}", 1.0 + i % 7, 1.0, str(i), "") for i in range(50))
+    promotions = [
+        Promotion(
+            content="",
+            start_date=datetime(2023, 1, 1),
+            end_date=datetime(2030, 1, 1),
+            update_date=datetime(2023, 1, 1),
+            items=[items[str((i * 7 + j) % 50)] for j in range(5)],
+            rule=find_promo_function(
+                RewardType.DISCOUNT_IN_MULTIPLE_INSTANCES, "", "", 2, None, 1.5 + i % 3
+            ),
+            club_id=ClubID.REGULAR,
+            promotion_id=i,
+            max_qty=6,
+            allow_multiple_discounts=i % 2 == 0,
+            reward_type=RewardType.DISCOUNT_IN_MULTIPLE_INSTANCES,
+        )
+        for i in range(100)
+    ]
+    start = time.perf_counter()
+    optimization = optimize_basket({str(i): 1 + i % 4 for i in range(50)}, items, promotions)
+    assert time.perf_counter() - start < 2
+    assert optimization.total < optimization.regular_total
+
+
+def test_store_prices_are_parsed_once(monkeypatch):
+    parsed = list()
+
+    def fake_create_items_dict(*args):
+        parsed.append(args)
+        return ITEMS
+
+    monkeypatch.setattr(basket_optimizer, "download_store_files", lambda *args, **kwargs: None)
+    monkeypatch.setattr(basket_optimizer, "create_items_dict", fake_create_items_dict)
+    monkeypatch.setattr(promotion, "create_items_dict", None)
+    monkeypatch.setattr(promotion, "iter_promos_records", lambda *args: iter([]))
+    optimization = optimize_basket_in_store(Shufersal(), 1, {"3": 2}, load_xml=True)
+    assert optimization.total == 12.4 and len(parsed) == 1
+
+
+def test_unknown_promotions_are_ignored():
+    unknown = _create_promotion(1, ["3"], RewardType(1), min_qty=0, discounted_price=5.0)
+    assert unknown.rule.is_unknown()
+    assert optimize_basket({"3": 1}, ITEMS, [unknown]).total == 6.2
@@ -0,0 +1,76 @@
+import sys, os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.append(os.path.abspath(os.curdir))
+from src import db_clients
+from src.db_clients import ProcessLocal, get_mongo_client, pg_connection
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+
+
+class FakePool:
+    def __init__(self):
+        self.borrowed = list()
+        self.returned = list()
+
+    def getconn(self):
+        conn = FakeConnection()
+        self.borrowed.append(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        self.returned.append((conn, close))
+
+
+def test_process_local_values_are_created_once_per_process():
+    created = list()
+    closed = list()
+
+    def factory():
+        created.append(threading.current_thread().name)
+        return object()
+
+    value = ProcessLocal(factory, closed.append)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        values = list(executor.map(lambda _: value.get(), range(32)))
+    assert len(created) == 1 and all(v is values[0] for v in values)
+    value.close()
+    assert closed == [values[0]]
+    assert value.get() is not values[0] and len(created) == 2
+
+    # A forked child creates its own value
+    value._after_fork()
+    assert value.get() is not values[0] and len(created) == 3
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Requires fork")
+def test_forked_children_do_not_share_the_client(monkeypatch):
+    monkeypatch.setenv("MONGODB", "mongodb://localhost:1/?serverSelectionTimeoutMS=1")
+    client = get_mongo_client()
+    assert get_mongo_client() is client
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_fd, b"1" if get_mongo_client() is not client else b"0")
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read_fd, 1) == b"1"
+    db_clients.close_clients()
+
+
+def test_pg_connections_are_returned_to_the_pool(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(db_clients, "_PG_POOL", ProcessLocal(lambda: pool, lambda _: None))
+    with pg_connection() as conn:
+        assert pool.borrowed == [conn]
+    with pytest.raises(RuntimeError):
+        with pg_connection() as broken_conn:
+            broken_conn.closed = 1
+            raise RuntimeError("server closed the connection unexpectedly")
+    assert pool.returned == [(conn, False), (broken_conn, True)]
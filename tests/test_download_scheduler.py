@@ -0,0 +1,103 @@
+import sys, os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.curdir))
+from src.chains.king_store import KingStore
+from src.chains.rami_levi import RamiLevi
+from src.chains.shufersal import Shufersal
+from src.chains.yohananof import Yohananof
+from src.download_scheduler import (
+    DownloadJob,
+    DownloadScheduler,
+    HostLimits,
+    create_url_jobs,
+)
+
+
+class _CountingHandler(BaseHTTPRequestHandler):
+    """
+    Serves every path but /missing after a short delay, and records the concurrent requests and start times per Host
+    header.
+    """
+
+    lock = threading.Lock()
+    active = defaultdict(int)
+    max_active = defaultdict(int)
+    starts = defaultdict(list)
+
+    def do_GET(self):
+        host = self.headers["Host"]
+        with self.lock:
+            self.active[host] += 1
+            self.max_active[host] = max(self.max_active[host], self.active[host])
+            self.starts[host].append(time.monotonic())
+        time.sleep(0.05)
+        with self.lock:
+            self.active[host] -= 1
+        if self.path == "/missing":
+            self.send_error(404)
+            return
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _CountingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_hosts_are_throttled_separately(tmp_path):
+    server = _serve()
+    port = server.server_address[1]
+    try:
+        # The same server under two host names stands in for two backend hosts
+        slow_host, fast_host = f"127.0.0.1:{port}", f"localhost:{port}"
+        urls = {f"http://{slow_host}/slow{i}": str(tmp_path / f"slow{i}") for i in range(3)}
+        urls.update({f"http://{fast_host}/fast{i}": str(tmp_path / f"fast{i}") for i in range(4)})
+        urls[f"http://{fast_host}/missing"] = str(tmp_path / "missing")
+        scheduler = DownloadScheduler(
+            default_limits=HostLimits(max_concurrency=4, min_interval=0),
+            host_limits={slow_host: HostLimits(max_concurrency=1, min_interval=0.2)},
+        )
+        results = scheduler.run(create_url_jobs(urls))
+    finally:
+        server.shutdown()
+
+    assert [result.job.key for result in results] == list(urls)
+    failed = [result.job.key for result in results if result.error]
+    assert failed == [f"http://{fast_host}/missing"]
+    assert not os.path.exists(tmp_path / "missing")
+    assert (tmp_path / "fast3").read_text() == "/fast3"
+
+    assert _CountingHandler.max_active[slow_host] == 1
+    assert _CountingHandler.max_active[fast_host] > 1
+    # The starts are measured by the server, so they may be a little closer than the client spaced them
+    slow_starts = _CountingHandler.starts[slow_host]
+    assert all(b - a >= 0.15 for a, b in zip(slow_starts, slow_starts[1:]))
+
+
+def test_jobs_errors_do_not_stop_other_jobs():
+    def fail():
+        raise ValueError("No files to download")
+
+    results = DownloadScheduler().run(
+        [DownloadJob("a", fail, key="bad"), DownloadJob("b", sum, ([1, 2],), key="good")]
+    )
+    assert "ValueError" in results[0].error
+    assert results[1].result == 3 and results[1].error is None
+
+
+def test_chains_sharing_an_engine_share_a_host():
+    assert RamiLevi().download_host == Yohananof().download_host
+    assert KingStore().download_host == "binaprojects.com"
+    assert Shufersal().download_host == "Shufersal"
@@ -0,0 +1,55 @@
+import sys, os
+
+sys.path.append(os.path.abspath(os.curdir))
+from src.json_merge import merge_store_exports
+
+
+def _record(code, price, chain, store_id, date):
+    return {"code": code, "price": price, "chain": chain, "store_id": store_id, "date": date}
+
+
+def _export(chain, store_id, date, prices):
+    return chain, store_id, date, (_record(code, price, chain, store_id, date) for code, price in prices.items())
+
+
+def test_exports_are_merged_by_barcode(tmp_path):
+    exports = [
+        _export("Shufersal", "1", "2024-03-30", {"1": 5.0, "2": 6.0}),
+        _export("Shufersal", "2", "2024-03-30", {"1": 5.5}),
+        _export("Victory", "7", "2024-03-31", {"1": 4.0, "3": 7.0}),
+    ]
+    merged = dict(merge_store_exports(iter(exports), buckets=4, spill_dir=str(tmp_path)))
+    assert merged["1"] == {
+        "2024-03-30.Shufersal.1": _record("1", 5.0, "Shufersal", "1", "2024-03-30"),
+        "2024-03-30.Shufersal.2": _record("1", 5.5, "Shufersal", "2", "2024-03-30"),
+        "2024-03-31.Victory.7": _record("1", 4.0, "Victory", "7", "2024-03-31"),
+    }
+    # Only the exported records are set, so the other stores' records of the barcode are kept in the database
+    assert merged["3"] == {"2024-03-31.Victory.7": _record("3", 7.0, "Victory", "7", "2024-03-31")}
+    assert sorted(merged) == ["1", "2", "3"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_later_exports_of_a_record_win(tmp_path):
+    exports = [
+        _export("Shufersal", "1", "2024-03-31", {"1": 5.0}),
+        ("Shufersal", "1", "2024-03-31", iter([{"code": "1", "removed": True}])),
+    ]
+    merged = dict(merge_store_exports(iter(exports), buckets=4, spill_dir=str(tmp_path)))
+    assert merged == {"1": {"2024-03-31.Shufersal.1": {"code": "1", "removed": True}}}
+
+
+def test_exports_are_read_once_and_documents_are_emitted_lazily(tmp_path):
+    read_exports = list()
+
+    def exports():
+        for store_id in range(20):
+            read_exports.append(store_id)
+            yield _export("Shufersal", str(store_id), "2024-03-31", {str(code): float(code) for code in range(100)})
+
+    documents = merge_store_exports(exports(), buckets=8, spill_dir=str(tmp_path))
+    assert read_exports == []
+    barcode, document = next(documents)
+    assert read_exports == list(range(20))
+    assert len(document) == 20
+    assert len(list(documents)) == 99
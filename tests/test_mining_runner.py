@@ -0,0 +1,114 @@
+import sys, os
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.append(os.path.abspath(os.curdir))
+from src.item import Item
+from src.item_table import ItemTable
+from src.utils import RAW_FILES_DIRNAME
+
+mine_data = pytest.importorskip("mine_data")
+
+JOBS = [("Shufersal", 1, False), ("RamiLevi", 2, False), ("Victory", 3, True)]
+
+
+def fake_mine_store(job):
+    chain, store_id, promos = job
+    if store_id == 2:
+        return chain, store_id, "ValueError: bad store"
+    return chain, store_id, None
+
+
+def dying_mine_store(job):
+    chain, store_id, promos = job
+    if store_id == 2:
+        os._exit(1)
+    return chain, store_id, None
+
+
+def test_jobs_run_serially_with_one_worker(monkeypatch):
+    mined = []
+
+    def fake_run_this_shit(chain, store_id, promos):
+        mined.append((chain, store_id, promos))
+        if store_id == 2:
+            raise ValueError("bad store")
+
+    monkeypatch.setattr(mine_data, "run_this_shit", fake_run_this_shit)
+    results = mine_data.run_mining_jobs(JOBS, workers=1)
+
+    assert mined == JOBS
+    assert results[("Shufersal", 1)] is None
+    assert results[("Victory", 3)] is None
+    assert "ValueError: bad store" in results[("RamiLevi", 2)]
+
+
+def test_a_failing_job_is_collected_with_its_traceback(monkeypatch):
+    def failing_run_this_shit(chain, store_id, promos):
+        raise RuntimeError("site is down")
+
+    monkeypatch.setattr(mine_data, "run_this_shit", failing_run_this_shit)
+    chain, store_id, error = mine_data.mine_store(("Shufersal", 1, False))
+
+    assert (chain, store_id) == ("Shufersal", 1)
+    assert "Traceback" in error and "RuntimeError: site is down" in error
+
+
+def test_jobs_run_in_a_process_pool(monkeypatch):
+    monkeypatch.setattr(mine_data, "mine_store", fake_mine_store)
+    results = mine_data.run_mining_jobs(JOBS, workers=2)
+
+    assert results == {("Shufersal", 1): None, ("RamiLevi", 2): "ValueError: bad store", ("Victory", 3): None}
+
+
+def test_a_dead_worker_is_reported_as_its_job_error(monkeypatch):
+    monkeypatch.setattr(mine_data, "mine_store", dying_mine_store)
+    results = mine_data.run_mining_jobs(JOBS, workers=2)
+
+    # Every job gets a result, and the job whose worker died gets the pool's error
+    assert set(results) == {("Shufersal", 1), ("RamiLevi", 2), ("Victory", 3)}
+    assert "BrokenProcessPool" in results[("RamiLevi", 2)]
+
+
+def test_postgres_gets_every_change_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / RAW_FILES_DIRNAME).mkdir()
+    (tmp_path / "results").mkdir()
+    prices = {"1": 5.0, "2": 6.0}
+    sent = []
+    monkeypatch.setattr(
+        mine_data,
+        "get_all_prices_with_promos",
+        lambda **kwargs: ItemTable(Item(f"item {code}", price, price, code, "") for code, price in prices.items()),
+    )
+    monkeypatch.setattr(mine_data, "write_store_prices", lambda *args: None)
+    monkeypatch.setattr(mine_data, "send_data_to_db", lambda records, *args: sent.append(list(records)))
+
+    mine_data.download_from_chain("Shufersal", 1)
+    prices["2"] = 6.5
+    # The first export was not merged into Mongo, so it is appended with the repeated changes - but Postgres
+    # gets only the new change
+    mine_data.download_from_chain("Shufersal", 1)
+    assert [[record["code"] for record in records] for records in sent] == [["1", "2"], ["2"]]
+    export_files = os.listdir(tmp_path / "results")
+    assert len(export_files) == 1
+    with open(tmp_path / "results" / export_files[0], encoding="utf-8") as f_in:
+        assert len(f_in.readlines()) == 4
+
+
+def test_removed_items_are_sent_to_postgres(monkeypatch):
+    ingested = []
+
+    @contextmanager
+    def fake_pg_connection():
+        yield "connection"
+
+    monkeypatch.setattr(mine_data, "pg_connection", fake_pg_connection)
+    monkeypatch.setattr(mine_data, "copy_store_prices", lambda *args: ingested.append(args))
+    records = [{"code": "1", "name": "item 1", "price": 5.0}, {"code": "2", "removed": True}]
+    mine_data.send_data_to_db(iter(records), "Shufersal", "1", "2024-03-31")
+    assert ingested == [("connection", records[:1], 5, 1, "2024-03-31", ["2"])]
+    # Nothing to write - no connection is made
+    monkeypatch.setattr(mine_data, "pg_connection", None)
+    mine_data.send_data_to_db(iter([]), "Shufersal", "1", "2024-03-31")
@@ -0,0 +1,77 @@
+import sys, os
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.curdir))
+from pymongo.errors import AutoReconnect, BulkWriteError
+from pymongo.results import BulkWriteResult
+from src.mongo_writer import BulkUpsertWriter
+
+
+class FakeCollection:
+    """
+    An in-process stand-in for a pymongo collection, supporting unordered bulk upserts.
+    """
+
+    def __init__(self, delay: float = 0, failing_batches=()):
+        self.documents = dict()
+        self.calls = list()
+        self.delay = delay
+        self.failing_batches = set(failing_batches)
+
+    def bulk_write(self, requests, ordered=True):
+        self.calls.append((len(requests), ordered, threading.current_thread().name))
+        time.sleep(self.delay)
+        if len(self.calls) in self.failing_batches:
+            raise AutoReconnect("connection closed")
+        upserted = modified = 0
+        errors = list()
+        for i, request in enumerate(requests):
+            document_id = request._filter["_id"]
+            if document_id is None:
+                errors.append({"index": i, "errmsg": "invalid _id"})
+                continue
+            document = self.documents.setdefault(document_id, {"_id": document_id})
+            upserted += len(document) == 1
+            modified += len(document) > 1
+            document.update(request._doc["$set"])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nUpserted": upserted, "nModified": modified})
+        return BulkWriteResult({"nUpserted": upserted, "nModified": modified, "upserted": []}, True)
+
+
+def test_documents_are_upserted_in_unordered_batches():
+    collection = FakeCollection()
+    collection.documents["1"] = {"_id": "1", "2024-03-30": {}}
+    with BulkUpsertWriter(collection, batch_size=4) as writer:
+        for i in range(10):
+            writer.upsert(str(i), {"2024-03-31": {"Shufersal": {"1": i}}})
+    assert [operations for operations, _, _ in collection.calls] == [4, 4, 2]
+    assert all(not ordered and thread == "BulkUpsertWriter" for _, ordered, thread in collection.calls)
+    assert collection.documents["1"] == {"_id": "1", "2024-03-30": {}, "2024-03-31": {"Shufersal": {"1": 1}}}
+    assert writer.operations == 10
+    assert [result.upserted for result in writer.results] == [3, 4, 2]
+
+
+def test_batches_are_written_while_producing():
+    collection = FakeCollection(delay=0.05)
+    start = time.perf_counter()
+    with BulkUpsertWriter(collection, batch_size=1, max_pending_batches=8) as writer:
+        for i in range(8):
+            writer.upsert(str(i), {"i": i})
+        produced = time.perf_counter() - start
+    assert produced < 0.05 * 4
+    assert len(collection.documents) == 8
+
+
+def test_failing_batches_are_reported():
+    collection = FakeCollection(failing_batches=[2])
+    writer = BulkUpsertWriter(collection, batch_size=2)
+    for document_id in ["1", "2", "3", "4", None, "5"]:
+        writer.upsert(document_id, {"price": 1})
+    results = writer.close()
+    assert [result.error is None for result in results] == [True, False, False]
+    assert results[1].error == "AutoReconnect: connection closed"
+    assert results[2].error == "1 failed operations: invalid _id" and results[2].upserted == 1
+    assert [result.batch_number for result in writer.failed_batches] == [2, 3]
+    assert sorted(collection.documents) == ["1", "2", "5"]
@@ -0,0 +1,53 @@
+import sys, os
+
+import pytest
+
+sys.path.append(os.path.abspath(os.curdir))
+from src import ndjson_io
+from src.item import Item
+from src.item_table import ItemTable
+from src.ndjson_io import iter_ndjson, write_ndjson
+
+ITEMS = ItemTable([Item("חלב 3%", 6.2, 6.2, "1", "תנובה"), Item('לחם "אחיד"', 8.5, 11.3, "2", "ברמן")])
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_records_are_written_and_read_one_at_a_time(tmp_path, monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(ndjson_io, "orjson", None)
+    output_filename = str(tmp_path / "prices.ndjson")
+    produced = list()
+
+    def records():
+        for item in ITEMS.values():
+            produced.append(item.code)
+            yield item.to_dict()
+
+    assert write_ndjson(records(), output_filename) == 2
+    with open(output_filename, "rb") as f_in:
+        assert f_in.read().count(b"\n") == 2
+    reader = iter_ndjson(output_filename)
+    assert next(reader) == ITEMS["1"].to_dict()
+    assert list(reader) == [ITEMS["2"].to_dict()]
+
+
+def test_truncated_last_record_is_skipped(tmp_path):
+    output_filename = str(tmp_path / "prices.ndjson")
+    write_ndjson((item.to_dict() for item in ITEMS.values()), output_filename)
+    with open(output_filename, "ab") as f_out:
+        f_out.write(b'{"name": "\xd7\x92\xd7\x91\xd7\x99\xd7\xa0\xd7\x94", "pri')
+    assert [record["code"] for record in iter_ndjson(output_filename)] == ["1", "2"]
+
+    with open(output_filename, "ab") as f_out:
+        f_out.write(b"\n")
+    with pytest.raises(ValueError):
+        list(iter_ndjson(output_filename))
+
+
+def test_records_are_appended_after_a_truncated_record(tmp_path):
+    output_filename = str(tmp_path / "prices.ndjson")
+    assert write_ndjson([ITEMS["1"].to_dict()], output_filename, append=True) == 1
+    with open(output_filename, "ab") as f_out:
+        f_out.write(b'{"name": "\xd7\x92\xd7\x91\xd7\x99\xd7\xa0\xd7\x94", "pri')
+    assert write_ndjson([ITEMS["2"].to_dict()], output_filename, append=True) == 1
+    assert list(iter_ndjson(output_filename)) == [ITEMS["1"].to_dict(), ITEMS["2"].to_dict()]
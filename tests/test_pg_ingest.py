@@ -0,0 +1,128 @@
+import sys, os
+import csv
+
+import pytest
+
+sys.path.append(os.path.abspath(os.curdir))
+from src.pg_ingest import copy_store_prices, create_copy_buffer
+
+RECORDS = [
+    {"code": "1", "name": 'חלב 3% "תנובה", 1 ל', "price": 6.2, "final_price": 5.9, "price_by_measure": 6.2,
+     "manufacturer": "תנובה"},
+    {"code": "2", "name": "", "price": 5.0, "final_price": 5.0, "price_by_measure": None, "manufacturer": ""},
+]
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, query, params=None):
+        if self.conn.fail_on and self.conn.fail_on in query:
+            raise RuntimeError("function insert_price does not exist")
+        self.conn.statements.append((" ".join(query.split()), params))
+
+    def copy_expert(self, query, buffer):
+        self.conn.copied = buffer.read()
+        self.rowcount = self.conn.copied.count("\n")
+        self.conn.statements.append((query, None))
+
+
+class FakeConnection:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.statements = list()
+        self.copied = ""
+        self.commits = self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_copy_buffer_quotes_strings():
+    rows = list(csv.reader(create_copy_buffer(RECORDS)))
+    assert rows[0] == ["1", 'חלב 3% "תנובה", 1 ל', "6.2", "5.9", "6.2", "תנובה"]
+    lines = create_copy_buffer(RECORDS).read().splitlines()
+    assert lines[1] == '"2","",5.0,5.0,"",""'
+
+
+def test_store_prices_are_merged_in_one_transaction():
+    conn = FakeConnection()
+    assert copy_store_prices(conn, RECORDS, 5, "12", "2024-03-31") == 2
+    queries = [query for query, _ in conn.statements]
+    assert queries[2].startswith("COPY price_staging")
+    assert queries[3].startswith("SELECT insert_product_name(code, name, %(chain)s)")
+    assert queries[4].startswith("SELECT insert_price(")
+    assert conn.statements[4][1] == {"chain": 5, "date": "2024-03-31", "store_id": 12}
+    assert (conn.commits, conn.rollbacks) == (1, 0)
+
+    failing_conn = FakeConnection(fail_on="insert_price")
+    with pytest.raises(RuntimeError):
+        copy_store_prices(failing_conn, RECORDS, 5, 12, "2024-03-31")
+    assert (failing_conn.commits, failing_conn.rollbacks) == (0, 1)
+
+
+def test_removed_items_are_recorded_in_the_same_transaction():
+    conn = FakeConnection()
+    assert copy_store_prices(conn, RECORDS, 5, 12, "2024-03-31", removed_codes=["3", "4"]) == 2
+    queries = [query for query, _ in conn.statements]
+    assert queries[5].startswith("CREATE TEMP TABLE IF NOT EXISTS price_removal_staging")
+    assert queries[8].startswith("COPY price_removal_staging")
+    assert conn.copied == '"3"\n"4"\n'
+    assert queries[9].startswith("INSERT INTO price_removals (code, chain, store_id, date) SELECT code")
+    assert conn.statements[9][1] == {"chain": 5, "date": "2024-03-31", "store_id": 12}
+    assert (conn.commits, conn.rollbacks) == (1, 0)
+
+    failing_conn = FakeConnection(fail_on="INSERT INTO price_removals")
+    with pytest.raises(RuntimeError):
+        copy_store_prices(failing_conn, RECORDS, 5, 12, "2024-03-31", removed_codes=["3"])
+    assert (failing_conn.commits, failing_conn.rollbacks) == (0, 1)
+
+
+@pytest.mark.skipif("TEST_PG_DSN" not in os.environ, reason="Requires a local PostgreSQL (TEST_PG_DSN)")
+def test_copy_store_prices_against_postgres():
+    psycopg2 = pytest.importorskip("psycopg2")
+    conn = psycopg2.connect(os.environ["TEST_PG_DSN"])
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TEMP TABLE products (code text, name text, chain int, PRIMARY KEY (code, chain));
+            CREATE TEMP TABLE prices (code text, price real, final_price real, price_by_measure real,
+                                      manufacturer text, chain int, date date, store_id int);
+            CREATE FUNCTION pg_temp.insert_product_name(c text, n text, ch int) RETURNS void AS
+                'INSERT INTO products VALUES (c, n, ch) ON CONFLICT (code, chain) DO UPDATE SET name = n'
+                LANGUAGE sql;
+            CREATE FUNCTION pg_temp.insert_price(c text, p real, fp real, pbm real, m text, ch int, d date, s int)
+                RETURNS void AS 'INSERT INTO prices VALUES (c, p, fp, pbm, m, ch, d, s)' LANGUAGE sql;
+            SET search_path TO pg_temp, public;
+            """
+        )
+    conn.commit()
+    try:
+        assert copy_store_prices(conn, RECORDS, 5, 12, "2024-03-31", removed_codes=["3"]) == 2
+        with conn.cursor() as cur:
+            cur.execute("SELECT code, name FROM products ORDER BY code")
+            assert cur.fetchall() == [("1", RECORDS[0]["name"]), ("2", "")]
+            cur.execute("SELECT code, final_price, price_by_measure, store_id FROM prices ORDER BY code")
+            assert cur.fetchall() == [("1", 5.9, 6.2, 12), ("2", 5.0, None, 12)]
+            cur.execute("SELECT code, chain, store_id FROM price_removals")
+            assert cur.fetchall() == [("3", 5, 12)]
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS price_removals")
+        conn.commit()
+        conn.close()
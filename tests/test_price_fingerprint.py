@@ -0,0 +1,69 @@
+import sys, os
+
+sys.path.append(os.path.abspath(os.curdir))
+from src.chains.shufersal import Shufersal
+from src.item import Item
+from src.item_table import ItemTable
+from src.price_fingerprint import (
+    StoreDiff,
+    commit_pending_fingerprint,
+    diff_store_items,
+    get_fingerprint_path,
+    get_pending_fingerprint_path,
+    get_pg_fingerprint_path,
+)
+from src.utils import RAW_FILES_DIRNAME
+
+
+def _create_items_dict(prices):
+    return ItemTable(Item(f"item {code}", price, price, code, "") for code, price in prices.items())
+
+
+def test_only_changes_since_the_saved_fingerprint_are_emitted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / RAW_FILES_DIRNAME).mkdir()
+    chain = Shufersal()
+
+    store_diff, fingerprint = diff_store_items(chain, 1, _create_items_dict({"1": 5.0, "2": 6.0, "3": 7.0}))
+    assert store_diff == StoreDiff(["1", "2", "3"], [])
+    # Until the fingerprint is saved (after writing the changes), the changes are emitted again
+    assert diff_store_items(chain, 1, _create_items_dict({"1": 5.0}))[0] == StoreDiff(["1"], [])
+    fingerprint.save(get_fingerprint_path(chain, 1))
+
+    items_dict = _create_items_dict({"1": 5.0, "2": 6.5, "4": 8.0})
+    assert diff_store_items(chain, 1, items_dict)[0] == StoreDiff(["2", "4"], ["3"])
+    items_dict.get("1").final_price = 4.0  # A new promotion
+    assert diff_store_items(chain, 1, items_dict)[0] == StoreDiff(["1", "2", "4"], ["3"])
+    # Other stores are diffed on their own
+    assert diff_store_items(chain, 2, items_dict)[0] == StoreDiff(["1", "2", "4"], [])
+
+
+def test_pending_fingerprints_are_used_once_committed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / RAW_FILES_DIRNAME).mkdir()
+    chain = Shufersal()
+    items_dict = _create_items_dict({"1": 5.0, "2": 6.0})
+
+    assert not commit_pending_fingerprint(chain, 1)
+    diff_store_items(chain, 1, items_dict)[1].save(get_pending_fingerprint_path(chain, 1))
+    # The changes weren't written to all the databases yet, so they are emitted again
+    assert diff_store_items(chain, 1, items_dict)[0] == StoreDiff(["1", "2"], [])
+    assert commit_pending_fingerprint(chain, 1)
+    assert diff_store_items(chain, 1, items_dict)[0] == StoreDiff([], [])
+    assert not os.path.exists(get_pending_fingerprint_path(chain, 1))
+
+
+def test_postgres_fingerprint_is_kept_apart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / RAW_FILES_DIRNAME).mkdir()
+    chain = Shufersal()
+    items_dict = _create_items_dict({"1": 5.0, "2": 6.0})
+    pg_fingerprint_path = get_pg_fingerprint_path(chain, 1)
+
+    pg_diff, fingerprint = diff_store_items(chain, 1, items_dict, pg_fingerprint_path)
+    assert pg_diff == StoreDiff(["1", "2"], [])
+    fingerprint.save(pg_fingerprint_path)
+    fingerprint.save(get_pending_fingerprint_path(chain, 1))
+    # Postgres was written to, but the export wasn't merged into Mongo yet
+    assert diff_store_items(chain, 1, items_dict, pg_fingerprint_path)[0] == StoreDiff([], [])
+    assert diff_store_items(chain, 1, items_dict)[0] == StoreDiff(["1", "2"], [])
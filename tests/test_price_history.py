@@ -0,0 +1,53 @@
+import sys, os
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.append(os.path.abspath(os.curdir))
+pytest.importorskip("pyarrow")
+from src.item import Item
+from src.item_table import ItemTable
+from src.price_history import get_history_file_path, read_price_history, write_store_prices
+
+TODAY = date(2024, 3, 31)
+
+
+def _create_items_dict(prices):
+    items_dict = ItemTable(
+        Item(f"item {code}", price, price, code, "") for code, price in prices.items()
+    )
+    items_dict.get("1").final_price = prices["1"] - 1
+    return items_dict
+
+
+def test_price_history_of_an_item_across_stores(tmp_path):
+    history_dir = str(tmp_path)
+    for days_ago in range(5):
+        day = TODAY - timedelta(days=days_ago)
+        write_store_prices(_create_items_dict({"1": 10.0 + days_ago, "2": 3.0}), "Shufersal", 1, day, history_dir)
+        write_store_prices(_create_items_dict({"1": 20.0, "3": 4.0}), "Victory", 7, day, history_dir)
+
+    history = read_price_history(["1"], days=2, end_date=TODAY, history_dir=history_dir)
+    assert list(history.itertuples(index=False, name=None)) == [
+        ("2024-03-30", "Shufersal", "1", 11.0, 10.0, 11.0, 1),
+        ("2024-03-30", "Victory", "1", 20.0, 19.0, 20.0, 7),
+        ("2024-03-31", "Shufersal", "1", 10.0, 9.0, 10.0, 1),
+        ("2024-03-31", "Victory", "1", 20.0, 19.0, 20.0, 7),
+    ]
+
+    history = read_price_history(
+        ["1", "3"], days=90, end_date=TODAY, chain_names=["Victory"], columns=["final_price"], history_dir=history_dir
+    )
+    assert list(history.columns) == ["date", "chain", "code", "final_price", "store_id"]
+    assert len(history) == 10 and set(history["chain"]) == {"Victory"}
+    assert read_price_history(["1"], end_date=TODAY - timedelta(days=30), history_dir=history_dir).empty
+
+
+def test_store_prices_are_replaced_in_the_same_day(tmp_path):
+    history_dir = str(tmp_path)
+    write_store_prices(_create_items_dict({"1": 10.0}), "Shufersal", 1, TODAY, history_dir)
+    file_path = write_store_prices(_create_items_dict({"1": 12.0}), "Shufersal", 1, TODAY, history_dir)
+    assert file_path == get_history_file_path("Shufersal", 1, TODAY, history_dir)
+    assert os.listdir(os.path.dirname(file_path)) == ["1.parquet"]
+    history = read_price_history(["1"], end_date=TODAY, history_dir=history_dir)
+    assert history["price"].tolist() == [12.0]
@@ -0,0 +1,77 @@
+import sys, os
+
+sys.path.append(os.path.abspath(os.curdir))
+from il_supermarket_scarper.main import FileTypesFilters
+from src import product_index
+from src.chains.shufersal import Shufersal
+from src.item import Item
+from src.item_table import ItemTable
+from src.product_index import ProductIndex, get_product_index
+from src.utils import RAW_FILES_DIRNAME, xml_file_gen
+
+ITEMS = ItemTable(
+    [
+        Item("שוקולד מריר 70%", 9.9, 9.9, "1", "עלית"),
+        Item("שוקולד חלב", 5.9, 5.9, "2", "עלית"),
+        Item("חלב 3% בקרטון", 6.2, 6.2, "3", "תנובה"),
+        Item("לחם אחיד פרוס", 8.5, 11.33, "4", "ברמן"),
+        Item("גבינה צהובה עמק", 30.0, 75.0, "5", "תנובה"),
+    ]
+)
+
+
+def _codes(items):
+    return [item.code for item in items]
+
+
+def test_substring_search_is_ranked_by_price_by_measure():
+    index = ProductIndex(ITEMS)
+    assert _codes(index.search("שוקולד")) == ["2", "1"]
+    assert _codes(index.search("חלב")) == ["2", "3"]
+    assert _codes(index.search("חלב", limit=1)) == ["2"]
+    assert _codes(index.search("לחם-אחיד")) == ["4"]
+    assert _codes(index.search("אחיד פרוס")) == ["4"]
+    assert index.search("קפה") == []
+
+
+def test_search_normalises_hebrew():
+    index = ProductIndex(ITEMS)
+    # Final letters, gershayim and spacing variants are matched regardless of their spelling
+    assert _codes(index.search("לחמ אחיד")) == ["4"]
+    assert _codes(index.search('גבינה צהובה עמק"')) == ["5"]
+    assert _codes(index.search("צהובה  עמק")) == ["5"]
+
+
+def test_fuzzy_search_finds_misspelled_names():
+    index = ProductIndex(ITEMS)
+    assert _codes(index.fuzzy_search("שוקולד מרירר")) == ["1"]
+    assert _codes(index.fuzzy_search("גבינה צהובה", min_similarity=0.4)) == ["5"]
+
+
+def test_product_index_is_saved_until_the_prices_change(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / RAW_FILES_DIRNAME).mkdir()
+    chain = Shufersal()
+    monkeypatch.setattr(chain, "get_download_urls_or_paths", lambda *args: ("", {}))
+    xml_path = xml_file_gen(chain, 1, FileTypesFilters.PRICE_FULL_FILE.name)
+    items_xml = "".join(
+        f"<Item><ItemCode>{item.code}</ItemCode><ItemName>{item.name}</ItemName>"
+        f"<ManufacturerName>{item.manufacturer}</ManufacturerName><ItemPrice>{item.price}</ItemPrice>"
+        f"<UnitOfMeasurePrice>{item.price_by_measure}</UnitOfMeasurePrice></Item>"
+        for item in ITEMS.values()
+    )
+    with open(xml_path, "w", encoding="utf-8") as f_out:
+        f_out.write(f"<root><Items>{items_xml}</Items></root>")
+
+    assert _codes(get_product_index(chain, 1, load_xml=True).search("שוקולד")) == ["2", "1"]
+
+    def fail_building(*args):
+        raise AssertionError("The index should be loaded")
+
+    with monkeypatch.context() as m:
+        m.setattr(product_index, "create_items_dict", fail_building)
+        assert _codes(get_product_index(chain, 1, load_xml=True).search("שוקולד")) == ["2", "1"]
+
+    with open(xml_path, "w", encoding="utf-8") as f_out:
+        f_out.write(f"<root><Items>{items_xml.replace('9.9', '1.9')}</Items></root>")
+    assert _codes(get_product_index(chain, 1, load_xml=True).search("שוקולד")) == ["1", "2"]
@@ -1,8 +1,21 @@
 import sys, os
 
 sys.path.append(os.path.abspath(os.curdir))
+from datetime import datetime
+
+import numpy as np
+import pytest
+
 from src.item import Item
-from src.promotion import RewardType, find_promo_function, get_discount_rate
+from src.promotion import (
+    ClubID,
+    Promotion,
+    RewardType,
+    apply_promotion_rules,
+    find_promo_function,
+    get_discount_rate,
+    is_valid_promo,
+)
 
 
 # TODO: create a test for Shufersal promo type 3
@@ -436,3 +449,129 @@ def test_coop_promo_type_10():
         reward_type,
         remark,
     )
+
+
+def test_promotion_rules_applied_on_price_columns():
+    rules = [
+        find_promo_function(
+            reward_type=RewardType(7),
+            remark="",
+            promo_description="1+1הזול מוצרי קולקשיין שופרסל",
+            min_qty=2.00,
+            discount_rate=get_discount_rate(10000, True),
+            discounted_price=None,
+        ),
+        find_promo_function(
+            reward_type=RewardType(9),
+            remark="",
+            promo_description="ב-שני ב10 ירקות קפואים שופרסל",
+            min_qty=2.00,
+            discount_rate=None,
+            discounted_price=10.00,
+        ),
+        find_promo_function(
+            reward_type=RewardType(3),
+            remark="",
+            promo_description="ק/אמנטל ב14.90 נעם 30% 200גר",
+            min_qty=1,
+            discount_rate=2.50,
+            discounted_price=14.90,
+        ),
+    ]
+    prices = np.array([14.9, 18.9, 17.4, 9.3])
+    rows = np.array([0, 1, 2, 3, 0])
+    pairs_rules = [rules[0], rules[1], rules[2], rules[0], rules[1]]
+    discounted_prices = apply_promotion_rules(
+        prices, rows, np.array([rule.coefficients() for rule in pairs_rules])
+    )
+    assert discounted_prices.tolist() == [
+        rule(Item("", prices[row], 1, "", "")) for rule, row in zip(pairs_rules, rows)
+    ]
+
+
+def test_unknown_rules_discount_nothing():
+    unknown_rule = find_promo_function(
+        reward_type=RewardType(1),
+        remark="",
+        promo_description="x",
+        min_qty=0.0,
+        discount_rate=None,
+        discounted_price=5.0,
+    )
+    assert unknown_rule.is_unknown()
+    assert unknown_rule.apply([10.0, 3.0]).tolist() == [10.0, 3.0]
+    discounted_prices = apply_promotion_rules(
+        np.array([10.0, 3.0]), np.array([1, 0]), np.array([unknown_rule.coefficients()] * 2)
+    )
+    assert discounted_prices.tolist() == [3.0, 10.0]
+
+    promo = Promotion(
+        content="מבצע",
+        start_date=datetime(2024, 1, 1),
+        end_date=datetime(2024, 2, 1),
+        update_date=datetime(2024, 1, 1),
+        items=[Item("חלב", 10.0, 10.0, "1", "")],
+        rule=unknown_rule,
+        club_id=ClubID.REGULAR,
+        promotion_id=1,
+        max_qty=0,
+        allow_multiple_discounts=False,
+        reward_type=RewardType(1),
+    )
+    assert not is_valid_promo(promo)
+
+
+def _baseline_promo_function(reward_type, remark, promo_description, min_qty, discount_rate, discounted_price):
+    # The per-item promotion functions the rules replaced, as they were
+    if reward_type == RewardType.SECOND_INSTANCE_DIFFERENT_DISCOUNT:
+        if not discounted_price:
+            return lambda item: item.price * (1 - (discount_rate / min_qty))
+        return lambda item: (item.price * (min_qty - 1) + discounted_price) / min_qty
+    if reward_type == RewardType.DISCOUNT_IN_ITEM_IF_PURCHASING_OTHER_ITEMS:
+        return lambda item: item.price
+    if reward_type == RewardType.SECOND_OR_THIRD_INSTANCE_FOR_FREE:
+        return lambda item: item.price * (1 - (1 / min_qty))
+    if reward_type == RewardType.DISCOUNT_IN_PERCENTAGE:
+        return lambda item: item.price * (1 - discount_rate / (2 if "השני ב" in promo_description else 1))
+    if reward_type == RewardType.SECOND_INSTANCE_SAME_DISCOUNT:
+        if "השני ב" in promo_description:
+            return lambda item: (item.price + discounted_price) / 2
+        return lambda item: discounted_price / min_qty
+    if reward_type == RewardType.DISCOUNT_BY_THRESHOLD:
+        return lambda item: item.price - discount_rate
+    if reward_type == RewardType.OTHER:
+        return lambda item: item.price
+    if 'מחיר המבצע הינו המחיר לק"ג' in remark:
+        return lambda item: discounted_price
+    if discounted_price and min_qty:
+        return lambda item: discounted_price / min_qty
+    return lambda item: -1
+
+
+def test_known_rules_match_the_baseline_promotion_functions():
+    prices = np.array([0.9, 5.0, 14.9, 30.0, 113.0])
+    checked = 0
+    for reward_type in RewardType:
+        for remark in ["", 'מחיר המבצע הינו המחיר לק"ג']:
+            for promo_description in ["", "השני ב-50%"]:
+                for min_qty, discount_rate, discounted_price in [(1, 0.1, None), (2, 0.5, 10.0), (3, 20.0, 25.0)]:
+                    args = (reward_type, remark, promo_description, min_qty, discount_rate, discounted_price)
+                    rule = find_promo_function(*args)
+                    baseline = _baseline_promo_function(*args)
+                    try:
+                        expected = [baseline(Item("", price, price, "", "")) for price in prices]
+                        if None in expected:
+                            raise TypeError("The baseline returned no price")
+                    except (TypeError, ZeroDivisionError):
+                        # Like the baseline, a rule lacking a parameter its reward type needs raises
+                        with pytest.raises((TypeError, ZeroDivisionError)):
+                            rule.apply(prices)
+                        continue
+                    if rule.is_unknown():
+                        continue
+                    assert rule.apply(prices).tolist() == expected, args
+                    assert apply_promotion_rules(
+                        prices, np.arange(len(prices)), np.array([rule.coefficients()] * len(prices))
+                    ).tolist() == expected, args
+                    checked += 1
+    assert checked > 0
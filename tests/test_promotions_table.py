@@ -0,0 +1,66 @@
+import sys, os
+import csv
+import subprocess
+import zipfile
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.curdir))
+from src.item import Item
+from src.promotion import (
+    PROMOTIONS_TABLE_HEADERS,
+    ClubID,
+    Promotion,
+    RewardType,
+    find_promo_function,
+    write_promotions_to_table,
+)
+
+
+def _create_promotions(num_of_promotions, items_per_promotion):
+    return [
+        Promotion(
+            content=f"מבצע {i}",
+            start_date=datetime(2023, 1, 1),
+            end_date=datetime(2030, 1, 1),
+            update_date=datetime(2023, 1, 1),
+            items=[Item(f"מוצר {i}-{j}", 10.0, 10.0, f"{i}{j}", "") for j in range(items_per_promotion)],
+            rule=find_promo_function(RewardType.DISCOUNT_IN_PERCENTAGE, "", "", 1, 0.1, None),
+            club_id=ClubID.REGULAR,
+            promotion_id=i,
+            max_qty=0,
+            allow_multiple_discounts=False,
+            reward_type=RewardType.DISCOUNT_IN_PERCENTAGE,
+        )
+        for i in range(num_of_promotions)
+    ]
+
+
+def test_promotions_csv(tmp_path):
+    output_filename = str(tmp_path / "promos.csv")
+    write_promotions_to_table(_create_promotions(3, 2), output_filename)
+    with open(output_filename, encoding="utf_8") as f_in:
+        rows = list(csv.reader(f_in))
+    assert rows[0] == PROMOTIONS_TABLE_HEADERS
+    assert len(rows) == 7
+    assert rows[1][:4] == ["מבצע 0", "מוצר 0-0", "10.0", "9.0"]
+
+
+def test_promotions_xlsx_is_written_row_by_row(tmp_path):
+    output_filename = str(tmp_path / "promos.xlsx")
+    write_promotions_to_table(_create_promotions(50, 4), output_filename)
+    with zipfile.ZipFile(output_filename) as xlsx:
+        sheet = xlsx.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    assert f'<autoFilter ref="A1:{chr(ord("A") + len(PROMOTIONS_TABLE_HEADERS) - 1)}201"/>' in sheet
+    assert sheet.count("<row ") == 201
+    # Strings are written inline in constant memory mode
+    assert "מבצע 49" in sheet and "מוצר 49-3" in sheet
+
+
+def test_promotions_module_does_not_import_pandas():
+    imported = subprocess.run(
+        [sys.executable, "-c", "import sys; import src.promotion; print('pandas' in sys.modules)"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert imported.stdout.strip() == "False"
@@ -0,0 +1,126 @@
+import sys, os
+
+sys.path.append(os.path.abspath(os.curdir))
+import time
+
+from il_supermarket_scarper.main import FileTypesFilters
+from src import store_utils
+from src.chains.shufersal import Shufersal
+from src.chains.victory import Victory
+from src.download_manifest import create_manifest_entry, get_manifest_path, save_manifest
+from src.store_utils import get_store_index, normalize_hebrew
+from src.utils import RAW_FILES_DIRNAME, xml_file_gen
+
+SHUFERSAL_STORES_XML = """<?xml version="1.0" encoding="utf-8"?>
+<asx:abap xmlns:asx="http://www.sap.com/abapxml" version="1.0">
+  <asx:values>
+    <STORES>
+      <STORE>
+        <STOREID>245</STOREID>
+        <STORENAME>שלי תל-אביב בזל</STORENAME>
+        <ADDRESS>בזל 22</ADDRESS>
+        <CITY>תל אביב-יפו</CITY>
+        <SUBCHAINNAME>שופרסל שלי</SUBCHAINNAME>
+      </STORE>
+      <STORE>
+        <STOREID>129</STOREID>
+        <STORENAME>דיל ראשל"צ</STORENAME>
+        <ADDRESS>הרצל 1</ADDRESS>
+        <CITY>ראשון לציון</CITY>
+        <SUBCHAINNAME>שופרסל דיל</SUBCHAINNAME>
+      </STORE>
+    </STORES>
+  </asx:values>
+</asx:abap>
+"""
+
+VICTORY_STORES_XML = """<?xml version="1.0" encoding="utf-8"?>
+<Root>
+  <Stores>
+    <Store>
+      <StoreId>89</StoreId>
+      <StoreName>ויקטורי דיזנגוף</StoreName>
+      <Address>דיזנגוף 50</Address>
+      <City>תל אביב - יפו</City>
+      <SubChainName>ויקטורי</SubChainName>
+    </Store>
+  </Stores>
+</Root>
+"""
+
+
+def test_normalize_hebrew():
+    assert normalize_hebrew("תל-אביב  יפו") == normalize_hebrew(" תל אביב־יפו ")
+    assert normalize_hebrew('ראשל"צ') == normalize_hebrew("ראשל״צ") == "ראשלצ"
+    assert normalize_hebrew("חולון") == normalize_hebrew("חולונ")
+    assert normalize_hebrew(None) == ""
+
+
+def test_store_index_covers_all_chains(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / RAW_FILES_DIRNAME).mkdir()
+    chains = [Shufersal(), Victory()]
+    for chain, stores_xml in zip(chains, [SHUFERSAL_STORES_XML, VICTORY_STORES_XML]):
+        with open(xml_file_gen(chain, -1, FileTypesFilters.STORE_FILE.name), "w", encoding="utf-8") as f_out:
+            f_out.write(stores_xml)
+
+    index = get_store_index(chains, load_xml=True)
+    stores = index.find("תל אביב יפו")
+    assert [(store.chain, store.store_id) for store in stores] == [("Shufersal", "245"), ("Victory", "89")]
+    assert [store.store_id for store in index.find("תל אביב יפו", ["Victory"])] == ["89"]
+    # Cities are matched against the stores' names as well
+    assert [store.address for store in index.find('ראשל"צ')] == ["הרצל 1"]
+
+    def fail_parsing(*args):
+        raise AssertionError("Unchanged stores files should not be parsed again")
+
+    monkeypatch.setattr(store_utils, "parse_stores_from_xml", fail_parsing)
+    assert len(get_store_index(chains, load_xml=True).find("תל-אביב יפו")) == 2
+
+
+def test_store_names_are_looked_up_by_their_ngrams():
+    index = store_utils.StoreIndex()
+    index.update_chain(
+        "Shufersal",
+        [
+            store_utils.StoreInfo("Shufersal", "1", "דיל חולון", "בת ים", "סוקולוב 1", "שופרסל דיל"),
+            store_utils.StoreInfo("Shufersal", "2", "שלי חולון מרכז", "חולון", "הרצל 2", "שופרסל שלי"),
+            store_utils.StoreInfo("Shufersal", "3", "דיל לון", "רמת גן", "ויצמן 3", "שופרסל דיל"),
+        ],
+        "hash",
+    )
+    # The city's stores come first, then the other stores whose names contain it
+    assert [store.store_id for store in index.find("חולון")] == ["2", "1"]
+    assert [store.store_id for store in index.find("לון")] == ["1", "2", "3"]
+    # Names are compared with cities too short to have n-grams one by one
+    assert [store.store_id for store in index.find("לו")] == ["1", "2", "3"]
+    assert index.find("אילת") == []
+
+
+def test_store_index_downloads_only_stale_stores_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / RAW_FILES_DIRNAME).mkdir()
+    chains = [Shufersal(), Victory()]
+    for chain, stores_xml in zip(chains, [SHUFERSAL_STORES_XML, VICTORY_STORES_XML]):
+        xml_path = xml_file_gen(chain, -1, FileTypesFilters.STORE_FILE.name)
+        with open(xml_path, "w", encoding="utf-8") as f_out:
+            f_out.write(stores_xml)
+    get_store_index(chains, load_xml=True)
+    # Shufersal's stores file was checked an hour ago, and Victory's two days ago
+    for chain, checked_at in zip(chains, [time.time() - 60 * 60, time.time() - 2 * 24 * 60 * 60]):
+        xml_path = xml_file_gen(chain, -1, FileTypesFilters.STORE_FILE.name)
+        entry = create_manifest_entry(f"Stores{repr(type(chain))}-202301010300.xml", xml_path)
+        entry["checked_at"] = checked_at
+        save_manifest(
+            get_manifest_path(RAW_FILES_DIRNAME, repr(type(chain)), -1),
+            {FileTypesFilters.STORE_FILE.name: entry},
+        )
+    downloaded_chains = list()
+
+    def fake_create_store_jobs(stores, categories):
+        downloaded_chains.extend(repr(type(chain)) for chain, _ in stores)
+        return []
+
+    monkeypatch.setattr(store_utils, "create_store_jobs", fake_create_store_jobs)
+    assert len(get_store_index(chains, load_xml=False).find("תל אביב יפו")) == 2
+    assert downloaded_chains == ["Victory"]
@@ -0,0 +1,558 @@
+import gzip
+import sys, os
+
+sys.path.append(os.path.abspath(os.curdir))
+from il_supermarket_scarper.main import FileTypesFilters
+from src.chains.engines.matrix import Matrix
+from src.chains.shufersal import Shufersal
+from src.chains.victory import Victory
+from src.item import Item
+from src.item_table import ItemTable
+from src.promotion import get_all_prices_with_promos
+from src.price_state import PriceState, get_price_state_path, update_price_state
+from src.promotion_record import PromotionRecord
+from src.download_manifest import get_manifest_path, load_manifest, save_manifest
+from src.snapshot_cache import get_snapshot_path
+from src.tag_schema import PROMOTION_TAG_PATTERNS, TagSchema
+from src import download_manifest, utils
+from src.utils import (
+    RAW_FILES_DIRNAME,
+    get_bs_object_from_xml,
+    get_items_from_xml,
+    iter_promotion_records,
+    xml_file_gen,
+)
+
+PRICES_XML = """<?xml version="1.0" encoding="utf-8"?>
+<root>
+  <ChainId>7290027600007</ChainId>
+  <Items Count="2">
+    <Item>
+      <PriceUpdateDate>2023-01-01 10:00</PriceUpdateDate>
+      <ItemCode>7290000000001</ItemCode>
+      <ItemName>חלב 3% 1 ליטר</ItemName>
+      <ManufacturerName>תנובה</ManufacturerName>
+      <ItemPrice>6.20</ItemPrice>
+      <UnitOfMeasurePrice>6.20</UnitOfMeasurePrice>
+    </Item>
+    <Item>
+      <PriceUpdateDate>2023-01-01 10:00</PriceUpdateDate>
+      <ItemCode>7290000000002</ItemCode>
+      <ItemName>לחם אחיד</ItemName>
+      <ManufacturerName>ברמן</ManufacturerName>
+      <ItemPrice>8.50</ItemPrice>
+      <UnitOfMeasurePrice>11.33</UnitOfMeasurePrice>
+    </Item>
+  </Items>
+</root>
+"""
+
+MATRIX_PRICES_XML = """<?xml version="1.0" encoding="utf-8"?>
+<Prices>
+  <Products>
+    <Product>
+      <ItemCode>7290000000003</ItemCode>
+      <ItemNm>שמן זית</ItemNm>
+      <ManufactureName>יד מרדכי</ManufactureName>
+      <ItemPrice>39.90</ItemPrice>
+      <UnitOfMeasurePrice>53.20</UnitOfMeasurePrice>
+    </Product>
+  </Products>
+</Prices>
+"""
+
+PROMOS_XML = """<?xml version="1.0" encoding="utf-8"?>
+<root>
+  <Promotions Count="2">
+    <Promotion>
+      <PromotionId>100</PromotionId>
+      <PromotionDescription>2 ב-10</PromotionDescription>
+      <MinQty>2</MinQty>
+      <DiscountedPrice>10</DiscountedPrice>
+      <PromotionItems Count="2">
+        <Item><ItemCode>7290000000001</ItemCode><IsGiftItem>0</IsGiftItem></Item>
+        <Item><ItemCode>7290000000009</ItemCode><IsGiftItem>0</IsGiftItem></Item>
+      </PromotionItems>
+      <Clubs><ClubId>0</ClubId></Clubs>
+    </Promotion>
+    <Promotion>
+      <PromotionId>101</PromotionId>
+      <PromotionDescription>מבצע</PromotionDescription>
+      <PromotionItems Count="1">
+        <Item><ItemCode>7290000000002</ItemCode></Item>
+      </PromotionItems>
+      <Clubs><ClubId>1</ClubId></Clubs>
+    </Promotion>
+  </Promotions>
+</root>
+"""
+
+MATRIX_PROMOS_XML = """<?xml version="1.0" encoding="utf-8"?>
+<Promos>
+  <Sales>
+    <Sale>
+      <ItemCode>7290000000003</ItemCode>
+      <PromotionID>7</PromotionID>
+      <ClubID>0</ClubID>
+    </Sale>
+  </Sales>
+</Promos>
+"""
+
+
+def _write_xml(tmp_path, content: str, file_name: str = "prices.xml") -> str:
+    xml_path = tmp_path / file_name
+    xml_path.write_text(content, encoding="utf-8")
+    return str(xml_path)
+
+
+def _bs_items(chain, xml_path: str):
+    bs_prices = get_bs_object_from_xml(xml_path)
+    return {
+        tag.find("ItemCode").text: Item.from_tag(tag)
+        for tag in bs_prices.find_all(chain.item_tag_name)
+    }
+
+
+def _as_tuple(item: Item):
+    return item.name, item.price, item.price_by_measure, item.code, item.manufacturer
+
+
+def test_streaming_matches_bs_parsing(tmp_path):
+    xml_path = _write_xml(tmp_path, PRICES_XML)
+    chain = Shufersal()
+    streamed = get_items_from_xml(chain, xml_path)
+    parsed = _bs_items(chain, xml_path)
+    assert list(streamed) == ["7290000000001", "7290000000002"]
+    assert {k: _as_tuple(v) for k, v in streamed.items()} == {
+        k: _as_tuple(v) for k, v in parsed.items()
+    }
+
+
+def test_streaming_honours_matrix_tag_names(tmp_path):
+    xml_path = _write_xml(tmp_path, MATRIX_PRICES_XML)
+    chain = Victory()
+    assert isinstance(chain, Matrix)
+    items = get_items_from_xml(chain, xml_path)
+    assert _as_tuple(items["7290000000003"]) == (
+        "שמן זית",
+        39.90,
+        53.20,
+        "7290000000003",
+        "יד מרדכי",
+    )
+
+
+def test_streaming_falls_back_on_broken_xml(tmp_path):
+    xml_path = _write_xml(tmp_path, PRICES_XML.replace("</root>", ""))
+    items = get_items_from_xml(Shufersal(), xml_path)
+    assert len(items) == 2
+
+
+def test_missing_file_has_no_items(tmp_path):
+    assert len(get_items_from_xml(Shufersal(), str(tmp_path / "missing.xml"))) == 0
+
+
+def _as_record_tuple(record: PromotionRecord):
+    return (
+        record.get("PromotionId"),
+        record.get("ClubId"),
+        record.get("MinQty"),
+        record.item_codes,
+    )
+
+
+def test_promotion_records_match_bs_parsing(tmp_path):
+    xml_path = _write_xml(tmp_path, PROMOS_XML, "promos.xml")
+    streamed = list(iter_promotion_records(Shufersal(), xml_path))
+    schema = TagSchema(PROMOTION_TAG_PATTERNS)
+    parsed = [
+        PromotionRecord.from_tag(tag, schema)
+        for tag in get_bs_object_from_xml(xml_path).find_all("Promotion")
+    ]
+    assert [_as_record_tuple(r) for r in streamed] == [
+        ("100", "0", "2", ["7290000000001", "7290000000009"]),
+        ("101", "1", None, ["7290000000002"]),
+    ]
+    assert [_as_record_tuple(r) for r in streamed] == [
+        _as_record_tuple(r) for r in parsed
+    ]
+
+
+def test_promotion_records_items_lookup(tmp_path):
+    chain = Shufersal()
+    items = get_items_from_xml(chain, _write_xml(tmp_path, PRICES_XML))
+    promos_xml_path = _write_xml(tmp_path, PROMOS_XML, "promos.xml")
+    record = next(iter_promotion_records(chain, promos_xml_path))
+    assert [item.code for item in chain.get_items(record, items)] == [
+        "7290000000001"
+    ]
+    assert chain.get_null_items(record, items) == ["7290000000009"]
+
+
+def test_matrix_promotion_records(tmp_path):
+    chain = Victory()
+    items = get_items_from_xml(chain, _write_xml(tmp_path, MATRIX_PRICES_XML))
+    promos_xml_path = _write_xml(tmp_path, MATRIX_PROMOS_XML, "promos.xml")
+    records = list(iter_promotion_records(chain, promos_xml_path))
+    assert [_as_record_tuple(r) for r in records] == [("7", "0", None, [])]
+    assert [item.code for item in chain.get_items(records[0], items)] == [
+        "7290000000003"
+    ]
+
+
+def test_tag_schema_resolves_once():
+    schema = TagSchema(PROMOTION_TAG_PATTERNS)
+    assert schema.get({"ItemCode": "1", "PromotionID": "7"}, "PromotionId") == "7"
+    assert schema.get({"PromotionID": "8"}, "PromotionId") == "8"
+    assert schema.get({"PromotionId": "9"}, "PromotionId") == "9"
+    assert schema.get({"ItemCode": "1"}, "ClubId") is None
+
+
+def test_item_table_behaves_like_items_dict(tmp_path):
+    chain = Shufersal()
+    items = get_items_from_xml(chain, _write_xml(tmp_path, PRICES_XML))
+    assert isinstance(items, ItemTable) and len(items) == 2
+    milk = items.get("7290000000001")
+    milk.final_price = 5.0
+    milk.add_promotion({"content": "מבצע", "discounted_price": 5.0})
+    assert items["7290000000001"].to_dict() == {
+        "name": "חלב 3% 1 ליטר",
+        "price": 6.2,
+        "final_price": 5.0,
+        "price_by_measure": 6.2,
+        "manufacturer": "תנובה",
+        "code": "7290000000001",
+        "promotions": [{"content": "מבצע", "discounted_price": 5.0}],
+    }
+    assert items.get("7290000000002").promotions == []
+    assert list(items.promotions) == [milk.row]
+    items.update([Item("חלב 3% 1 ליטר", 6.5, 6.5, "7290000000001", "תנובה")])
+    assert list(items) == ["7290000000001", "7290000000002"]
+    assert items.get("7290000000001").final_price == 6.5
+    assert items.get("7290000000001").to_dict()["promotions"] == []
+    assert items.get("missing") is None
+
+
+FULL_PROMOS_XML = """<?xml version="1.0" encoding="utf-8"?>
+<root>
+  <Promotions Count="2">
+    <Promotion>
+      <PromotionId>100</PromotionId>
+      <AllowMultipleDiscounts>1</AllowMultipleDiscounts>
+      <PromotionDescription>2 ב-10 חלב</PromotionDescription>
+      <PromotionUpdateDate>2023-01-01 10:00</PromotionUpdateDate>
+      <PromotionStartDate>2023-01-01</PromotionStartDate>
+      <PromotionStartHour>00:00</PromotionStartHour>
+      <PromotionEndDate>2999-01-01</PromotionEndDate>
+      <PromotionEndHour>23:59</PromotionEndHour>
+      <RewardType>10</RewardType>
+      <MinQty>2</MinQty>
+      <MaxQty>0</MaxQty>
+      <DiscountedPrice>10</DiscountedPrice>
+      <PromotionItems Count="1">
+        <Item><ItemCode>7290000000001</ItemCode></Item>
+      </PromotionItems>
+      <Clubs><ClubId>0</ClubId></Clubs>
+    </Promotion>
+    <Promotion>
+      <PromotionId>101</PromotionId>
+      <AllowMultipleDiscounts>0</AllowMultipleDiscounts>
+      <PromotionDescription>לחם ב-5</PromotionDescription>
+      <PromotionUpdateDate>2023-01-01 10:00</PromotionUpdateDate>
+      <PromotionStartDate>2023-01-01</PromotionStartDate>
+      <PromotionStartHour>00:00</PromotionStartHour>
+      <PromotionEndDate>2999-01-01</PromotionEndDate>
+      <PromotionEndHour>23:59</PromotionEndHour>
+      <RewardType>10</RewardType>
+      <MinQty>1</MinQty>
+      <DiscountedPrice>5</DiscountedPrice>
+      <PromotionItems Count="2">
+        <Item><ItemCode>7290000000002</ItemCode></Item>
+        <Item><ItemCode>7290000000001</ItemCode></Item>
+      </PromotionItems>
+      <Clubs><ClubId>0</ClubId></Clubs>
+    </Promotion>
+  </Promotions>
+</root>
+"""
+
+
+def _write_raw_files(tmp_path, chain, store_id: int, files):
+    raw_files = tmp_path / RAW_FILES_DIRNAME
+    raw_files.mkdir(exist_ok=True)
+    for category, content in files.items():
+        xml_path = tmp_path / xml_file_gen(chain, store_id, category.name)
+        xml_path.write_text(content, encoding="utf-8")
+
+
+def test_prices_with_promos_from_local_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chain = Shufersal()
+    _write_raw_files(
+        tmp_path,
+        chain,
+        1,
+        {
+            FileTypesFilters.PRICE_FULL_FILE: PRICES_XML,
+            FileTypesFilters.PROMO_FULL_FILE: FULL_PROMOS_XML,
+        },
+    )
+    items = get_all_prices_with_promos(1, chain, load_promos=True, load_prices=True)
+    milk, bread = items["7290000000001"], items["7290000000002"]
+    assert milk.final_price == 5.0 and bread.final_price == 5.0
+    assert milk.to_dict()["promotions"] == [
+        {"content": "2 ב-10 חלב", "discounted_price": 5.0},
+        {"content": "לחם ב-5", "discounted_price": 5.0},
+    ]
+    assert bread.to_dict()["promotions"] == [
+        {"content": "לחם ב-5", "discounted_price": 5.0}
+    ]
+
+
+def test_parsed_snapshots_are_reused_until_the_xml_changes(tmp_path, monkeypatch):
+    chain = Shufersal()
+    prices_xml_path = _write_xml(tmp_path, PRICES_XML)
+    promos_xml_path = _write_xml(tmp_path, PROMOS_XML, "promos.xml")
+    assert len(get_items_from_xml(chain, prices_xml_path)) == 2
+    assert len(list(iter_promotion_records(chain, promos_xml_path))) == 2
+    assert os.path.isfile(get_snapshot_path(prices_xml_path))
+    assert os.path.isfile(get_snapshot_path(promos_xml_path))
+
+    def fail_parsing(*args):
+        raise AssertionError("The XML file should not be parsed again")
+
+    monkeypatch.setattr(utils, "iter_xml_elements", fail_parsing)
+    assert len(get_items_from_xml(chain, prices_xml_path)) == 2
+    records = list(iter_promotion_records(chain, promos_xml_path))
+    assert [_as_record_tuple(r) for r in records][0] == (
+        "100",
+        "0",
+        "2",
+        ["7290000000001", "7290000000009"],
+    )
+
+    monkeypatch.undo()
+    _write_xml(tmp_path, PRICES_XML.replace("8.50", "9.50"))
+    assert get_items_from_xml(chain, prices_xml_path)["7290000000002"].price == 9.5
+
+
+def test_compressed_price_files_are_streamed(tmp_path):
+    xml_path = tmp_path / "prices.xml"
+    with gzip.open(xml_path, "wb") as f_out:
+        f_out.write(PRICES_XML.encode("utf-8"))
+    items = get_items_from_xml(Shufersal(), str(xml_path))
+    assert list(items) == ["7290000000001", "7290000000002"]
+
+
+def test_store_files_are_fetched_in_one_scraper_pass(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / RAW_FILES_DIRNAME).mkdir()
+    chain = Shufersal()
+    scraped_categories = list()
+
+    def fake_download(store_id, categories, dump_folder):
+        scraped_categories.append(list(categories))
+        os.makedirs(dump_folder)
+        with open(os.path.join(dump_folder, "PriceFull7290027600007-001.xml"), "w") as f_out:
+            f_out.write(PRICES_XML)
+        return dump_folder, {FileTypesFilters.PRICE_FULL_FILE: "PriceFull7290027600007-001.xml"}
+
+    monkeypatch.setattr(chain, "get_download_urls_or_paths", fake_download)
+    items = get_all_prices_with_promos(1, chain, load_promos=True, load_prices=True)
+    assert scraped_categories == [
+        [FileTypesFilters.PRICE_FULL_FILE, FileTypesFilters.PROMO_FULL_FILE]
+    ]
+    assert items["7290000000002"].final_price == 8.5
+    assert os.path.isfile(xml_file_gen(chain, 1, FileTypesFilters.PRICE_FULL_FILE.name))
+    assert not any(name.startswith(".dump_") for name in os.listdir(RAW_FILES_DIRNAME))
+
+    # Files found missing are not looked for again during the same run
+    get_all_prices_with_promos(1, chain, load_promos=True, load_prices=True)
+    assert len(scraped_categories) == 1
+
+
+PRICES_DELTA_XML = """<?xml version="1.0" encoding="utf-8"?>
+<root>
+  <ChainId>7290027600007</ChainId>
+  <Items Count="2">
+    <Item>
+      <PriceUpdateDate>2023-01-01 12:00</PriceUpdateDate>
+      <ItemCode>7290000000001</ItemCode>
+      <ItemName>חלב 3% 1 ליטר</ItemName>
+      <ManufacturerName>תנובה</ManufacturerName>
+      <ItemPrice>5.90</ItemPrice>
+      <UnitOfMeasurePrice>5.90</UnitOfMeasurePrice>
+    </Item>
+    <Item>
+      <PriceUpdateDate>2023-01-01 09:00</PriceUpdateDate>
+      <ItemCode>7290000000002</ItemCode>
+      <ItemName>לחם אחיד</ItemName>
+      <ManufacturerName>ברמן</ManufacturerName>
+      <ItemPrice>1.00</ItemPrice>
+      <UnitOfMeasurePrice>1.33</UnitOfMeasurePrice>
+    </Item>
+  </Items>
+</root>
+"""
+
+
+def test_price_deltas_are_applied_onto_the_saved_full_prices(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chain = Shufersal()
+    _write_raw_files(tmp_path, chain, 1, {FileTypesFilters.PRICE_FULL_FILE: PRICES_XML})
+    delta_name = "Price7290027600007-001-202301011200"
+
+    def fake_download(store_id, categories, dump_folder):
+        assert categories == [FileTypesFilters.PRICE_FILE]
+        os.makedirs(dump_folder)
+        with open(os.path.join(dump_folder, f"{delta_name}.xml"), "w", encoding="utf-8") as f_out:
+            f_out.write(PRICES_DELTA_XML)
+        return dump_folder, {FileTypesFilters.PRICE_FILE: f"{delta_name}.xml"}
+
+    monkeypatch.setattr(chain, "get_download_urls_or_paths", fake_download)
+    items = update_price_state(chain, 1)
+    # The bread's delta price is older than its full price, so it is skipped
+    assert items["7290000000001"].price == 5.9 and items["7290000000002"].price == 8.5
+    state = PriceState.load(get_price_state_path(chain, 1))
+    assert state.applied_deltas == {delta_name}
+    assert state.update_dates["7290000000001"] == "2023-01-01 12:00"
+
+    def fail(*args):
+        raise AssertionError("Nothing should be downloaded or parsed again")
+
+    with monkeypatch.context() as m:
+        m.setattr(chain, "get_download_urls_or_paths", fail)
+        m.setattr("src.price_state.parse_price_updates_from_xml", fail)
+        assert update_price_state(chain, 1)["7290000000001"].price == 5.9
+
+    # A new full prices file replaces the state, and the delta is applied onto it again
+    _write_raw_files(
+        tmp_path,
+        chain,
+        1,
+        {FileTypesFilters.PRICE_FULL_FILE: PRICES_XML.replace("2023-01-01 10:00", "2023-01-02 03:00")},
+    )
+    items = update_price_state(chain, 1)
+    assert items["7290000000001"].price == 6.2 and items["7290000000002"].price == 8.5
+
+
+def test_loaded_price_state_files_are_not_checked_against_the_chain(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chain = Shufersal()
+    _write_raw_files(tmp_path, chain, 1, {FileTypesFilters.PRICE_FULL_FILE: PRICES_XML})
+    delta_name = "Price7290027600007-001-202301011200"
+
+    def fake_download(store_id, categories, dump_folder):
+        os.makedirs(dump_folder)
+        with open(os.path.join(dump_folder, f"{delta_name}.xml"), "w", encoding="utf-8") as f_out:
+            f_out.write(PRICES_DELTA_XML)
+        return dump_folder, {FileTypesFilters.PRICE_FILE: f"{delta_name}.xml"}
+
+    monkeypatch.setattr(chain, "get_download_urls_or_paths", fake_download)
+    update_price_state(chain, 1)
+
+    checks = []
+
+    def fake_latest_file_names(store_id, categories, dump_folder):
+        checks.append(categories)
+        return {FileTypesFilters.PRICE_FILE: f"{delta_name}.xml"}
+
+    # The recorded delta is due for a check, but the files on disk are loaded as they are
+    monkeypatch.setattr("src.download_manifest.LATEST_FILE_CHECK_INTERVAL", -1)
+    monkeypatch.setattr(chain, "get_latest_file_names", fake_latest_file_names)
+    assert update_price_state(chain, 1, load_prices=True)["7290000000002"].price == 8.5
+    assert checks == []
+    update_price_state(chain, 1)
+    assert checks == [[FileTypesFilters.PRICE_FILE]]
+
+
+def test_unchanged_remote_files_are_not_downloaded_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / RAW_FILES_DIRNAME).mkdir()
+    chain = Shufersal()
+    category = FileTypesFilters.PRICE_FULL_FILE
+    yesterday_xml_path = os.path.join(RAW_FILES_DIRNAME, "Shufersal-PriceFull-1-yesterday.xml")
+    with open(yesterday_xml_path, "w", encoding="utf-8") as f_out:
+        f_out.write(PRICES_XML)
+    get_items_from_xml(chain, yesterday_xml_path)
+    manifest_path = get_manifest_path(RAW_FILES_DIRNAME, "Shufersal", 1)
+    save_manifest(
+        manifest_path,
+        {
+            category.name: {
+                "name": "PriceFull7290027600007-001-202301010300",
+                "timestamp": "202301010300",
+                "size": os.path.getsize(yesterday_xml_path),
+                "hash": "",
+                "path": yesterday_xml_path,
+            }
+        },
+    )
+    latest_file_name = "PriceFull7290027600007-001-202301010300.gz"
+    downloads = list()
+
+    def fake_download(store_id, categories, dump_folder):
+        downloads.append(list(categories))
+        os.makedirs(dump_folder)
+        with open(os.path.join(dump_folder, latest_file_name.replace(".gz", ".xml")), "w") as f_out:
+            f_out.write(PRICES_XML.replace("8.50", "9.50"))
+        return dump_folder, {category: latest_file_name.replace(".gz", ".xml")}
+
+    monkeypatch.setattr(chain, "get_latest_file_names", lambda *args: {category: latest_file_name})
+    monkeypatch.setattr(chain, "get_download_urls_or_paths", fake_download)
+
+    # The latest remote file was downloaded yesterday - it is reused together with its snapshot
+    xml_path = xml_file_gen(chain, 1, category.name)
+    utils.download_xml_file(chain, 1, category, xml_path)
+    assert downloads == []
+    assert os.path.isfile(xml_path) and os.path.isfile(get_snapshot_path(xml_path))
+    assert not os.path.exists(yesterday_xml_path)
+    assert load_manifest(manifest_path)[category.name]["path"] == xml_path
+
+    # A newer remote file is downloaded over the local copy
+    latest_file_name = "PriceFull7290027600007-001-202301020300.gz"
+    monkeypatch.setattr(download_manifest, "LATEST_FILE_CHECK_INTERVAL", 0)
+    utils.download_xml_file(chain, 1, category, xml_path)
+    assert downloads == [[category]]
+    entry = load_manifest(manifest_path)[category.name]
+    assert entry["name"] == "PriceFull7290027600007-001-202301020300"
+    assert entry["timestamp"] == "202301020300"
+    assert get_items_from_xml(chain, xml_path)["7290000000002"].price == 9.5
+
+
+def test_recently_checked_files_are_not_listed_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / RAW_FILES_DIRNAME).mkdir()
+    chain = Shufersal()
+    listings = list()
+
+    def fake_listing(store_id, categories, dump_folder):
+        listings.append(list(categories))
+        return {FileTypesFilters.PRICE_FULL_FILE: "PriceFull7290027600007-001-202301010300.gz"}
+
+    def fake_download(store_id, categories, dump_folder):
+        os.makedirs(dump_folder)
+        with open(os.path.join(dump_folder, "PriceFull7290027600007-001-202301010300.xml"), "w") as f_out:
+            f_out.write(PRICES_XML)
+        return dump_folder, {FileTypesFilters.PRICE_FULL_FILE: "PriceFull7290027600007-001-202301010300.xml"}
+
+    monkeypatch.setattr(chain, "get_latest_file_names", fake_listing)
+    monkeypatch.setattr(chain, "get_download_urls_or_paths", fake_download)
+    categories = [FileTypesFilters.PRICE_FULL_FILE, FileTypesFilters.PRICE_FILE]
+    utils.download_xml_files(chain, 1, categories)
+    manifest = load_manifest(get_manifest_path(RAW_FILES_DIRNAME, "Shufersal", 1))
+    assert manifest[FileTypesFilters.PRICE_FILE.name]["name"] is None
+
+    # The check is recorded in the manifest, so another process reuses it - even the unpublished file isn't looked
+    # for again
+    monkeypatch.setattr(chain, "get_download_urls_or_paths", None)
+    utils.download_xml_files(chain, 1, categories)
+    assert listings == []
+
+    # Once the check expires, the recorded file is listed again - unless the existing files are loaded as they are
+    monkeypatch.setattr(download_manifest, "LATEST_FILE_CHECK_INTERVAL", 0)
+    utils.download_xml_files(chain, 1, [FileTypesFilters.PRICE_FULL_FILE], check_latest=False)
+    assert listings == []
+    utils.download_xml_files(chain, 1, [FileTypesFilters.PRICE_FULL_FILE])
+    assert listings == [[FileTypesFilters.PRICE_FULL_FILE]]